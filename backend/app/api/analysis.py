@@ -1,20 +1,25 @@
 # backend/app/api/analysis.py
 import io
-import pandas as pd
 import math # <-- 1. Import math
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends, status
 from fastapi.responses import StreamingResponse
-from typing import List, Dict, Any
+from typing import List, Dict, Any, TYPE_CHECKING
 from app.core.file_validation import validate_upload_file, ALLOWED_EXCEL_TYPES # Import validator
+from app.core.profiling import phase
 from app.services import analysis_service
 
+if TYPE_CHECKING:
+    import pandas as pd  # imported by analysis_service on first use
+
 router = APIRouter()
 
 # Store uploaded file data temporarily (in-memory, replace with better storage if needed)
 # A dictionary mapping a unique identifier (like user ID or session ID) to the DataFrame
-uploaded_data_store: Dict[str, pd.DataFrame] = {}
+uploaded_data_store: Dict[str, "pd.DataFrame"] = {}
 # Simple session identifier for this example (replace with real user/session management)
 CURRENT_SESSION_ID = "user1"
+# Upper bound for the max_points form field of /generate-chart
+MAX_CHART_POINTS = 20000
 
 
 # --- Function to clean non-JSON compliant floats ---
@@ -51,15 +56,17 @@ async def upload_excel_for_analysis(file: UploadFile = File(...)):
         excel_buffer = io.BytesIO(file_content_bytes)
 
         # Use the analysis service to read the data
-        df = analysis_service.read_excel_to_dataframe(excel_buffer)
+        with phase("cpu"):
+            df = analysis_service.read_excel_to_dataframe(excel_buffer)
 
         # Store the DataFrame associated with the session ID
         uploaded_data_store[CURRENT_SESSION_ID] = df
 
         # Prepare preview data (e.g., first 5 rows)
-        preview_data_raw = df.head().to_dict(orient='records')
-        columns = df.columns.tolist()
-        preview_data_cleaned = clean_non_json_floats(preview_data_raw)
+        with phase("serialization"):
+            preview_data_raw = df.head().to_dict(orient='records')
+            columns = df.columns.tolist()
+            preview_data_cleaned = clean_non_json_floats(preview_data_raw)
         return {"columns": columns, "data": preview_data_cleaned}
     except HTTPException as e:
         # Re-raise validation errors
@@ -73,10 +80,17 @@ async def upload_excel_for_analysis(file: UploadFile = File(...)):
 @router.post("/generate-chart")
 async def generate_chart_from_data(
     x_axis_col: str = Form(...),
-    y_axis_col: str = Form(...)
-) -> StreamingResponse:
+    y_axis_col: str = Form(...),
+    chart_type: str = Form("bar"),
+    format: str = Form("png"),
+    aggregate: str = Form("sum"),
+    max_points: int = Form(analysis_service.CHART_MAX_POINTS),
+):
     """
     Generates a chart using the previously uploaded Excel data for the current session.
+    format=png (default, e.g. for exports) renders it on the server; format=vega
+    returns a Vega-Lite spec with the data reduced to at most max_points points,
+    for the frontend to render.
     """
     # Retrieve the stored DataFrame
     df = uploaded_data_store.get(CURRENT_SESSION_ID)
@@ -85,15 +99,32 @@ async def generate_chart_from_data(
 
     if x_axis_col not in df.columns or y_axis_col not in df.columns:
          raise HTTPException(status_code=400, detail=f"Invalid column names: '{x_axis_col}' or '{y_axis_col}' not found.")
+    if chart_type not in ("bar", "line", "scatter"):
+        raise HTTPException(status_code=400, detail="chart_type must be one of: bar, line, scatter")
+    if format not in ("png", "vega"):
+        raise HTTPException(status_code=400, detail="format must be 'png' or 'vega'")
+    if aggregate not in analysis_service.CHART_AGGREGATES:
+        raise HTTPException(status_code=400, detail=f"aggregate must be one of: {', '.join(analysis_service.CHART_AGGREGATES)}")
+    if not 10 <= max_points <= MAX_CHART_POINTS:
+        raise HTTPException(status_code=400, detail=f"max_points must be between 10 and {MAX_CHART_POINTS}")
 
     try:
+        if format == "vega":
+            with phase("cpu"):
+                spec = analysis_service.build_chart_spec(
+                    df, x_axis_col, y_axis_col, chart_type=chart_type, aggregate=aggregate, max_points=max_points
+                )
+            return clean_non_json_floats(spec)
         # Use the analysis service to create the chart
-        chart_buffer = analysis_service.create_chart_from_dataframe(
-            df=df,
-            x_axis_col=x_axis_col,
-            y_axis_col=y_axis_col,
-            chart_type='bar' # Or make this dynamic based on user selection
-        )
+        with phase("cpu"):
+            chart_buffer = analysis_service.create_chart_from_dataframe(
+                df=df,
+                x_axis_col=x_axis_col,
+                y_axis_col=y_axis_col,
+                chart_type=chart_type,
+            )
         return StreamingResponse(chart_buffer, media_type="image/png")
+    except HTTPException:
+        raise  # validation errors from the service
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to generate chart: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to generate chart: {str(e)}")
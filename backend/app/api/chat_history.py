@@ -1,13 +1,20 @@
 # backend/app/api/chat_history.py
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List, Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, Query
+from datetime import datetime
+from typing import Any, Dict, List
 from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.api.auth import require_auth_user
+from app.core.database import get_async_db
+from app.models.chat import ChatConversationDB
+from app.services import chat_search
 
 router = APIRouter()
 
-# In-memory store for now
-_CHAT_STORE: Dict[str, List[Dict[str, str]]] = {}
+# Dialects with INSERT ... ON CONFLICT DO UPDATE
+_UPSERT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
 
 class ChatMessage(BaseModel):
     sender: str   # "user" | "model"
@@ -18,17 +25,29 @@ class ChatConversation(BaseModel):
     title: str
     messages: List[ChatMessage]
 
+    class Config:
+        from_attributes = True
+
 @router.get("/", response_model=List[ChatConversation])
-async def list_chats(user=Depends(require_auth_user)):
+async def list_chats(user=Depends(require_auth_user), db: AsyncSession = Depends(get_async_db)):
     """
-    Protected. Return all chats for this user.
+    Protected. Return all chats for this user, in the order they were first saved.
     """
     uid = user.get("sub")
-    return _CHAT_STORE.get(uid, [])
+    rows = await db.execute(
+        select(ChatConversationDB)
+        .where(ChatConversationDB.user_id == uid)
+        .order_by(ChatConversationDB.created_at)
+    )
+    return rows.scalars().all()
 
 
 @router.post("/", response_model=ChatConversation)
-async def save_chat(conv: ChatConversation, user=Depends(require_auth_user)):
+async def save_chat(
+    conv: ChatConversation,
+    user=Depends(require_auth_user),
+    db: AsyncSession = Depends(get_async_db),
+):
     """
     Protected. Save or upsert a chat convo for this user.
     """
@@ -36,13 +55,47 @@ async def save_chat(conv: ChatConversation, user=Depends(require_auth_user)):
     if not uid:
         raise HTTPException(status_code=400, detail="Missing user subject in token")
 
-    user_chats = _CHAT_STORE.setdefault(uid, [])
-    # upsert by id
-    for idx, existing in enumerate(user_chats):
-        if existing["id"] == conv.id:
-            user_chats[idx] = conv.dict()
-            break
+    await store_conversation(db, uid, conv.id, conv.title, [m.model_dump() for m in conv.messages])
+    return conv
+
+
+async def store_conversation(db: AsyncSession, uid: str, conv_id: str, title: str,
+                             messages: List[Dict[str, Any]]) -> None:
+    """Upsert a conversation and its search row, in one transaction."""
+    insert = _UPSERT_INSERTS.get(db.get_bind().dialect.name)
+    if insert is not None:
+        # One statement, so concurrent first saves of a conversation can't both insert
+        now = datetime.utcnow()
+        stmt = insert(ChatConversationDB).values(
+            user_id=uid, id=conv_id, title=title, messages=messages, created_at=now, updated_at=now
+        )
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[ChatConversationDB.user_id, ChatConversationDB.id],
+            set_={"title": stmt.excluded.title, "messages": stmt.excluded.messages, "updated_at": now},
+        ))
     else:
-        user_chats.append(conv.dict())
+        existing = await db.get(ChatConversationDB, (uid, conv_id))
+        if existing is None:
+            db.add(ChatConversationDB(user_id=uid, id=conv_id, title=title, messages=messages))
+        else:
+            existing.title = title
+            existing.messages = messages
+    await chat_search.index_conversation(db, uid, conv_id, title, messages)
+    await db.commit()
 
-    return conv
+
+@router.get("/search")
+async def search_chats(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    user=Depends(require_auth_user),
+    db: AsyncSession = Depends(get_async_db),
+) -> Dict[str, Any]:
+    """
+    Protected. Search this user's chats by title and message text, best match
+    first. Every word must match (the last one as a prefix); title and
+    snippet are HTML-escaped and mark matches with <mark>...</mark>.
+    """
+    found = await chat_search.search(db, user.get("sub"), q, limit, offset)
+    return {**found, "limit": limit, "offset": offset}
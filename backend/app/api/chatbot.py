@@ -1,25 +1,356 @@
 # backend/app/api/chatbot.py
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel
-from typing import Dict, Any
-from app.api.auth import require_auth_user
-from app.services import ollama_service
+from fastapi import APIRouter, Depends, HTTPException, Request, WebSocket, WebSocketDisconnect, status
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from prometheus_client.core import GaugeMetricFamily
+from typing import Dict, Any, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import time
+from app.api.auth import _verify_jwt, require_auth_user
+from app.api.chat_history import store_conversation
+from app.core.cancellation import (
+    CANCEL_DISCONNECT, CANCEL_STOP, GENERATION_DEADLINE_SECONDS, run_until_disconnect, run_with_deadline,
+)
+from app.core.database import AsyncSessionLocal
+from app.core.metrics import register_stats_source
+from app.models.chat import ChatConversationDB
+from app.services import ollama_service, retrieval_index
 
 router = APIRouter()
 
+# --- WebSocket chat (/api/chatbot/ws) ---
+# Earlier turns sent to the model with each new one
+WS_CHAT_CONTEXT_MESSAGES = int(os.getenv("WS_CHAT_CONTEXT_MESSAGES", "12"))
+WS_CHAT_CONTEXT_CHARS = int(os.getenv("WS_CHAT_CONTEXT_CHARS", "8000"))
+WS_CHAT_MAX_MESSAGE_CHARS = int(os.getenv("WS_CHAT_MAX_MESSAGE_CHARS", "16000"))
+# Connections with no turn running are closed after this long without a message
+WS_CHAT_IDLE_SECONDS = float(os.getenv("WS_CHAT_IDLE_SECONDS", "600"))
+# A client that doesn't read a token frame for this long is disconnected
+WS_CHAT_SEND_TIMEOUT = float(os.getenv("WS_CHAT_SEND_TIMEOUT", "30"))
+# Token chunks buffered for a slow client before generation waits for it
+WS_CHAT_SEND_QUEUE = 256
+# Browsers can't set headers on WebSockets; they offer ["bearer", "<jwt>"] as
+# subprotocols instead, and the server picks "bearer"
+WS_AUTH_SUBPROTOCOL = "bearer"
+
+_open_sessions = 0
+
+
 class ChatbotRequest(BaseModel):
     message: str
-    max_tokens: int = 256
+    max_tokens: int = Field(256, ge=1, le=ollama_service.MAX_GENERATION_TOKENS)
+    # Ground the answer in the user's uploaded documents (/api/documents)
+    use_documents: bool = True
+    top_k: int = retrieval_index.RETRIEVAL_TOP_K
+
+
+async def _ground(user: Dict[str, Any], message: str, use_documents: bool, top_k: int) -> Tuple[str, List[Dict[str, Any]]]:
+    """(prompt with matching document excerpts in front, sources used)."""
+    if not use_documents or not 1 <= top_k <= 20:
+        return message, []
+    try:
+        hits = await run_in_threadpool(retrieval_index.search, user.get("sub"), message, top_k)
+        prompt, sources = retrieval_index.build_grounded_prompt(message, hits)
+    except HTTPException as e:  # embedding backend down: answer without documents
+        logging.warning(f"[RETRIEVAL] search failed, answering ungrounded: {e.detail}")
+        return message, []
+    return prompt, [{k: s[k] for k in ("document_id", "filename", "source", "score")} for s in sources]
+
 
 @router.post("/message")
-async def chatbot_message(req: ChatbotRequest, user=Depends(require_auth_user)) -> Dict[str, Any]:
+async def chatbot_message(req: ChatbotRequest, request: Request, user=Depends(require_auth_user)) -> Dict[str, Any]:
     """
     Protected chatbot endpoint if you have a dedicated Chatbot tab.
     We'll just reuse run_minimax_prompt for logged-in users.
+    Excerpts of the user's documents that match the message are put in
+    front of it; "sources" lists the ones used. Generation stops if the
+    client disconnects.
     """
-    if not req.message.strip():
+    message = req.message.strip()
+    if not message:
         raise HTTPException(status_code=400, detail="Empty message")
 
-    text = ollama_service.run_minimax_prompt(req.message.strip(), req.max_tokens, user=user)
+    prompt, sources = await _ground(user, message, req.use_documents, req.top_k)
+
+    text = await run_until_disconnect(request, ollama_service.arun_minimax_prompt(prompt, req.max_tokens, user=user))
+
+    return {"text": text, "sources": sources}
+
+
+class _ChatSession:
+    """One WebSocket connection: the verified user and the conversation so far."""
+
+    def __init__(self, websocket: WebSocket, user: Dict[str, Any]):
+        self.websocket = websocket
+        self.user = user
+        self.conversation_id: Optional[str] = None
+        self.title: Optional[str] = None
+        self.messages: List[Dict[str, str]] = []  # chat-history format: {"sender": "user"|"model", "text"}
+        self.draft: List[str] = []
+        self.turn: Optional[asyncio.Task] = None
+        self.stalled = False  # stopped reading token frames
+
+    @property
+    def busy(self) -> bool:
+        return self.turn is not None and not self.turn.done()
+
+    def expired(self) -> bool:
+        exp = self.user.get("exp")
+        return bool(exp) and time.time() >= exp
+
+    async def send(self, payload: Dict[str, Any]) -> None:
+        await asyncio.wait_for(self.websocket.send_json(payload), WS_CHAT_SEND_TIMEOUT)
+
+    async def error(self, status_code: int, detail: str) -> None:
+        await self.send({"type": "error", "status_code": status_code, "detail": detail})
+
+    async def fail(self, status_code: int, detail: str) -> None:
+        """End a turn that produced no reply; nothing is saved."""
+        await self.error(status_code, detail)
+        await self.send({"type": "done", "text": "", "sources": [], "failed": True})
+
+    async def open_conversation(self, conversation_id: str, title: Optional[str]) -> None:
+        """Continue a saved conversation (or start one under this id); turns are saved to it."""
+        async with AsyncSessionLocal() as db:
+            conv = await db.get(ChatConversationDB, (self.user.get("sub"), conversation_id))
+        self.conversation_id = conversation_id
+        self.messages = list(conv.messages) if conv is not None else []
+        self.title = title or (conv.title if conv is not None else None)
+
+    def model_messages(self, prompt: str) -> List[Dict[str, str]]:
+        """Recent turns (within the context budget) plus the new prompt, for the model."""
+        budget = WS_CHAT_CONTEXT_CHARS - len(prompt)
+        context: List[Dict[str, str]] = []
+        for m in reversed(self.messages[-WS_CHAT_CONTEXT_MESSAGES:] if WS_CHAT_CONTEXT_MESSAGES > 0 else []):
+            budget -= len(m["text"])
+            if budget < 0:
+                break
+            context.append({"role": "user" if m["sender"] == "user" else "assistant", "content": m["text"]})
+        context.reverse()
+        if context and context[0]["role"] == "assistant":  # chat APIs expect a user turn first
+            context.pop(0)
+        return [*context, {"role": "user", "content": prompt}]
+
+    async def save(self) -> None:
+        if self.conversation_id is None:
+            return
+        title = self.title or self.messages[0]["text"][:60]
+        async with AsyncSessionLocal() as db:
+            await store_conversation(db, self.user.get("sub"), self.conversation_id, title, self.messages)
+
+    async def run_turn(self, message: str, max_tokens: int, use_documents: bool, top_k: int) -> None:
+        """
+        Generate a reply, streaming {"type": "token"} frames, then "done"
+        (or "cancelled" with the partial text after a cancel message; if the
+        turn fails, "error" followed by "done" with failed=true).
+        Chunks queue up while the client reads slowly; frames carry everything
+        queued so far, and when the queue is full generation waits.
+        """
+        prompt, sources = await _ground(self.user, message, use_documents, top_k)
+        history = self.model_messages(prompt)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=WS_CHAT_SEND_QUEUE)
+        parts: List[str] = []
+
+        async def produce():
+            async for delta in ollama_service.astream_minimax_chat(history, max_tokens):
+                parts.append(delta)
+                await queue.put(delta)
+
+        turn = asyncio.current_task()
+
+        async def deliver():
+            finished = False
+            try:
+                while not finished:
+                    chunk = [await queue.get()]
+                    while not queue.empty():
+                        chunk.append(queue.get_nowait())
+                    if chunk[-1] is None:
+                        finished = True
+                        chunk.pop()
+                    if chunk:
+                        await self.send({"type": "token", "text": "".join(chunk)})
+            except asyncio.TimeoutError:
+                self.stalled = True
+                turn.cancel(CANCEL_DISCONNECT)
+
+        sender = asyncio.create_task(deliver())
+        sender.add_done_callback(lambda t: t.cancelled() or t.exception())  # errors surface via the receive loop
+        try:
+            await run_with_deadline(produce(), GENERATION_DEADLINE_SECONDS)
+            await queue.put(None)
+            await sender
+        except asyncio.CancelledError as e:
+            sender.cancel()
+            if self.stalled:
+                logging.info("[CHAT WS] client stopped reading, closing the connection")
+                await self.websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Client too slow")
+            elif e.args[:1] == (CANCEL_STOP,):  # the user pressed stop: keep what was said so far
+                partial = "".join(parts).strip()
+                self.messages.append({"sender": "user", "text": message})
+                if partial:
+                    self.messages.append({"sender": "model", "text": partial})
+                await self.save()
+                await self.send({"type": "cancelled", "text": partial})
+            raise
+        except HTTPException as e:
+            sender.cancel()
+            await self.fail(e.status_code, e.detail)
+            return
+        except Exception as e:
+            sender.cancel()
+            logging.error(f"❌ [CHAT WS] reply failed: {e}")
+            await self.fail(500, "Generating the reply failed")
+            return
+
+        text = "".join(parts).strip()
+        self.messages.append({"sender": "user", "text": message})
+        self.messages.append({"sender": "model", "text": text})
+        await self.save()
+        await self.send({"type": "done", "text": text, "sources": sources})
+
+
+def _ws_token(websocket: WebSocket) -> Tuple[Optional[str], Optional[str]]:
+    """
+    (token, subprotocol to accept) from "Authorization: Bearer" or the
+    Sec-WebSocket-Protocol pair ["bearer", "<jwt>"]. Never from the query
+    string, which ends up in access logs.
+    """
+    header = websocket.headers.get("authorization", "")
+    if header.lower().startswith("bearer "):
+        return header[7:], None
+    offered = [p.strip() for p in websocket.headers.get("sec-websocket-protocol", "").split(",")]
+    if WS_AUTH_SUBPROTOCOL in offered:
+        position = offered.index(WS_AUTH_SUBPROTOCOL)
+        if position + 1 < len(offered) and offered[position + 1]:
+            return offered[position + 1], WS_AUTH_SUBPROTOCOL
+    return None, None
+
+
+def _ws_user(token: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not token:
+        return None
+    try:
+        return _verify_jwt(token)
+    except Exception as e:
+        logging.warning(f"Auth error: {e}")
+        return None
+
+
+@router.websocket("/ws")
+async def chatbot_ws(websocket: WebSocket):
+    """
+    Protected. Chat over one WebSocket: the token is verified once and the
+    conversation is kept server-side, so each turn only sends the new text.
+    Client frames (JSON):
+      {"type": "start", "conversation_id", "title"?}  continue / save to a chat-history conversation
+      {"type": "input", "text"}                       stream a message in pieces
+      {"type": "message", "text"?, "max_tokens"?, "use_documents"?, "top_k"?}
+      {"type": "cancel"}                              stop the reply being generated
+      {"type": "ping"}
+    Server frames: ready, session, token, done, cancelled, error, pong.
+    Browsers authenticate with new WebSocket(url, ["bearer", token]).
+    """
+    global _open_sessions
+    token, subprotocol = _ws_token(websocket)
+    user = _ws_user(token)
+    if not user:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Authentication required")
+        return
+    await websocket.accept(subprotocol=subprotocol)
+    session = _ChatSession(websocket, user)
+    _open_sessions += 1
+    try:
+        await session.send({"type": "ready"})
+        while True:
+            try:
+                frame = await asyncio.wait_for(
+                    websocket.receive_json(), None if session.busy else WS_CHAT_IDLE_SECONDS
+                )
+            except asyncio.TimeoutError:
+                await websocket.close(code=status.WS_1000_NORMAL_CLOSURE, reason="Idle")
+                break
+            except (ValueError, KeyError):  # not JSON, or a binary frame
+                await session.error(400, "Frames must be JSON objects")
+                continue
+            if not isinstance(frame, dict):
+                await session.error(400, "Frames must be JSON objects")
+                continue
+            if session.expired():
+                await session.error(401, "Token expired, reconnect with a new one")
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Token expired")
+                break
+            await _handle_frame(session, frame)
+    except (WebSocketDisconnect, asyncio.TimeoutError):
+        pass  # gone, or stopped reading our frames
+    finally:
+        _open_sessions -= 1
+        if session.busy:
+            session.turn.cancel(CANCEL_DISCONNECT)
+
+
+async def _handle_frame(session: _ChatSession, frame: Dict[str, Any]) -> None:
+    kind = frame.get("type")
+    if kind == "ping":
+        await session.send({"type": "pong"})
+    elif kind == "cancel":
+        if session.busy:
+            session.turn.cancel(CANCEL_STOP)
+    elif session.busy:
+        await session.error(409, "A reply is still being generated; send cancel first")
+    elif kind == "start":
+        conversation_id = str(frame.get("conversation_id") or "").strip()
+        if not conversation_id or len(conversation_id) > 64:
+            await session.error(400, "conversation_id is required (at most 64 characters)")
+            return
+        await session.open_conversation(conversation_id, frame.get("title"))
+        await session.send({"type": "session", "conversation_id": session.conversation_id,
+                            "title": session.title, "messages": len(session.messages)})
+    elif kind in ("input", "message"):
+        text = frame.get("text") or ""
+        if not isinstance(text, str):
+            await session.error(400, "text must be a string")
+            return
+        if sum(map(len, session.draft)) + len(text) > WS_CHAT_MAX_MESSAGE_CHARS:
+            session.draft.clear()
+            await session.error(413, f"Messages are limited to {WS_CHAT_MAX_MESSAGE_CHARS} characters")
+            return
+        session.draft.append(text)
+        if kind == "input":
+            return
+        message = "".join(session.draft).strip()
+        session.draft.clear()
+        if not message:
+            await session.error(400, "Empty message")
+            return
+        try:
+            max_tokens = int(frame.get("max_tokens") or 256)
+            top_k = int(frame.get("top_k") or retrieval_index.RETRIEVAL_TOP_K)
+        except (TypeError, ValueError):
+            await session.error(400, "max_tokens and top_k must be integers")
+            return
+        if not 1 <= max_tokens <= ollama_service.MAX_GENERATION_TOKENS:
+            await session.error(400, f"max_tokens must be between 1 and {ollama_service.MAX_GENERATION_TOKENS}")
+            return
+        session.turn = asyncio.create_task(
+            session.run_turn(message, max_tokens, bool(frame.get("use_documents", True)), top_k)
+        )
+        session.turn.add_done_callback(_turn_done)
+    else:
+        await session.error(400, f"Unknown frame type '{kind}'")
+
+
+def _turn_done(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logging.error(f"❌ [CHAT WS] turn failed: {task.exception()}")
+
+
+def _session_stats():
+    sessions = GaugeMetricFamily("chat_ws_sessions", "Open WebSocket chat connections (this worker)")
+    sessions.add_metric([], _open_sessions)
+    yield sessions
+
 
-    return {"text": text}
+register_stats_source(_session_stats)
@@ -0,0 +1,94 @@
+# backend/app/api/debug.py
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+from typing import Any, Dict, List, Optional
+import hmac
+
+from app.core import profiling, startup
+from app.services.semantic_cache import cache as semantic_cache
+
+router = APIRouter()
+
+
+class ProfilingSettings(BaseModel):
+    sample_rate: Optional[float] = None
+    slow_request_seconds: Optional[float] = None
+
+
+async def require_profile_admin(x_profile_token: Optional[str] = Header(None)) -> None:
+    """
+    Debug endpoints need X-Profile-Token: <PROFILE_ADMIN_TOKEN>.
+    Without a configured token they don't exist.
+    """
+    if not profiling.PROFILE_ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_profile_token or not hmac.compare_digest(x_profile_token, profiling.PROFILE_ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid profile token")
+
+
+@router.get("/profiles")
+async def list_profiles(limit: int = 50, _admin=Depends(require_profile_admin)) -> List[Dict[str, Any]]:
+    """
+    Admin. Stored request profiles, newest first (phases, duration, reason; no stacks).
+    """
+    return await run_in_threadpool(profiling.list_profiles, max(1, min(limit, profiling.PROFILE_MAX_STORED)))
+
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, format: str = "json", _admin=Depends(require_profile_admin)):
+    """
+    Admin. One profile. format=collapsed returns the stacks in collapsed
+    form ("a;b;c 12" per line) for flamegraph.pl / speedscope.
+    """
+    if not profile_id.isalnum():
+        raise HTTPException(status_code=400, detail="Invalid profile id")
+    record = await run_in_threadpool(profiling.get_profile, profile_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "collapsed":
+        return PlainTextResponse(profiling.collapsed(record))
+    return record
+
+
+@router.get("/profiling/settings")
+async def get_profiling_settings(_admin=Depends(require_profile_admin)) -> Dict[str, float]:
+    """
+    Admin. Current sample rate and slow-request threshold.
+    """
+    return profiling.get_settings()
+
+
+@router.put("/profiling/settings")
+async def update_profiling_settings(
+    req: ProfilingSettings, _admin=Depends(require_profile_admin)
+) -> Dict[str, float]:
+    """
+    Admin. Change sampling at runtime; all workers pick it up within a second.
+    slow_request_seconds <= 0 turns slow-request capture off.
+    """
+    if req.sample_rate is not None and not 0 <= req.sample_rate <= 1:
+        raise HTTPException(status_code=400, detail="sample_rate must be between 0 and 1")
+    return await run_in_threadpool(
+        profiling.update_settings,
+        sample_rate=req.sample_rate,
+        slow_request_seconds=req.slow_request_seconds,
+    )
+
+
+@router.get("/startup")
+async def startup_report(top: int = 30, _admin=Depends(require_profile_admin)) -> Dict[str, Any]:
+    """
+    Admin. This worker's startup timings: lifespan steps, imports per module, warm-up.
+    """
+    return startup.report(top)
+
+
+@router.get("/semantic-cache")
+async def semantic_cache_audits(_admin=Depends(require_profile_admin)) -> Dict[str, Any]:
+    """
+    Admin. Semantic cache stats of this worker including the recent audits
+    (user prompts next to the cached prompt they were matched with).
+    """
+    return semantic_cache.snapshot(include_audits=True)
@@ -0,0 +1,95 @@
+# backend/app/api/documents.py
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from pydantic import BaseModel
+from typing import Any, Dict, List
+import os
+import shutil
+import uuid
+
+from app.api.auth import require_auth_user
+from app.core.database import get_db
+from app.services import document_parser, job_service, retrieval_index
+
+router = APIRouter()
+
+
+class SearchRequest(BaseModel):
+    query: str
+    k: int = retrieval_index.RETRIEVAL_TOP_K
+
+
+@router.post("/", status_code=202)
+async def upload_document(
+    file: UploadFile = File(...),
+    user=Depends(require_auth_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Protected. Queue a job that parses, chunks and embeds a document into
+    the caller's retrieval index (used by /api/chatbot/message).
+    Poll /api/training/jobs/{job_id} for progress.
+    """
+    ext = os.path.splitext(file.filename or "")[1].lower()
+    if ext not in document_parser.PARSED_EXTENSIONS:
+        raise HTTPException(
+            status_code=415,
+            detail=f"Unsupported document type '{ext}'. Allowed: {', '.join(sorted(document_parser.PARSED_EXTENSIONS))}",
+        )
+    document_id = uuid.uuid4().hex
+    upload_dir = os.path.join(retrieval_index.user_dir(user.get("sub")), "uploads")
+    file_path = os.path.join(upload_dir, f"{document_id}{ext}")
+
+    def _save():
+        os.makedirs(upload_dir, exist_ok=True)
+        with open(file_path, "wb") as out:
+            shutil.copyfileobj(file.file, out)
+
+    await run_in_threadpool(_save)
+    try:
+        job = await run_in_threadpool(
+            job_service.submit_job,
+            db,
+            user_id=user.get("sub"),
+            kind="index_document",
+            params={"file_path": file_path, "filename": os.path.basename(file.filename), "document_id": document_id},
+        )
+    except HTTPException:
+        os.remove(file_path)  # not queued, nobody will read it
+        raise
+    return {"status": job.status, "job_id": job.id, "document_id": document_id, "filename": file.filename}
+
+
+@router.get("/")
+async def list_documents(user=Depends(require_auth_user)) -> Dict[str, Any]:
+    """
+    Protected. The caller's indexed documents and index size.
+    """
+    return await run_in_threadpool(retrieval_index.list_documents, user.get("sub"))
+
+
+@router.delete("/{document_id}")
+async def delete_document(document_id: str, user=Depends(require_auth_user)) -> Dict[str, Any]:
+    """
+    Protected. Remove a document from the caller's index.
+    """
+    try:
+        removed = await run_in_threadpool(retrieval_index.delete_document, user.get("sub"), document_id)
+    except retrieval_index.IndexBusy:
+        raise HTTPException(status_code=409, detail="A document is being indexed, try again when it is done")
+    if not removed:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {"deleted": document_id}
+
+
+@router.post("/search")
+async def search_documents(req: SearchRequest, user=Depends(require_auth_user)) -> List[Dict[str, Any]]:
+    """
+    Protected. Top-k chunks of the caller's documents for a query.
+    """
+    if not req.query.strip():
+        raise HTTPException(status_code=400, detail="Empty query")
+    if not 1 <= req.k <= 50:
+        raise HTTPException(status_code=400, detail="k must be between 1 and 50")
+    return await run_in_threadpool(retrieval_index.search, user.get("sub"), req.query.strip(), req.k)
@@ -1,24 +1,36 @@
 # backend/app/api/loras.py
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Request
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
 import os
 import shutil
-from typing import List
+import time
+from typing import Any, Dict, List
 from app.api.auth import require_auth_user
+from app.core.cancellation import run_until_disconnect
+from app.services import lora_variants, ollama_service
 
 router = APIRouter()
 
-LORA_DIR = "/code/loras"
-os.makedirs(LORA_DIR, exist_ok=True)
+LORA_DIR = "/code/loras"  # created at startup (app.main lifespan)
+
+
+class LoraPromptRequest(BaseModel):
+    base_model: str
+    adapter: str  # file or trained adapter directory in LORA_DIR
+    prompt_text: str
+    max_tokens: int = Field(256, ge=1, le=ollama_service.MAX_GENERATION_TOKENS)
+
 
 @router.get("/", response_model=List[str])
 async def list_loras(user=Depends(require_auth_user)):
     """
-    Protected. List LoRA adapter files we've uploaded.
+    Protected. List LoRA adapters: uploaded files and trained adapter directories.
     """
     files = []
     for name in os.listdir(LORA_DIR):
         full = os.path.join(LORA_DIR, name)
-        if os.path.isfile(full):
+        if os.path.isfile(full) or (os.path.isdir(full) and not name.startswith(".")):
             files.append(name)
     return files
 
@@ -33,3 +45,42 @@ async def upload_lora(file: UploadFile = File(...), user=Depends(require_auth_us
         shutil.copyfileobj(file.file, out)
 
     return {"status": "ok", "filename": file.filename}
+
+
+@router.post("/prompt")
+async def run_lora_prompt(req: LoraPromptRequest, request: Request, user=Depends(require_auth_user)) -> Dict[str, Any]:
+    """
+    Protected. Run a prompt on base_model with a LoRA adapter applied.
+    The first call for a pair creates the variant model in Ollama
+    ("materialized": true); later calls reuse it.
+    """
+    if not req.prompt_text.strip():
+        raise HTTPException(status_code=400, detail="Prompt cannot be empty.")
+    prompt = req.prompt_text.strip()
+    for attempt in range(2):
+        started = time.perf_counter()
+        model, created = await lora_variants.get_variant(req.base_model, req.adapter)
+        materialize_seconds = time.perf_counter() - started
+        try:
+            text = await run_until_disconnect(request, ollama_service.arun_ollama_generate(prompt, model, req.max_tokens))
+            break
+        except HTTPException as e:
+            if e.status_code != 404 or attempt:
+                raise
+            # Ollama lost the variant (e.g. its volume was reset): build it again once
+            await run_in_threadpool(lora_variants.forget, model)
+    return {
+        "text": text,
+        "model": model,
+        "materialized": created,
+        "materialize_seconds": round(materialize_seconds, 3),
+    }
+
+
+@router.get("/variants")
+async def list_lora_variants(user=Depends(require_auth_user)) -> Dict[str, Any]:
+    """
+    Protected. Adapter variants currently kept in Ollama, most recently used first.
+    """
+    variants = await run_in_threadpool(lora_variants.list_variants)
+    return {"max": lora_variants.LORA_VARIANT_MAX, "variants": variants}
@@ -1,10 +1,18 @@
 # backend/app/api/models.py
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel
-from typing import List, Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Dict, Any, Optional
+import json
+import time
+import uuid
 
 from app.api.auth import get_current_user, require_auth_user
-from app.services import ollama_service
+from app.core.cancellation import request_timeout, run_until_disconnect
+from app.core.metrics import track_first_chunk
+from app.core.profiling import phase
+from app.services import ollama_service, prompt_batch
+from app.services.semantic_cache import cache as semantic_cache
 
 router = APIRouter()
 
@@ -13,7 +21,30 @@ router = APIRouter()
 # ------------------------------
 class PromptRequest(BaseModel):
     prompt_text: str
-    max_tokens: int = 256
+    max_tokens: int = Field(256, ge=1, le=ollama_service.MAX_GENERATION_TOKENS)
+
+
+class BatchPromptItem(BaseModel):
+    id: Optional[str] = None  # defaults to the item's position
+    prompt_text: str
+    max_tokens: int = Field(256, ge=1, le=ollama_service.MAX_GENERATION_TOKENS)
+    model: Optional[str] = None  # defaults to granite
+    host: Optional[str] = None  # URL or index into OLLAMA_HOSTS; default: least busy
+    options: Dict[str, Any] = {}  # extra Ollama options, only ollama_service.CALLER_OPTIONS
+
+    @field_validator("options")
+    @classmethod
+    def _known_options(cls, options: Dict[str, Any]) -> Dict[str, Any]:
+        unknown = sorted(set(options) - set(ollama_service.CALLER_OPTIONS))
+        if unknown:
+            raise ValueError(f"unsupported options {unknown}; allowed: {', '.join(ollama_service.CALLER_OPTIONS)}")
+        return options
+
+
+class BatchPromptRequest(BaseModel):
+    items: List[BatchPromptItem]
+    batch_id: Optional[str] = None  # resume an earlier batch
+    concurrency: int = prompt_batch.PROMPT_BATCH_CONCURRENCY
 
 # ------------------------------
 # Routes
@@ -28,28 +59,95 @@ async def list_models():
     return ollama_service.list_local_models()
 
 
+@router.get("/cache/stats")
+async def semantic_cache_stats(user=Depends(require_auth_user)) -> Dict[str, Any]:
+    """
+    Protected. Hit rate, size and audit counts of the public prompt cache.
+    The audited prompts themselves are only at /api/debug/semantic-cache (admin).
+    """
+    return semantic_cache.snapshot()
+
+
 @router.post("/prompt")
-async def run_prompt(req: PromptRequest, user=Depends(get_current_user)):
+async def run_prompt(req: PromptRequest, request: Request, user=Depends(get_current_user)):
     """
     Chat endpoint for Model Hub:
     - anonymous  -> granite4 (Ollama)
     - logged in  -> MiniMax M2
     Returns {"text": "..."} single-shot response.
+    Generation stops if the client disconnects (499) or the deadline passes (504).
     """
     if not req.prompt_text.strip():
         raise HTTPException(status_code=400, detail="Prompt cannot be empty.")
 
-    text = ollama_service.run_chat(
+    text = await run_until_disconnect(request, ollama_service.arun_chat(
         prompt_text=req.prompt_text.strip(),
         max_tokens=req.max_tokens,
         user=user,
-    )
+    ))
+
+    with phase("cpu"):
+        cleaned = _dedupe_leading_words(text)
 
-    # 🔧 Fix duplicate word bug:
-    # Some models sometimes echo like "Hello Hello" at the start.
-    # We'll do a light dedupe of immediate word pairs at the beginning.
-    # Only first ~20 tokens so we don't destroy legit repetition mid-sentence.
-    import re
+    return {"text": cleaned}
+
+
+@router.post("/prompt/batch")
+async def run_prompt_batch(req: BatchPromptRequest, request: Request, user=Depends(require_auth_user)):
+    """
+    Protected. Run up to PROMPT_BATCH_MAX_ITEMS prompts on Ollama with bounded
+    parallelism. Streams NDJSON, one line per item as it finishes:
+    {"id", "status": "ok"|"error", "text" | "error", ...}, then a summary
+    line {"done": true, "batch_id", "ok", "failed", "resumed"}.
+    Send the same batch_id again to resume: items that already succeeded
+    are replayed, only the rest run. X-Request-Timeout applies per item.
+    """
+    if not req.items:
+        raise HTTPException(status_code=400, detail="No prompts in batch")
+    if len(req.items) > prompt_batch.PROMPT_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {prompt_batch.PROMPT_BATCH_MAX_ITEMS} prompts per batch")
+    batch_id = req.batch_id or uuid.uuid4().hex
+    if not prompt_batch.valid_batch_id(batch_id):
+        raise HTTPException(status_code=400, detail="batch_id may only contain letters, digits, '_', '-' and '.'")
+    items = []
+    for index, item in enumerate(req.items):
+        if not item.prompt_text.strip():
+            raise HTTPException(status_code=400, detail=f"Prompt {index} is empty")
+        items.append({
+            "id": item.id if item.id is not None else str(index),
+            "prompt_text": item.prompt_text.strip(),
+            "max_tokens": item.max_tokens,
+            "model": item.model or ollama_service.GRANITE_MODEL,
+            "host": ollama_service.resolve_ollama_host(item.host) if item.host is not None else None,
+            "options": item.options,
+        })
+    if len({item["id"] for item in items}) != len(items):
+        raise HTTPException(status_code=400, detail="Item ids must be unique within a batch")
+    timeout = request_timeout(request)
+    started = time.perf_counter()
+
+    async def result_stream():
+        counts = {"ok": 0, "failed": 0, "resumed": 0}
+        results = prompt_batch.iter_batch(user.get("sub"), batch_id, items, req.concurrency, timeout)
+        async for result in track_first_chunk(results, "prompt_batch", started):
+            if result["status"] == "ok":
+                result["text"] = _dedupe_leading_words(result["text"])
+                counts["resumed" if result["resumed"] else "ok"] += 1
+            else:
+                counts["failed"] += 1
+            yield json.dumps(result) + "\n"
+        yield json.dumps({"done": True, "batch_id": batch_id, **counts,
+                          "seconds": round(time.perf_counter() - started, 3)}) + "\n"
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson",
+                             headers={"X-Batch-Id": batch_id})
+
+
+# 🔧 Fix duplicate word bug:
+# Some models sometimes echo like "Hello Hello" at the start.
+# We'll do a light dedupe of immediate word pairs at the beginning.
+# Only first ~20 tokens so we don't destroy legit repetition mid-sentence.
+def _dedupe_leading_words(text: str) -> str:
     tokens = text.split()
     cleaned_tokens = []
     i = 0
@@ -63,6 +161,4 @@ async def run_prompt(req: PromptRequest, user=Depends(get_current_user)):
         if len(cleaned_tokens) > 20:  # stop aggressive dedupe after 20 words
             cleaned_tokens.extend(tokens[i:])
             break
-    cleaned = " ".join(cleaned_tokens)
-
-    return {"text": cleaned}
+    return " ".join(cleaned_tokens)
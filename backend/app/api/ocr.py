@@ -1,40 +1,104 @@
 # backend/app/api/ocr.py
 from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
-from typing import Dict, Any
-import tempfile
-import os
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Dict, Any, List, Optional, Tuple
+import json
 import logging
+import time
 from app.api.auth import require_auth_user
-from app.services import ollama_service
+from app.core.metrics import track_first_chunk
+from app.services import ocr_service
+from app.services.ocr_cache import cache as ocr_result_cache
 
 router = APIRouter()
 
+
+def _check_mode(mode: str):
+    if mode not in ocr_service.OCR_PROMPTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"mode must be one of: {', '.join(ocr_service.OCR_PROMPTS)}",
+        )
+
+
+async def _read_image(upload: UploadFile) -> bytes:
+    """Read an upload into memory, refusing anything over MAX_IMAGE_BYTES."""
+    data = await upload.read(ocr_service.MAX_IMAGE_BYTES + 1)
+    await upload.close()
+    if len(data) > ocr_service.MAX_IMAGE_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"{upload.filename} exceeds {ocr_service.MAX_IMAGE_BYTES // (1024 * 1024)} MB",
+        )
+    if not data:
+        raise HTTPException(status_code=400, detail=f"{upload.filename} is empty")
+    return data
+
+
 @router.post("/")
+@router.post("/process-image")
 async def run_ocr_endpoint(
-    image: UploadFile = File(...),
+    image: Optional[UploadFile] = File(None),
+    file: Optional[UploadFile] = File(None),
     mode: str = "describe",
     user = Depends(require_auth_user)
 ) -> Dict[str, Any]:
     """
-    Protected. OCR / Vision description endpoint.
-    We call ollama_service.run_ocr(...) if you have it, else just placeholder.
+    Protected. OCR / Vision description endpoint for a single image
+    ("image" or "file" form field). The image is processed in memory,
+    downscaled to the vision model's input size.
     """
+    upload = image or file
+    if upload is None:
+        raise HTTPException(status_code=400, detail="No image uploaded")
+    _check_mode(mode)
+    data = await _read_image(upload)
     try:
-        # write the image to tmp and pass path to service
-        with tempfile.NamedTemporaryFile(delete=False) as tmp:
-            tmp.write(await image.read())
-            tmp_path = tmp.name
-
-        # If you kept your old ollama_service.run_ocr() function, call it:
-        if hasattr(ollama_service, "run_ocr"):
-            result_text = ollama_service.run_ocr.__wrapped__(tmp_path, mode) \
-                if hasattr(ollama_service.run_ocr, "__wrapped__") else \
-                ollama_service.run_ocr(tmp_path, mode)
-        else:
-            result_text = "[OCR placeholder: Vision model not integrated]"
-
-        os.unlink(tmp_path)
-        return {"text": result_text}
+        result = await ocr_service.run_ocr_async(data, mode, user_id=user.get("sub") or "")
+    except ValueError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         logging.exception("OCR failed")
         raise HTTPException(status_code=500, detail=str(e))
+    return {"text": result["text"], "extracted_text": result["text"], "mode": mode, "cached": result["cached"]}
+
+
+@router.post("/batch")
+async def run_ocr_batch_endpoint(
+    images: List[UploadFile] = File(...),
+    mode: str = "ocr",
+    user = Depends(require_auth_user)
+):
+    """
+    Protected. OCR / describe up to MAX_BATCH_IMAGES images at once.
+    Streams NDJSON, one line per image as it finishes:
+    {"index", "filename", "status": "ok"|"error", "text" | "error", ...}
+    """
+    _check_mode(mode)
+    if not images:
+        raise HTTPException(status_code=400, detail="No images uploaded")
+    if len(images) > ocr_service.MAX_BATCH_IMAGES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {ocr_service.MAX_BATCH_IMAGES} images per batch",
+        )
+    batch: List[Tuple[str, bytes]] = [(upload.filename, await _read_image(upload)) for upload in images]
+    started = time.perf_counter()
+
+    async def result_stream():
+        results = ocr_service.iter_batch_results(batch, mode, user_id=user.get("sub") or "")
+        async for result in track_first_chunk(results, "ocr_batch", started):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+
+@router.get("/cache/stats")
+async def ocr_cache_stats(user = Depends(require_auth_user)) -> Dict[str, Any]:
+    """
+    Protected. Hit/miss counters and size of the OCR result cache.
+    """
+    return await run_in_threadpool(ocr_result_cache.snapshot)
@@ -1,53 +1,450 @@
 # backend/app/api/training.py
 from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
-from typing import List
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from pydantic import BaseModel, Field, ValidationError
+from typing import List, Dict, Any, Optional
+import asyncio
+import json
 import os
 import shutil
 import logging
+import uuid
 
 from app.api.auth import require_auth_user
-from app.services import ollama_service
+from app.core.database import SessionLocal, get_db
+from app.models.job import TrainingJob, FINISHED_JOB_STATES
+from app.services.lora_config import LoraTrainingConfig, resolve_base_model
+from app.services import (
+    ollama_service, job_service, training_service, sql_data_generator, document_parser, lora_variants, sql_eval,
+)
 
 router = APIRouter()
 
-UPLOAD_DIR = "/code/training_uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+UPLOAD_DIR = "/code/training_uploads"  # created at startup (app.main lifespan)
 
-@router.post("/start")
+# Seconds between job polls while streaming progress
+JOB_POLL_INTERVAL = 1.0
+# Upper bounds for synthetic SQL data (JSON responses are built in memory)
+MAX_SQL_EXAMPLES = 1_000_000
+MAX_SQL_EXAMPLES_JSON = 10_000
+# Documents are parsed by the job (document_parser); JSON/JSONL are records already
+TRAINING_FILE_EXTENSIONS = document_parser.PARSED_EXTENSIONS | {".json", ".jsonl"}
+
+class CreateSqlModelRequest(BaseModel):
+    base_model: str
+    custom_model_name: str
+    # Either pass the pairs, or a schema to generate them server-side
+    qa_data: Optional[List[Dict[str, str]]] = None
+    schema_: Optional[Dict[str, Any]] = Field(default=None, alias="schema")
+    num_examples: int = 200
+    seed: int = 0
+    # Few-shot context limits (see modelfile_builder.iter_messages)
+    max_examples: Optional[int] = None
+    token_budget: Optional[int] = None
+    sample_examples: bool = False
+    ollama_host: Optional[str] = None
+    # "model" builds an Ollama model from few-shot examples,
+    # "adapter" trains a LoRA adapter on the pairs instead
+    target: str = "model"
+    lora_config: Optional[Dict[str, Any]] = None
+    # Share of pairs kept out of training for /evaluate-sql (same schema + seed); 0 trains on all
+    holdout_fraction: float = sql_data_generator.DEFAULT_HOLDOUT_FRACTION
+
+
+class EvalCandidate(BaseModel):
+    model: str
+    # LoRA adapter in the adapters directory, applied on top of model
+    adapter: Optional[str] = None
+    host: Optional[str] = None
+
+
+class EvaluateSqlRequest(BaseModel):
+    schema_: Dict[str, Any] = Field(alias="schema")
+    candidates: List[EvalCandidate]
+    # Evaluation pairs; without them, the held-out split of pairs generated
+    # like /create-sql-model does (same num_examples, seed and holdout_fraction)
+    qa_data: Optional[List[Dict[str, str]]] = None
+    num_examples: int = 200
+    seed: int = 0
+    holdout_fraction: float = sql_data_generator.DEFAULT_HOLDOUT_FRACTION
+    max_pairs: int = 200
+    concurrency: int = 4
+    max_tokens: int = 128
+    # Put the schema in every prompt; turn off for models that have it built in
+    include_schema: bool = True
+
+
+def _parse_lora_config(raw: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not raw:
+        return None
+    try:
+        parsed = json.loads(raw)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="lora_config must be valid JSON")
+    if not isinstance(parsed, dict):
+        raise HTTPException(status_code=400, detail="lora_config must be a JSON object")
+    return _validate_lora_config(parsed)
+
+
+def _validate_model_name(name: str) -> None:
+    """400 unless the name is safe as a directory under LORA_DIR (no paths, no "."/"..")."""
+    if not training_service.MODEL_NAME_PATTERN.match(name or ""):
+        raise HTTPException(
+            status_code=400,
+            detail="Model name must be 1-64 letters, digits, '.', '_' or '-', starting with a letter or digit",
+        )
+
+
+def _validate_trainable_base(base_model: str) -> None:
+    """400 for base models without a configured trainable checkpoint (LORA_BASE_MODELS)."""
+    try:
+        resolve_base_model(base_model)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _validate_lora_config(config: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """400 for settings LoraTrainingConfig doesn't accept, instead of a failed job later."""
+    if not config:
+        return None
+    try:
+        LoraTrainingConfig(**config)
+    except ValidationError as e:
+        problems = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+        raise HTTPException(status_code=400, detail=f"Invalid lora_config: {problems}")
+    return config
+
+
+@router.post("/start", status_code=202)
 async def start_training_adapter(
     base_model: str = Form(...),
     new_model_name: str = Form(...),
     training_file: UploadFile = File(...),
+    job_type: str = Form("train_adapter"),
+    ollama_host: Optional[str] = Form(None),
+    lora_config: Optional[str] = Form(None),
     user=Depends(require_auth_user),
+    db: Session = Depends(get_db),
 ):
     """
     Protected. User must be logged in.
-    For now we just save the file and pretend we're kicking off LoRA training.
+    Saves the file and queues a background job ("train_adapter" or
+    "create_model"; ollama_host picks the backend for model builds,
+    lora_config is an optional JSON object of LoRA training settings).
+    Returns the job id right away; poll
+    /jobs/{job_id} or stream /jobs/{job_id}/events for progress.
     """
     if not base_model:
         raise HTTPException(status_code=400, detail="base_model required")
     if not new_model_name:
         raise HTTPException(status_code=400, detail="new_model_name required")
+    if job_type not in ("train_adapter", "create_model"):
+        raise HTTPException(status_code=400, detail=f"Unknown job_type '{job_type}'")
+    _validate_model_name(new_model_name)
+    if job_type == "train_adapter":
+        _validate_trainable_base(base_model)
+    ext = os.path.splitext(training_file.filename or "")[1].lower()
+    if ext not in TRAINING_FILE_EXTENSIONS:
+        raise HTTPException(
+            status_code=415,
+            detail=f"Unsupported training file type '{ext}'. Allowed: {', '.join(sorted(TRAINING_FILE_EXTENSIONS))}",
+        )
+    parsed_lora_config = _parse_lora_config(lora_config)
+    target_host = ollama_service.resolve_ollama_host(ollama_host)  # 400 on unknown hosts
 
-    # save file
-    file_path = os.path.join(UPLOAD_DIR, training_file.filename)
-    with open(file_path, "wb") as out:
-        shutil.copyfileobj(training_file.file, out)
+    # save file under a fresh name; the job removes it when done
+    file_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}{ext}")
+
+    def _save():
+        with open(file_path, "wb") as out:
+            shutil.copyfileobj(training_file.file, out)
+
+    await run_in_threadpool(_save)
 
     logging.info(
-        f"[TRAINING] user={user.get('sub')} base={base_model} new={new_model_name} file={file_path}"
+        f"[TRAINING] user={user.get('sub')} base={base_model} new={new_model_name} "
+        f"file={training_file.filename} -> {file_path}"
     )
 
-    # TODO: launch real LoRA training pipeline
+    try:
+        job = await run_in_threadpool(
+            job_service.submit_job,
+            db,
+            user_id=user.get("sub"),
+            kind=job_type,
+            params={
+                "base_model": base_model,
+                "new_model_name": new_model_name,
+                "file_path": file_path,
+                "filename": os.path.basename(training_file.filename or ""),
+                "ollama_host": target_host,
+                "lora_config": parsed_lora_config,
+            },
+        )
+    except HTTPException:
+        os.remove(file_path)  # not queued, nobody will read it
+        raise
     return {
-        "status": "started",
-        "message": "Training kicked off (placeholder).",
+        "status": job.status,
+        "job_id": job.id,
+        "message": "Training job queued.",
         "base_model": base_model,
         "new_model_name": new_model_name,
         "data_file": training_file.filename,
     }
 
 
+@router.post("/generate-sql-data")
+async def generate_sql_data(
+    schema: str = Form(...),
+    num_examples: int = Form(50),
+    seed: int = Form(0),
+    format: str = Form("json"),
+    user=Depends(require_auth_user),
+):
+    """
+    Protected. Generate synthetic text-to-SQL pairs from a JSON schema.
+    format="json" returns a list (capped at MAX_SQL_EXAMPLES_JSON);
+    format="jsonl" streams one pair per line as it is generated.
+    The same schema + seed always produces the same pairs.
+    """
+    try:
+        parsed_schema = json.loads(schema)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="schema must be valid JSON")
+    if not isinstance(parsed_schema, dict) or not parsed_schema:
+        raise HTTPException(status_code=400, detail="schema must be a non-empty JSON object")
+    if format not in ("json", "jsonl"):
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'jsonl'")
+
+    limit = MAX_SQL_EXAMPLES_JSON if format == "json" else MAX_SQL_EXAMPLES
+    if not 1 <= num_examples <= limit:
+        raise HTTPException(status_code=400, detail=f"num_examples must be between 1 and {limit}")
+
+    if format == "json":
+        return await run_in_threadpool(
+            training_service.generate_sql_training_data, parsed_schema, num_examples, seed
+        )
+
+    pairs = sql_data_generator.iter_sql_training_data(parsed_schema, num_examples, seed=seed)
+    return StreamingResponse(
+        sql_data_generator.iter_jsonl(pairs),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="sql_training_data.jsonl"'},
+    )
+
+
+@router.post("/create-sql-model", status_code=202)
+async def create_sql_model(
+    req: CreateSqlModelRequest,
+    user=Depends(require_auth_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Protected. Queue a job that builds an Ollama SQL model (or, with
+    target="adapter", trains a LoRA adapter) from QA pairs.
+    The pairs are written to a JSONL file first; the job streams them into
+    the create request, so the request body is the only full copy in memory.
+    """
+    if not req.base_model or not req.custom_model_name:
+        raise HTTPException(status_code=400, detail="base_model and custom_model_name required")
+    if req.target not in ("model", "adapter"):
+        raise HTTPException(status_code=400, detail="target must be 'model' or 'adapter'")
+    _validate_model_name(req.custom_model_name)
+    if req.target == "adapter":
+        _validate_trainable_base(req.base_model)
+    if not req.qa_data and not req.schema_:
+        raise HTTPException(status_code=400, detail="Provide qa_data or a schema")
+    if not req.qa_data and not 1 <= req.num_examples <= MAX_SQL_EXAMPLES:
+        raise HTTPException(status_code=400, detail=f"num_examples must be between 1 and {MAX_SQL_EXAMPLES}")
+    if not 0 <= req.holdout_fraction < 1:
+        raise HTTPException(status_code=400, detail="holdout_fraction must be at least 0 and below 1")
+    lora_config = _validate_lora_config(req.lora_config)
+    target_host = ollama_service.resolve_ollama_host(req.ollama_host)
+
+    qa_path = os.path.join(UPLOAD_DIR, f"sql_{uuid.uuid4().hex}.jsonl")
+    if req.qa_data:
+        def _write_pairs():
+            pairs = (p for p in req.qa_data if not sql_data_generator.is_held_out(p, req.holdout_fraction))
+            with open(qa_path, "w", encoding="utf-8") as out:
+                return sql_data_generator.write_jsonl(pairs, out)
+        count = await run_in_threadpool(_write_pairs)
+    else:
+        count = await run_in_threadpool(
+            training_service.write_sql_training_jsonl,
+            req.schema_, req.num_examples, qa_path, req.seed, req.holdout_fraction,
+        )
+    if not count:
+        os.remove(qa_path)
+        raise HTTPException(status_code=400, detail="No QA pairs left for training after the holdout")
+
+    try:
+        job = await run_in_threadpool(
+            job_service.submit_job,
+            db,
+            user_id=user.get("sub"),
+            kind="create_model" if req.target == "model" else "train_sql_adapter",
+            params={
+                "base_model": req.base_model,
+                "new_model_name": req.custom_model_name,
+                "qa_path": qa_path,
+                "ollama_host": target_host,
+                "max_examples": req.max_examples,
+                "token_budget": req.token_budget,
+                "sample_examples": req.sample_examples,
+                "lora_config": lora_config,
+                "holdout_fraction": req.holdout_fraction,  # kept with the job for later evaluations
+                "num_pairs": count,
+            },
+        )
+    except HTTPException:
+        os.remove(qa_path)  # not queued, nobody will read it
+        raise
+    return {
+        "status": job.status,
+        "job_id": job.id,
+        "message": f"{'Model build' if req.target == 'model' else 'Adapter training'} queued with {count} QA pairs.",
+        "model_name": req.custom_model_name,
+        "holdout_fraction": req.holdout_fraction,
+    }
+
+
+@router.post("/evaluate-sql", status_code=202)
+async def evaluate_sql(
+    req: EvaluateSqlRequest,
+    user=Depends(require_auth_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Protected. Queue a job that asks each candidate (a model, or a base model
+    plus a LoRA adapter) the evaluation questions and runs the predicted and
+    expected SQL on a SQLite database built from the schema. The job result
+    has execution accuracy, exact match, latency and tokens/s per candidate.
+    """
+    if not req.schema_:
+        raise HTTPException(status_code=400, detail="schema must be a non-empty JSON object")
+    if not 1 <= len(req.candidates) <= sql_eval.SQL_EVAL_MAX_CANDIDATES:
+        raise HTTPException(status_code=400, detail=f"Give 1 to {sql_eval.SQL_EVAL_MAX_CANDIDATES} candidates")
+    if not 1 <= req.max_pairs <= sql_eval.SQL_EVAL_MAX_PAIRS:
+        raise HTTPException(status_code=400, detail=f"max_pairs must be between 1 and {sql_eval.SQL_EVAL_MAX_PAIRS}")
+    if not req.qa_data and not 1 <= req.num_examples <= MAX_SQL_EXAMPLES:
+        raise HTTPException(status_code=400, detail=f"num_examples must be between 1 and {MAX_SQL_EXAMPLES}")
+    if not req.qa_data and not 0 < req.holdout_fraction <= 1:
+        raise HTTPException(status_code=400, detail="holdout_fraction must be above 0 and at most 1")
+    if not 1 <= req.concurrency <= sql_eval.SQL_EVAL_MAX_CONCURRENCY:
+        raise HTTPException(status_code=400, detail=f"concurrency must be between 1 and {sql_eval.SQL_EVAL_MAX_CONCURRENCY}")
+    if not 1 <= req.max_tokens <= 2048:
+        raise HTTPException(status_code=400, detail="max_tokens must be between 1 and 2048")
+    candidates = []
+    for c in req.candidates:
+        if not c.model:
+            raise HTTPException(status_code=400, detail="Every candidate needs a model")
+        if c.adapter:
+            lora_variants.resolve_adapter(c.adapter)  # 400/404 before queueing
+        host = ollama_service.resolve_ollama_host(c.host) if c.host else None
+        candidates.append({"model": c.model, "adapter": c.adapter, "host": host})
+
+    qa_path = None
+    if req.qa_data:
+        qa_path = os.path.join(UPLOAD_DIR, f"sql_eval_{uuid.uuid4().hex}.jsonl")
+
+        def _write_pairs():
+            with open(qa_path, "w", encoding="utf-8") as out:
+                return sql_data_generator.write_jsonl(req.qa_data, out)
+        await run_in_threadpool(_write_pairs)
+
+    try:
+        job = await run_in_threadpool(
+            job_service.submit_job,
+            db,
+            user_id=user.get("sub"),
+            kind="evaluate_sql",
+            params={
+                "schema": req.schema_,
+                "candidates": candidates,
+                "qa_path": qa_path,
+                "num_examples": req.num_examples,
+                "seed": req.seed,
+                "holdout_fraction": req.holdout_fraction,
+                "max_pairs": req.max_pairs,
+                "concurrency": req.concurrency,
+                "max_tokens": req.max_tokens,
+                "include_schema": req.include_schema,
+            },
+        )
+    except HTTPException:
+        if qa_path:
+            os.remove(qa_path)
+        raise
+    return {
+        "status": job.status,
+        "job_id": job.id,
+        "message": f"Evaluation of {len(candidates)} candidate(s) queued.",
+    }
+
+
+@router.get("/jobs", response_model=List[TrainingJob])
+async def list_training_jobs(user=Depends(require_auth_user), db: Session = Depends(get_db)):
+    """
+    Protected. The caller's most recent jobs, newest first.
+    """
+    return await run_in_threadpool(job_service.list_jobs, db, user.get("sub"))
+
+
+@router.get("/jobs/{job_id}", response_model=TrainingJob)
+async def get_training_job(job_id: str, user=Depends(require_auth_user), db: Session = Depends(get_db)):
+    """
+    Protected. Current status/progress of one job.
+    """
+    return await run_in_threadpool(job_service.get_job, db, job_id, user.get("sub"))
+
+
+def _job_snapshot(job_id: str, user_id: str) -> Dict[str, Any]:
+    db = SessionLocal()
+    try:
+        job = job_service.get_job(db, job_id, user_id)
+        return TrainingJob.model_validate(job).model_dump(mode="json")
+    finally:
+        db.close()
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_training_job(job_id: str, user=Depends(require_auth_user)):
+    """
+    Protected. NDJSON stream of job snapshots, one line per change,
+    ending once the job succeeds, fails or is cancelled.
+    """
+    user_id = user.get("sub")
+    first = await run_in_threadpool(_job_snapshot, job_id, user_id)  # 404s before streaming
+
+    async def event_stream():
+        snapshot, last_key = first, None
+        while True:
+            key = (snapshot["status"], snapshot["progress"], snapshot["message"])
+            if key != last_key:
+                yield json.dumps(snapshot) + "\n"
+                last_key = key
+            if snapshot["status"] in FINISHED_JOB_STATES:
+                break
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+            snapshot = await run_in_threadpool(_job_snapshot, job_id, user_id)
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+
+@router.post("/jobs/{job_id}/cancel", response_model=TrainingJob)
+async def cancel_training_job(job_id: str, user=Depends(require_auth_user), db: Session = Depends(get_db)):
+    """
+    Protected. Cancel a queued or running job.
+    """
+    def _cancel():
+        return job_service.cancel_job(db, job_service.get_job(db, job_id, user.get("sub")))
+
+    return await run_in_threadpool(_cancel)
+
+
 @router.get("/available-models", response_model=List[dict])
 async def get_available_models(user=Depends(require_auth_user)):
     """
@@ -55,3 +452,11 @@ async def get_available_models(user=Depends(require_auth_user)):
     Currently just our Ollama list.
     """
     return ollama_service.list_local_models()
+
+
+@router.get("/ollama-hosts", response_model=List[str])
+async def get_ollama_hosts(user=Depends(require_auth_user)):
+    """
+    Protected. Ollama backends a model can be built on.
+    """
+    return ollama_service.OLLAMA_HOSTS
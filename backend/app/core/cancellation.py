@@ -0,0 +1,124 @@
+# backend/app/core/cancellation.py
+"""
+Client-disconnect detection and per-request deadlines for model calls.
+
+run_until_disconnect(request, coro) runs the upstream call as a task and
+polls the connection. When the client goes away (closed tab, stop button)
+or the deadline passes, the task is cancelled; that closes the upstream
+HTTP stream, and Ollama / MiniMax stop generating for it.
+
+The deadline (GENERATION_DEADLINE_SECONDS, lowered per request with the
+X-Request-Timeout header) lives in a contextvar, so upstream calls made
+below it, including sync code in the threadpool, bound their own timeouts
+with remaining().
+"""
+import asyncio
+import os
+import time
+from contextvars import ContextVar
+from typing import Awaitable, Optional, TypeVar, Union
+
+from fastapi import HTTPException, Request
+
+GENERATION_DEADLINE_SECONDS = float(os.getenv("GENERATION_DEADLINE_SECONDS", "60"))
+DEADLINE_HEADER = "X-Request-Timeout"
+DISCONNECT_POLL_SECONDS = 0.25
+
+CANCEL_DISCONNECT = "disconnect"
+CANCEL_DEADLINE = "deadline"
+CANCEL_STOP = "stop"  # the client asked to stop (WebSocket chat)
+
+T = TypeVar("T")
+
+# time.monotonic() by which the current request's upstream work must finish
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+def remaining(default: Union[float, tuple]) -> Union[float, tuple]:
+    """Seconds left before the current deadline (default if there is none)."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return default
+    left = max(deadline - time.monotonic(), 0.001)
+    if isinstance(default, tuple):  # (connect, read) timeouts
+        return tuple(min(t, left) for t in default)
+    return min(default, left)
+
+
+def request_timeout(request: Request) -> float:
+    """GENERATION_DEADLINE_SECONDS, or less if the client asked for less."""
+    raw = request.headers.get(DEADLINE_HEADER)
+    try:
+        asked = float(raw) if raw else GENERATION_DEADLINE_SECONDS
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{DEADLINE_HEADER} must be a number of seconds")
+    return max(0.1, min(asked, GENERATION_DEADLINE_SECONDS))
+
+
+def cancel_reason(exc: BaseException) -> str:
+    """Why a CancelledError was raised: disconnect, deadline, stop or server (shutdown etc.)."""
+    reason = exc.args[0] if exc.args else None
+    return reason if reason in (CANCEL_DISCONNECT, CANCEL_DEADLINE, CANCEL_STOP) else "server"
+
+
+async def run_until_disconnect(request: Request, awaitable: Awaitable[T], timeout: Optional[float] = None) -> T:
+    """
+    Await an upstream call, cancelling it if the client disconnects (499)
+    or the deadline passes (504).
+    """
+    try:
+        timeout = request_timeout(request) if timeout is None else timeout
+    except HTTPException:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()  # never started
+        raise
+    deadline = time.monotonic() + timeout
+    task = _start(awaitable, deadline)
+    try:
+        while True:
+            left = deadline - time.monotonic()
+            done, _ = await asyncio.wait({task}, timeout=max(0.0, min(DISCONNECT_POLL_SECONDS, left)))
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                await _cancel(task, CANCEL_DISCONNECT)
+                raise HTTPException(status_code=499, detail="Client closed request")
+            if time.monotonic() >= deadline:
+                await _cancel(task, CANCEL_DEADLINE)
+                raise HTTPException(status_code=504, detail=f"Generation exceeded its {timeout:g}s deadline")
+    finally:
+        if not task.done():  # the handler itself was cancelled
+            task.cancel()
+
+
+async def run_with_deadline(awaitable: Awaitable[T], timeout: float) -> T:
+    """
+    Await an upstream call under its own deadline (504 when it passes), for
+    work that is not tied to one client connection, e.g. items of a batch.
+    """
+    task = _start(awaitable, time.monotonic() + timeout)
+    try:
+        done, _ = await asyncio.wait({task}, timeout=timeout)
+        if done:
+            return task.result()
+        await _cancel(task, CANCEL_DEADLINE)
+        raise HTTPException(status_code=504, detail=f"Generation exceeded its {timeout:g}s deadline")
+    except asyncio.CancelledError as e:
+        task.cancel(*e.args[:1])  # pass the reason on
+        raise
+
+
+def _start(awaitable: Awaitable[T], deadline: float) -> asyncio.Future:
+    token = _deadline.set(deadline)
+    try:
+        return asyncio.ensure_future(awaitable)  # copies the context, deadline included
+    finally:
+        _deadline.reset(token)
+
+
+async def _cancel(task: asyncio.Task, reason: str) -> None:
+    task.cancel(reason)
+    try:
+        await task
+    except (asyncio.CancelledError, Exception):
+        pass
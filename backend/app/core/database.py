@@ -1,26 +1,122 @@
 # backend/app/core/database.py
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url, URL
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from typing import AsyncIterator, Optional
 import os
 
-# --- SQLite Configuration ---
-# Create the data directory if it doesn't exist
-os.makedirs("data", exist_ok=True)
+# --- Configuration ---
+# Defaults to the SQLite file inside the container at /code/data/app.db.
+# Any SQLAlchemy URL works, e.g. DATABASE_URL=postgresql://user:pass@db/app
+# (needs psycopg2 / asyncpg installed); the async driver is derived from it.
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./data/app.db")
 
-# The path points to a file inside the container at /code/data/app.db
-SQLALCHEMY_DATABASE_URL = "sqlite:///./data/app.db"
+# Connection pool (per process)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# SQLite tuning, applied to every new connection
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", "65536"))  # page cache per connection
+SQLITE_MMAP_BYTES = int(os.getenv("SQLITE_MMAP_BYTES", str(256 * 1024 * 1024)))
 
-# The 'connect_args' is required for SQLite to work with FastAPI
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+_url = make_url(SQLALCHEMY_DATABASE_URL)
+IS_SQLITE = _url.get_backend_name() == "sqlite"
+
+# Directory of the SQLite file, created at startup (app.main lifespan)
+DATA_DIR = (
+    os.path.dirname(os.path.abspath(_url.database))
+    if IS_SQLITE and _url.database and _url.database != ":memory:"
+    else None
 )
 
+_ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg", "mysql": "aiomysql"}
+
+
+def _async_url(url: URL) -> URL:
+    backend = url.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        raise RuntimeError(f"No async driver known for '{backend}' databases")
+    return url.set(drivername=f"{backend}+{_ASYNC_DRIVERS[backend]}")
+
+
+def _set_sqlite_pragmas(dbapi_connection, _connection_record):
+    """
+    WAL lets readers run alongside the single writer; synchronous=NORMAL is
+    durable in WAL mode except for the last transactions on power loss.
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_BYTES}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA foreign_keys=ON")
+    finally:
+        cursor.close()
+
+
+def _engine_kwargs() -> dict:
+    kwargs = {}
+    if not (IS_SQLITE and _url.database in (None, "", ":memory:")):  # in-memory SQLite has its own pool
+        kwargs.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    if IS_SQLITE:
+        # Connections are handed between threads (threadpool, job workers)
+        kwargs["connect_args"] = {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+    else:
+        kwargs["pool_pre_ping"] = True
+        kwargs["pool_recycle"] = 1800
+    return kwargs
+
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_engine_kwargs())
+if IS_SQLITE:
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+# --- Async engine (created on first use, so the async driver stays optional) ---
+_async_engine = None
+_async_sessionmaker: Optional[async_sessionmaker] = None
+
+
+def get_async_engine():
+    global _async_engine, _async_sessionmaker
+    if _async_engine is None:
+        kwargs = _engine_kwargs()
+        if IS_SQLITE:
+            kwargs["connect_args"] = {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+            if "pool_size" in kwargs:
+                kwargs["poolclass"] = AsyncAdaptedQueuePool  # aiosqlite defaults to no pooling
+        _async_engine = create_async_engine(_async_url(_url), **kwargs)
+        if IS_SQLITE:
+            event.listen(_async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+        _async_sessionmaker = async_sessionmaker(_async_engine, expire_on_commit=False, autoflush=False)
+    return _async_engine
+
+
+def AsyncSessionLocal() -> AsyncSession:
+    get_async_engine()
+    return _async_sessionmaker()
+
+
+async def dispose_engines() -> None:
+    """Close pooled connections (app shutdown)."""
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+    engine.dispose()
+
+
 # --- The Missing Function ---
 # This is a dependency for FastAPI routes to get a DB session.
 def get_db():
@@ -28,4 +124,10 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# Async counterpart of get_db: queries don't block the event loop.
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    async with AsyncSessionLocal() as db:
+        yield db
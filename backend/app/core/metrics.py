@@ -0,0 +1,241 @@
+# backend/app/core/metrics.py
+"""
+Prometheus metrics for the API.
+
+MetricsMiddleware records per-route latency, in-flight requests, upload
+sizes and per-phase time (see app.core.profiling). Services record
+upstream calls (Ollama / MiniMax), Ollama generation stats, aborted
+generations and time-to-first-chunk of streamed responses. Cache and queue sizes are read
+at scrape time by a custom collector.
+
+Under gunicorn with several workers, set PROMETHEUS_MULTIPROC_DIR to an
+empty directory so /metrics aggregates all workers.
+"""
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+)
+from prometheus_client.core import GaugeMetricFamily
+from starlette.routing import Match
+
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 5e6, 1e7, 5e7, 1e8)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency until the last body byte",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requests currently being handled",
+    ["method", "route"], multiprocess_mode="livesum",
+)
+HTTP_UPLOAD_BYTES = Histogram(
+    "http_upload_size_bytes", "Request body size of uploads (multipart / octet-stream)",
+    ["route"], buckets=SIZE_BUCKETS,
+)
+REQUEST_PHASE_SECONDS = Histogram(
+    "http_request_phase_seconds", "Time spent per request phase (auth, upstream, cpu, serialization)",
+    ["route", "phase"], buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_SECONDS = Histogram(
+    "upstream_request_duration_seconds", "Latency of calls to model backends",
+    ["backend", "operation", "outcome"], buckets=LATENCY_BUCKETS,
+)
+OLLAMA_TOKENS_PER_SECOND = Histogram(
+    "ollama_eval_tokens_per_second", "Generation speed reported by Ollama (eval_count / eval_duration)",
+    ["model"], buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 250, 500),
+)
+OLLAMA_PROMPT_EVAL_SECONDS = Histogram(
+    "ollama_prompt_eval_seconds", "Prompt processing time reported by Ollama (prompt_eval_duration)",
+    ["model"], buckets=LATENCY_BUCKETS,
+)
+OLLAMA_TOKENS = Counter(
+    "ollama_tokens", "Tokens processed by Ollama", ["model", "kind"],
+)
+GENERATION_CANCELLED = Counter(
+    "generation_cancelled", "Upstream generations aborted before completion", ["backend", "reason"],
+)
+GENERATION_SAVED_SECONDS = Counter(
+    "generation_saved_seconds", "Estimated upstream decode time not spent because generations were aborted",
+    ["backend", "reason"],
+)
+PROMPT_BATCH_ITEMS = Counter(
+    "prompt_batch_items", "Batch prompt items by outcome (resumed = replayed from an earlier run)", ["status"],
+)
+STREAM_FIRST_CHUNK_SECONDS = Histogram(
+    "stream_time_to_first_chunk_seconds", "Time from request start to the first streamed chunk/token",
+    ["stream"], buckets=LATENCY_BUCKETS,
+)
+
+
+# --- Helpers used by services ---
+
+class upstream_timer:
+    """Context manager: with upstream_timer("ollama", "/api/generate"): ..."""
+
+    def __init__(self, backend: str, operation: str):
+        self.backend = backend
+        self.operation = operation
+
+    def __enter__(self):
+        from app.core import profiling
+
+        self._phase = profiling.phase("upstream")
+        self._phase.__enter__()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        outcome = "ok" if exc_type is None else "error"
+        UPSTREAM_SECONDS.labels(self.backend, self.operation, outcome).observe(time.perf_counter() - self._start)
+        self._phase.__exit__(exc_type, exc, tb)
+        return False
+
+
+def observe_ollama_generation(model: str, data: Dict[str, Any]) -> None:
+    """Record Ollama's timing fields (durations are in nanoseconds)."""
+    try:
+        eval_count = data.get("eval_count") or 0
+        eval_ns = data.get("eval_duration") or 0
+        if eval_count and eval_ns:
+            OLLAMA_TOKENS_PER_SECOND.labels(model).observe(eval_count / (eval_ns / 1e9))
+            OLLAMA_TOKENS.labels(model, "eval").inc(eval_count)
+        if data.get("prompt_eval_count"):
+            OLLAMA_TOKENS.labels(model, "prompt").inc(data["prompt_eval_count"])
+        if data.get("prompt_eval_duration"):
+            OLLAMA_PROMPT_EVAL_SECONDS.labels(model).observe(data["prompt_eval_duration"] / 1e9)
+    except (TypeError, ValueError, ZeroDivisionError):
+        logging.debug(f"[METRICS] unexpected Ollama timing fields: {data}")
+
+
+def observe_generation_cancelled(backend: str, reason: str, saved_seconds: float) -> None:
+    GENERATION_CANCELLED.labels(backend, reason).inc()
+    if saved_seconds > 0:
+        GENERATION_SAVED_SECONDS.labels(backend, reason).inc(saved_seconds)
+
+
+def observe_batch_item(status: str) -> None:
+    PROMPT_BATCH_ITEMS.labels(status).inc()
+
+
+async def track_first_chunk(stream: AsyncIterator, name: str, started: Optional[float] = None) -> AsyncIterator:
+    """Pass an async stream through, recording the time until its first item."""
+    started = started if started is not None else time.perf_counter()
+    first = True
+    async for item in stream:
+        if first:
+            STREAM_FIRST_CHUNK_SECONDS.labels(name).observe(time.perf_counter() - started)
+            first = False
+        yield item
+
+
+# --- Cache / queue stats read at scrape time ---
+
+_stat_sources: List[Callable[[], Iterable[GaugeMetricFamily]]] = []
+
+
+def register_stats_source(fn: Callable[[], Iterable[GaugeMetricFamily]]) -> None:
+    """fn() yields GaugeMetricFamily objects; called on every scrape."""
+    _stat_sources.append(fn)
+
+
+class _StatsCollector:
+    def collect(self):
+        for source in list(_stat_sources):
+            try:
+                yield from source()
+            except Exception as e:  # a broken source must not break /metrics
+                logging.warning(f"[METRICS] stats source {source.__name__} failed: {e}")
+
+
+_stats_collector = _StatsCollector()
+REGISTRY.register(_stats_collector)
+
+
+def render_latest() -> tuple:
+    """(body, content type) for the /metrics endpoint."""
+    if MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_stats_collector)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+# --- ASGI middleware ---
+
+_UPLOAD_TYPES = ("multipart/form-data", "application/octet-stream")
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (no response buffering, so streams are timed to
+    their last chunk). Also opens the profiling context for the request.
+    Routes are labelled by their template (/api/training/jobs/{job_id}).
+    """
+
+    def __init__(self, app, router=None):
+        self.app = app
+        self.router = router
+
+    def _route_template(self, scope) -> str:
+        if self.router is not None:
+            for route in self.router.routes:
+                match, _ = route.matches(scope)
+                if match == Match.FULL:
+                    return getattr(route, "path", "unmatched")
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        from app.core import profiling
+
+        method = scope["method"]
+        route = self._route_template(scope)
+        started = time.perf_counter()
+        status = {"code": 500}
+        headers = dict(scope.get("headers") or [])
+        request_profile = profiling.begin_request(scope, headers)
+        in_flight = HTTP_IN_FLIGHT.labels(method, route)
+        in_flight.inc()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                response_headers = dict(message.get("headers") or [])
+                profiling.mark_streaming(request_profile, response_headers.get(b"content-type", b"").decode("latin-1"))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - started
+            in_flight.dec()
+            HTTP_REQUEST_SECONDS.labels(method, route, str(status["code"])).observe(duration)
+            content_type = headers.get(b"content-type", b"").decode("latin-1")
+            length = headers.get(b"content-length")
+            if length and content_type.startswith(_UPLOAD_TYPES):
+                try:
+                    HTTP_UPLOAD_BYTES.labels(route).observe(int(length))
+                except ValueError:
+                    pass
+            phases = profiling.end_request(request_profile, route, status["code"], duration)
+            for phase_name, seconds in phases.items():
+                REQUEST_PHASE_SECONDS.labels(route, phase_name).observe(seconds)
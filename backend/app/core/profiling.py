@@ -0,0 +1,321 @@
+# backend/app/core/profiling.py
+"""
+Opt-in request profiling and slow-request capture.
+
+Every request gets a lightweight RequestProfile (via MetricsMiddleware)
+that accumulates time per phase: code wraps work in `with phase("auth")`,
+`phase("upstream")`, `phase("cpu")` or `phase("serialization")`; the rest
+is reported as "other". Phase totals always feed the metrics histogram.
+
+Stack profiles are collected by a sampling thread that snapshots every
+thread's stack (sys._current_frames) every PROFILE_SAMPLE_INTERVAL
+seconds while a request is being watched:
+  - a PROFILE_SAMPLE_RATE fraction of requests, from their start
+  - requests sending X-Profile-Token: <PROFILE_ADMIN_TOKEN>, from their start
+  - any request running longer than SLOW_REQUEST_SECONDS, from that point
+    (off by default; streaming responses such as NDJSON or job-event
+    streams are long-lived by design and never count as slow)
+Samples are attributed to every watched request in flight, so concurrent
+watched requests blur into each other; the stacks still show where the
+process spent its time. The thread only runs while something may need
+sampling and exits once nothing in flight is watched.
+
+Captured profiles are written as JSON files to PROFILE_DIR (shared by
+all workers) and served by the /api/debug endpoints. Sample rate and
+threshold can be changed at runtime through settings.json in that dir.
+"""
+import hmac
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./data/profiles")
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN")
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+PROFILE_MAX_STORED = int(os.getenv("PROFILE_MAX_STORED", "200"))
+# Deepest frames kept per stack sample
+MAX_STACK_DEPTH = 64
+PHASES = ("auth", "upstream", "cpu", "serialization")
+# Response types that stay open on purpose; exempt from slow-request capture
+STREAMING_CONTENT_TYPES = ("application/x-ndjson", "text/event-stream")
+
+_DEFAULT_SETTINGS = {
+    "sample_rate": float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+    "slow_request_seconds": float(os.getenv("SLOW_REQUEST_SECONDS", "0")),
+}
+_settings: Dict[str, float] = dict(_DEFAULT_SETTINGS)
+_settings_checked = 0.0
+_settings_mtime = 0.0
+
+# Innermost frames that mean "thread is idle", not worth attributing
+_IDLE_FILES = ("threading.py", "queue.py", "selectors.py", "thread.py")
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str, reason: Optional[str]):
+        self.id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.reason = reason  # "sampled" | "admin" | "slow" | None
+        self.started = time.perf_counter()
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self.phases: Dict[str, float] = {}
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.watched = reason is not None
+        self.streaming = False
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+_in_flight: Dict[str, RequestProfile] = {}
+_in_flight_lock = threading.Lock()
+_writer: Optional[ThreadPoolExecutor] = None
+
+
+class phase:
+    """Time a block as one phase of the current request (no-op outside requests)."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self._profile = _current.get()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._profile is not None:
+            self._profile.add_phase(self.name, time.perf_counter() - self._start)
+        return False
+
+
+# --- Settings (runtime adjustable) ---
+
+def _settings_path() -> str:
+    return os.path.join(PROFILE_DIR, "settings.json")
+
+
+def get_settings() -> Dict[str, float]:
+    """Current settings; settings.json overrides are picked up within a second."""
+    global _settings, _settings_checked, _settings_mtime
+    now = time.monotonic()
+    if now - _settings_checked >= 1.0:
+        _settings_checked = now
+        try:
+            mtime = os.path.getmtime(_settings_path())
+            if mtime != _settings_mtime:
+                with open(_settings_path(), "r", encoding="utf-8") as f:
+                    _settings = {**_DEFAULT_SETTINGS, **json.load(f)}
+                _settings_mtime = mtime
+        except (OSError, ValueError):
+            pass
+    return _settings
+
+
+def update_settings(**changes: float) -> Dict[str, float]:
+    global _settings_checked
+    merged = {**get_settings(), **{k: float(v) for k, v in changes.items() if v is not None}}
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    tmp = f"{_settings_path()}.{os.getpid()}.part"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(merged, f)
+    os.replace(tmp, _settings_path())
+    _settings_checked = 0.0  # re-read on next access
+    return get_settings()
+
+
+# --- Stack sampler ---
+
+def _fold(frame) -> Optional[str]:
+    """Collapsed stack "outer;...;inner" (flamegraph.pl format), None for idle threads."""
+    if os.path.basename(frame.f_code.co_filename) in _IDLE_FILES:
+        return None
+    parts: List[str] = []
+    while frame is not None and len(parts) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+class _Sampler(threading.Thread):
+    def __init__(self):
+        super().__init__(name="request-profiler", daemon=True)
+
+    def run(self):
+        own_id = threading.get_ident()
+        while True:
+            time.sleep(PROFILE_SAMPLE_INTERVAL)
+            slow_after = get_settings()["slow_request_seconds"]
+            now = time.perf_counter()
+            with _in_flight_lock:
+                watched = []
+                for profile in _in_flight.values():
+                    if (not profile.watched and not profile.streaming
+                            and slow_after > 0 and now - profile.started >= slow_after):
+                        profile.watched, profile.reason = True, "slow"
+                    if profile.watched:
+                        watched.append(profile)
+            if not watched:
+                if slow_after <= 0 and self._retire():
+                    return
+                continue
+            stacks = [
+                folded
+                for thread_id, frame in sys._current_frames().items()
+                if thread_id != own_id and (folded := _fold(frame))
+            ]
+            for profile in watched:
+                profile.samples += 1
+                profile.stacks.update(stacks)
+
+    def _retire(self) -> bool:
+        """Stop the thread if nothing is watched; begin_request starts a new one when needed."""
+        global _sampler
+        with _sampler_lock:
+            with _in_flight_lock:
+                if any(profile.watched for profile in _in_flight.values()):
+                    return False
+            _sampler = None
+            return True
+
+
+_sampler: Optional[_Sampler] = None
+_sampler_lock = threading.Lock()
+
+
+def _ensure_sampler() -> None:
+    global _sampler
+    if _sampler is None:
+        with _sampler_lock:
+            if _sampler is None:
+                _sampler = _Sampler()
+                _sampler.start()
+
+
+# --- Request lifecycle (called by MetricsMiddleware) ---
+
+def begin_request(scope, headers: Dict[bytes, bytes]):
+    settings = get_settings()
+    reason = None
+    token = headers.get(b"x-profile-token")
+    if PROFILE_ADMIN_TOKEN and token and hmac.compare_digest(token, PROFILE_ADMIN_TOKEN.encode("latin-1")):
+        reason = "admin"
+    elif settings["sample_rate"] > 0 and random.random() < settings["sample_rate"]:
+        reason = "sampled"
+    profile = RequestProfile(scope.get("method", ""), scope.get("path", ""), reason)
+    if reason or settings["slow_request_seconds"] > 0:
+        _ensure_sampler()
+    with _in_flight_lock:
+        _in_flight[profile.id] = profile
+    return profile, _current.set(profile)
+
+
+def mark_streaming(handle, content_type: str) -> None:
+    """Called at response start; streaming responses are not captured as slow requests."""
+    if content_type.startswith(STREAMING_CONTENT_TYPES):
+        handle[0].streaming = True
+
+
+def end_request(handle, route: str, status: int, duration: float) -> Dict[str, float]:
+    """Finish the request; stores the profile if it was watched. Returns phase seconds incl. "other"."""
+    profile, token = handle
+    _current.reset(token)
+    with _in_flight_lock:
+        _in_flight.pop(profile.id, None)
+        watched = profile.watched
+    phases = dict(profile.phases)
+    phases["other"] = max(0.0, duration - sum(phases.values()))
+    if watched:
+        record = {
+            "id": profile.id,
+            "reason": profile.reason,
+            "method": profile.method,
+            "path": profile.path,
+            "route": route,
+            "status": status,
+            "started_at": profile.started_at,
+            "duration_seconds": round(duration, 6),
+            "phases": {k: round(v, 6) for k, v in phases.items()},
+            "samples": profile.samples,
+            "sample_interval": PROFILE_SAMPLE_INTERVAL,
+            "stacks": dict(profile.stacks.most_common(500)),
+        }
+        _get_writer().submit(_store, record)
+    return phases
+
+
+# --- Storage ---
+
+def _get_writer() -> ThreadPoolExecutor:
+    global _writer
+    if _writer is None:
+        _writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="profile-writer")
+    return _writer
+
+
+def _store(record: Dict[str, Any]) -> None:
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        name = f"{int(time.time() * 1000):013d}_{record['id']}.json"
+        with open(os.path.join(PROFILE_DIR, name), "w", encoding="utf-8") as f:
+            json.dump(record, f)
+        files = sorted(n for n in os.listdir(PROFILE_DIR) if n.endswith(".json") and n != "settings.json")
+        for old in files[:-PROFILE_MAX_STORED]:
+            os.remove(os.path.join(PROFILE_DIR, old))
+        logging.info(
+            f"[PROFILE] stored {record['reason']} profile {record['id']} for {record['method']} "
+            f"{record['path']} ({record['duration_seconds']:.3f}s)"
+        )
+    except OSError as e:
+        logging.warning(f"[PROFILE] could not store profile: {e}")
+
+
+def _profile_files() -> List[str]:
+    try:
+        return sorted(
+            (n for n in os.listdir(PROFILE_DIR) if n.endswith(".json") and n != "settings.json"),
+            reverse=True,
+        )
+    except OSError:
+        return []
+
+
+def list_profiles(limit: int = 50) -> List[Dict[str, Any]]:
+    """Newest first, without the stacks."""
+    out = []
+    for name in _profile_files()[:limit]:
+        try:
+            with open(os.path.join(PROFILE_DIR, name), "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            continue
+        record.pop("stacks", None)
+        out.append(record)
+    return out
+
+
+def get_profile(profile_id: str) -> Optional[Dict[str, Any]]:
+    for name in _profile_files():
+        if name.endswith(f"_{profile_id}.json"):
+            with open(os.path.join(PROFILE_DIR, name), "r", encoding="utf-8") as f:
+                return json.load(f)
+    return None
+
+
+def collapsed(record: Dict[str, Any]) -> str:
+    """Stacks as "frame;frame;frame count" lines for flamegraph tools / speedscope."""
+    return "".join(f"{stack} {count}\n" for stack, count in record.get("stacks", {}).items())
@@ -1,9 +1,17 @@
 # backend/app/core/security.py
 
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Optional
-from passlib.context import CryptContext
-from jose import JWTError, jwt
+from typing import Optional, Tuple
+from fastapi import HTTPException
+from prometheus_client.core import GaugeMetricFamily
+from app.core.metrics import register_stats_source
+from app.core.profiling import phase
 
 # --- Configuration ---
 # You should load these from environment variables in a real app
@@ -11,21 +19,134 @@ SECRET_KEY = "your-super-secret-key-that-is-long-and-random" # CHANGE THIS!
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+# Argon2 cost (passlib defaults). Hashes made with other settings still
+# verify and are transparently re-hashed on the next successful login.
+# Run `python -m app.core.security` on the target box to pick values.
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "65536"))  # KiB
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "4"))
+
+# Hashing runs on its own small pool so a login burst can't starve the
+# event loop or the default threadpool. Argon2 releases the GIL.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+# Hash/verify calls allowed to wait or run at once before returning 503
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+
+_pwd_context = None
+_hash_executor: Optional[ThreadPoolExecutor] = None
+_hash_executor_lock = threading.Lock()
+_hash_slots = threading.BoundedSemaphore(PASSWORD_HASH_MAX_PENDING)
+_hash_pending = 0
+
+def get_pwd_context():
+    """Password hashing context (passlib is imported on first use)."""
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+
+        _pwd_context = CryptContext(
+            schemes=["argon2"],
+            deprecated="auto",
+            argon2__time_cost=ARGON2_TIME_COST,
+            argon2__memory_cost=ARGON2_MEMORY_COST,
+            argon2__parallelism=ARGON2_PARALLELISM,
+        )
+    return _pwd_context
 
 # --- THIS IS THE MISSING FUNCTION ---
 def get_password_hash(password: str) -> str:
     """Hashes a plain password."""
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 # --- THIS FUNCTION IS ALSO NEEDED ---
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifies a plain password against a hashed one."""
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verifies a password; if the stored hash uses outdated parameters, also
+    returns a new hash to store (passlib's needs_update), else None.
+    """
+    return get_pwd_context().verify_and_update(plain_password, hashed_password)
+
+
+# --- Off-loop hashing ---
+
+def _get_hash_executor() -> ThreadPoolExecutor:
+    global _hash_executor
+    with _hash_executor_lock:
+        if _hash_executor is None:
+            _hash_executor = ThreadPoolExecutor(
+                max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="argon2"
+            )
+        return _hash_executor
+
+
+def shutdown_hash_executor() -> None:
+    global _hash_executor
+    with _hash_executor_lock:
+        if _hash_executor is not None:
+            _hash_executor.shutdown(wait=False, cancel_futures=True)
+            _hash_executor = None
+
+
+async def _run_hashing(fn, *args):
+    global _hash_pending
+    if not _hash_slots.acquire(blocking=False):
+        logging.warning("⚠ Password hashing queue full, rejecting request")
+        raise HTTPException(
+            status_code=503,
+            detail="Too many login attempts in progress, try again shortly",
+            headers={"Retry-After": "1"},
+        )
+    _hash_pending += 1
+    try:
+        with phase("auth"):
+            return await asyncio.get_running_loop().run_in_executor(_get_hash_executor(), fn, *args)
+    finally:
+        _hash_pending -= 1
+        _hash_slots.release()
+
+
+def _hashing_stats():
+    yield GaugeMetricFamily(
+        "password_hash_pending", "Password hash/verify calls queued or running", value=_hash_pending
+    )
+    yield GaugeMetricFamily(
+        "password_hash_capacity", "Max pending password hash/verify calls", value=PASSWORD_HASH_MAX_PENDING
+    )
+
+
+register_stats_source(_hashing_stats)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """get_password_hash on the hashing pool."""
+    return await _run_hashing(get_password_hash, password)
+
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """verify_and_update_password on the hashing pool."""
+    return await _run_hashing(verify_and_update_password, plain_password, hashed_password)
+
+
+def benchmark_password_hashing(rounds: int = 5, **params) -> float:
+    """Average milliseconds per hash with the given argon2 parameters (default: current)."""
+    ctx = get_pwd_context()
+    if params:
+        ctx = ctx.copy(**{f"argon2__{k}": v for k, v in params.items()})
+    ctx.hash("warm-up")
+    started = time.perf_counter()
+    for _ in range(rounds):
+        ctx.hash("benchmark-password")
+    return (time.perf_counter() - started) * 1000 / rounds
+
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Creates a new JWT access token."""
+    from jose import jwt
+
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.now(timezone.utc) + expires_delta
@@ -34,4 +155,14 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
\ No newline at end of file
+    return encoded_jwt
+
+
+if __name__ == "__main__":
+    # Pick ARGON2_* values: aim for roughly 50-250 ms per hash on the production box.
+    print(f"current: t={ARGON2_TIME_COST} m={ARGON2_MEMORY_COST} p={ARGON2_PARALLELISM} "
+          f"-> {benchmark_password_hashing():.1f} ms")
+    for memory_cost in (19456, 47104, 65536, 131072):
+        for time_cost in (1, 2, 3, 4):
+            ms = benchmark_password_hashing(rounds=3, time_cost=time_cost, memory_cost=memory_cost)
+            print(f"t={time_cost} m={memory_cost:>6} KiB p={ARGON2_PARALLELISM}: {ms:7.1f} ms")
@@ -0,0 +1,175 @@
+# backend/app/core/startup.py
+"""
+Startup timing, deferred side effects and the optional warm-up.
+
+- Import timing: between begin_import_timing() and end_import_timing()
+  every module import is timed in-process (the numbers `python -X importtime`
+  prints), so the report shows which app module pulled in what.
+- Lifespan steps are timed with `with step("name"):`.
+- Directories are created by ensure_directories() from the lifespan
+  instead of at import time.
+- STARTUP_WARMUP=1 (default) imports the heavy libraries routes load
+  lazily (pandas, matplotlib, numpy, Pillow, PyJWT, passlib) in a
+  background thread once the server is accepting requests.
+
+The report is logged once startup is done and served at /api/debug/startup.
+"""
+import importlib
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "1") == "1"
+# Entries per list in the logged / served report
+STARTUP_REPORT_TOP = int(os.getenv("STARTUP_REPORT_TOP", "15"))
+
+# Imported by the warm-up thread, in this order
+WARMUP_MODULES = (
+    "numpy",
+    "pandas",
+    "openpyxl",
+    "matplotlib",
+    "PIL.Image",
+    "jwt",
+    "passlib.context",
+    "app.services.dataset_dedup",
+)
+
+_started = time.perf_counter()
+_imports: List[Tuple[str, Optional[str], float, float]] = []  # (module, imported by, total s, self s)
+_steps: List[Tuple[str, float]] = []
+_warmup: Dict[str, Any] = {}
+_ready_at: Optional[float] = None
+_original_find_and_load = None
+
+
+# --- Import timing ---
+
+def begin_import_timing() -> None:
+    """Time module imports on this thread until end_import_timing()."""
+    global _original_find_and_load
+    bootstrap = sys.modules.get("_frozen_importlib")
+    if bootstrap is None or _original_find_and_load is not None:
+        return
+    original = bootstrap._find_and_load
+    thread_id = threading.get_ident()
+    stack: List[List[Any]] = []  # [module, child seconds]
+
+    def timed_find_and_load(name, import_):
+        if name in sys.modules or threading.get_ident() != thread_id:
+            return original(name, import_)
+        parent = stack[-1][0] if stack else None
+        stack.append([name, 0.0])
+        started = time.perf_counter()
+        try:
+            return original(name, import_)
+        finally:
+            elapsed = time.perf_counter() - started
+            _name, children = stack.pop()
+            if stack:
+                stack[-1][1] += elapsed
+            _imports.append((name, parent, elapsed, elapsed - children))
+
+    _original_find_and_load = original
+    bootstrap._find_and_load = timed_find_and_load
+
+
+def end_import_timing() -> None:
+    global _original_find_and_load
+    if _original_find_and_load is not None:
+        sys.modules["_frozen_importlib"]._find_and_load = _original_find_and_load
+        _original_find_and_load = None
+    _steps.append(("imports", time.perf_counter() - _started))
+
+
+@contextmanager
+def step(name: str):
+    """Time one startup step of the lifespan."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _steps.append((name, time.perf_counter() - started))
+
+
+def mark_ready() -> None:
+    global _ready_at
+    _ready_at = time.perf_counter()
+
+
+# --- Deferred side effects ---
+
+def ensure_directories(paths: Iterable[str]) -> None:
+    """Create data directories; a read-only path only disables the feature using it."""
+    for path in paths:
+        try:
+            os.makedirs(path, exist_ok=True)
+        except OSError as e:
+            logging.warning(f"⚠ [STARTUP] could not create {path}: {e}")
+
+
+# --- Warm-up ---
+
+def _warm_up() -> None:
+    started = time.perf_counter()
+    timings = {}
+    for module in WARMUP_MODULES:
+        t = time.perf_counter()
+        try:
+            importlib.import_module(module)
+            if module == "matplotlib":
+                import matplotlib
+
+                matplotlib.use("Agg")
+                importlib.import_module("matplotlib.pyplot")
+        except Exception as e:  # optional dependency missing: the route reports it on use
+            logging.info(f"[STARTUP] warm-up skipped {module}: {e}")
+            continue
+        timings[module] = round((time.perf_counter() - t) * 1000, 1)
+    from app.core.security import get_pwd_context
+
+    get_pwd_context()
+    _warmup.update(seconds=round(time.perf_counter() - started, 3), modules_ms=timings)
+    logging.info(f"🔥 [STARTUP] warm-up done in {_warmup['seconds']:.2f}s")
+
+
+def start_warmup() -> None:
+    if STARTUP_WARMUP and not _warmup:
+        _warmup["started"] = True
+        threading.Thread(target=_warm_up, name="startup-warmup", daemon=True).start()
+
+
+# --- Report ---
+
+def report(top: int = STARTUP_REPORT_TOP) -> Dict[str, Any]:
+    app_modules = [r for r in _imports if r[0].startswith("app.") or r[0] == "app"]
+    # Third-party modules imported directly by app code, with everything they pulled in
+    dependencies = [r for r in _imports if r[1] and r[1].startswith("app") and not r[0].startswith("app")]
+
+    def rows(records, key):
+        return [
+            {"module": name, "imported_by": parent, "total_ms": round(total * 1000, 1), "self_ms": round(own * 1000, 1)}
+            for name, parent, total, own in sorted(records, key=key, reverse=True)[:top]
+        ]
+
+    return {
+        "ready_seconds": round(_ready_at - _started, 3) if _ready_at else None,
+        "steps_ms": {name: round(seconds * 1000, 1) for name, seconds in _steps},
+        "modules_imported": len(_imports),
+        "app_modules": rows(app_modules, key=lambda r: r[2]),
+        "dependencies": rows(dependencies, key=lambda r: r[2]),
+        "slowest_self": rows(_imports, key=lambda r: r[3]),
+        "warmup": {k: v for k, v in _warmup.items() if k != "started"} or None,
+    }
+
+
+def log_report(top: int = 8) -> None:
+    data = report(top)
+    steps = ", ".join(f"{name} {ms:.0f}ms" for name, ms in data["steps_ms"].items())
+    logging.info(f"🚀 [STARTUP] ready in {data['ready_seconds']}s ({steps}; {data['modules_imported']} modules)")
+    for row in data["dependencies"]:
+        logging.info(f"   [STARTUP] {row['module']:<28} {row['total_ms']:8.1f} ms  (imported by {row['imported_by']})")
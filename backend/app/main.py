@@ -1,5 +1,10 @@
+from app.core import startup
+
+startup.begin_import_timing()
+
 import logging
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from starlette.middleware.cors import CORSMiddleware
 import os
 
@@ -12,12 +17,50 @@ from app.api import (
     ocr,
     chatbot,
     chat_history,
+    debug,
+    documents,
 )
+from app.core.database import Base, SessionLocal, engine, dispose_engines, DATA_DIR
+from app.models import user as _user_models, job as _job_models, chat as _chat_models  # noqa: F401 (register tables)
+from app.core.metrics import MetricsMiddleware, render_latest
+from app.core.security import shutdown_hash_executor
+from app.services import chat_search, job_service, ollama_service
+from app.services.semantic_cache import cache as semantic_cache
+from app.services.retrieval_index import RETRIEVAL_DIR
+
+startup.end_import_timing()
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Imaginarium AI")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # --- Startup ---
+    with startup.step("directories"):
+        startup.ensure_directories(d for d in (DATA_DIR, loras.LORA_DIR, training.UPLOAD_DIR, RETRIEVAL_DIR) if d)
+    with startup.step("create_all"):
+        Base.metadata.create_all(bind=engine)
+    with startup.step("chat_search_index"):
+        chat_search.ensure_index(engine)
+    with startup.step("fail_orphaned_jobs"):
+        db = SessionLocal()
+        try:
+            job_service.fail_orphaned_jobs(db)
+        finally:
+            db.close()
+    startup.mark_ready()
+    startup.log_report()
+    # Runs while the first requests are already being served
+    startup.start_warmup()
+    yield
+    # --- Shutdown ---
+    job_service.shutdown_executor()
+    shutdown_hash_executor()
+    semantic_cache.save()
+    await ollama_service.aclose()
+    await dispose_engines()
+
+app = FastAPI(title="Imaginarium AI", lifespan=lifespan)
 
 # CORS
 origins = [
@@ -36,6 +79,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Outermost: times everything, including CORS preflights
+app.add_middleware(MetricsMiddleware, router=app.router)
 
 # Routers
 app.include_router(auth.router, prefix="/api/auth", tags=["Auth"])
@@ -46,6 +91,8 @@ app.include_router(analysis.router, prefix="/api/analysis", tags=["Analysis"])
 app.include_router(ocr.router, prefix="/api/ocr", tags=["OCR"])
 app.include_router(chatbot.router, prefix="/api/chatbot", tags=["Chatbot"])
 app.include_router(chat_history.router, prefix="/api/chat-history", tags=["Chat History"])
+app.include_router(documents.router, prefix="/api/documents", tags=["Documents"])
+app.include_router(debug.router, prefix="/api/debug", tags=["Debug"])
 
 @app.get("/")
 def read_root():
@@ -54,3 +101,8 @@ def read_root():
 @app.get("/api/health")
 def health():
     return {"status": "ok"}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
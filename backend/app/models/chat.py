@@ -0,0 +1,24 @@
+# backend/app/models/chat.py
+
+from datetime import datetime
+from sqlalchemy import Column, String, DateTime, JSON, PrimaryKeyConstraint, Index
+
+from app.core.database import Base
+
+# --- SQLAlchemy Model ---
+# One row per saved conversation; messages are stored as a JSON list of
+# {"sender", "text"} objects, the shape the frontend sends.
+class ChatConversationDB(Base):
+    __tablename__ = "chat_conversations"
+
+    user_id = Column(String, nullable=False)
+    id = Column(String, nullable=False)  # client-generated conversation id
+    title = Column(String, nullable=False, default="")
+    messages = Column(JSON, nullable=False, default=list)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("user_id", "id"),
+        Index("ix_chat_conversations_user_updated", "user_id", "updated_at"),
+    )
@@ -0,0 +1,76 @@
+# backend/app/models/job.py
+
+from datetime import datetime
+from sqlalchemy import Column, String, Float, Boolean, Integer, Text, DateTime, JSON
+from pydantic import BaseModel, field_validator
+from typing import Optional, Dict, Any
+
+from app.core.database import Base
+
+# --- Job states ---
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+ACTIVE_JOB_STATES = (JOB_QUEUED, JOB_RUNNING)
+FINISHED_JOB_STATES = (JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED)
+
+# --- SQLAlchemy Model ---
+# One row per background training / model-build job.
+# Worker processes update progress on the row, the API polls it.
+class TrainingJobDB(Base):
+    __tablename__ = "training_jobs"
+
+    id = Column(String, primary_key=True, index=True)
+    user_id = Column(String, index=True, nullable=False)
+    kind = Column(String, nullable=False)  # see job_service.JOB_RUNNERS
+    status = Column(String, index=True, nullable=False, default=JOB_QUEUED)
+    progress = Column(Float, nullable=False, default=0.0)  # 0.0 .. 1.0
+    message = Column(String, nullable=False, default="")
+    params = Column(JSON, nullable=False, default=dict)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    owner_pid = Column(Integer, nullable=True)  # web process that queued the job
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+# --- Pydantic Models ---
+
+# Job params shown to clients; the rest (file paths, backend URLs) stay server-side
+PUBLIC_JOB_PARAMS = (
+    "base_model", "new_model_name", "filename", "document_id", "lora_config",
+    "max_examples", "token_budget", "sample_examples", "num_pairs", "holdout_fraction",
+    "num_examples", "seed", "max_pairs", "concurrency", "max_tokens", "include_schema",
+)
+
+class TrainingJob(BaseModel):
+    id: str
+    kind: str
+    status: str
+    progress: float
+    message: str
+    params: Dict[str, Any]
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    cancel_requested: bool
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    @field_validator("params", mode="before")
+    @classmethod
+    def _public_params(cls, params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        params = params or {}
+        public = {k: params[k] for k in PUBLIC_JOB_PARAMS if k in params}
+        if params.get("candidates"):
+            public["candidates"] = [
+                {"model": c.get("model"), "adapter": c.get("adapter")} for c in params["candidates"]
+            ]
+        return public
+
+    class Config:
+        from_attributes = True
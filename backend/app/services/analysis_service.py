@@ -1,17 +1,35 @@
 # backend/app/api/analysis.py
-from fastapi import APIRouter, UploadFile, File, Depends
-from typing import Any, Dict
-import pandas as pd
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from typing import Any, Dict, List, Tuple, TYPE_CHECKING
 import io
+import logging
+import os
 from app.api.auth import require_auth_user
 
+if TYPE_CHECKING:
+    import numpy as np  # heavy: imported inside the functions that need it
+    import pandas as pd
+
 router = APIRouter()
 
+VEGA_LITE_SCHEMA = "https://vega.github.io/schema/vega-lite/v5.json"
+# Chart specs carry at most this many data points (bars, line vertices, heatmap cells)
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", "2000"))
+CHART_AGGREGATES = ("sum", "mean", "count", "min", "max")
+# Bar charts show the largest categories; the rest are one "Other" bar
+CHART_MAX_BARS = 50
+# Scatter plots past max_points become a density heatmap of at most
+# max_points bins, this many times wider than tall
+SCATTER_BIN_ASPECT = 1.5
+
+
 @router.post("/upload-csv")
 async def analyze_csv(file: UploadFile = File(...), user=Depends(require_auth_user)) -> Dict[str, Any]:
     """
     Protected. User uploads CSV, we do a tiny summary.
     """
+    import pandas as pd
+
     content = await file.read()
     df = pd.read_csv(io.BytesIO(content))
 
@@ -24,3 +42,216 @@ async def analyze_csv(file: UploadFile = File(...), user=Depends(require_auth_us
         "preview_rows": preview,
         "summary": summary,
     }
+
+
+# --- Helpers used by app/api/analysis.py ---
+
+def read_excel_to_dataframe(buffer: io.BytesIO) -> "pd.DataFrame":
+    """Read the first sheet of an .xlsx/.xls upload."""
+    import pandas as pd
+
+    return pd.read_excel(buffer)
+
+
+def create_chart_from_dataframe(
+    df: "pd.DataFrame",
+    x_axis_col: str,
+    y_axis_col: str,
+    chart_type: str = "bar",
+) -> io.BytesIO:
+    """Render a bar/line/scatter chart of two columns to an in-memory PNG."""
+    import matplotlib
+    matplotlib.use("Agg")  # no display in the container
+    import matplotlib.pyplot as plt
+    # Numeric-looking labels on a bar chart are intended, not worth an INFO line each
+    logging.getLogger("matplotlib.category").setLevel(logging.WARNING)
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    try:
+        if chart_type == "line":
+            ax.plot(df[x_axis_col], df[y_axis_col])
+        elif chart_type == "scatter":
+            ax.scatter(df[x_axis_col], df[y_axis_col])
+        else:
+            ax.bar(df[x_axis_col].astype(str), df[y_axis_col])
+        ax.set_xlabel(x_axis_col)
+        ax.set_ylabel(y_axis_col)
+        ax.set_title(f"{y_axis_col} by {x_axis_col}")
+        fig.autofmt_xdate()
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="png", bbox_inches="tight")
+    finally:
+        plt.close(fig)
+    buffer.seek(0)
+    return buffer
+
+
+# --- Client-rendered charts (Vega-Lite) ---
+
+def build_chart_spec(
+    df: "pd.DataFrame",
+    x_axis_col: str,
+    y_axis_col: str,
+    chart_type: str = "bar",
+    aggregate: str = "sum",
+    max_points: int = CHART_MAX_POINTS,
+) -> Dict[str, Any]:
+    """
+    Vega-Lite spec for the same charts as create_chart_from_dataframe, with
+    data reduced to at most max_points points so the browser renders it:
+      bar      y aggregated per x value (largest CHART_MAX_BARS, then "Other")
+      line     sorted by x; past max_points, the min and max of each bucket
+               of consecutive points (keeps peaks, unlike plain sampling)
+      scatter  past max_points, a count heatmap of at most max_points bins
+    Data uses fields "x" / "y" (column names can contain characters that
+    Vega-Lite field names can't); "usermeta" says how the rows were reduced.
+    A y column with non-numeric values is a 400 (except for bar counts).
+    """
+    import numpy as np
+    import pandas as pd
+
+    x = df[x_axis_col]
+    y = pd.to_numeric(df[y_axis_col], errors="coerce")
+    if not (chart_type == "bar" and aggregate == "count"):
+        invalid = df[y_axis_col][y.isna() & df[y_axis_col].notna()]
+        if len(invalid):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Column '{y_axis_col}' must be numeric; {len(invalid)} value(s) are not "
+                       f"(first: {str(invalid.iloc[0])[:50]!r})",
+            )
+    if chart_type == "bar":
+        values, x_type, reduction = _bar_values(x, y, aggregate)
+        mark = "bar"
+    else:
+        keep = x.notna().to_numpy() & np.isfinite(y.to_numpy(dtype="float64", na_value=np.nan))
+        x, y = x[keep], y[keep].to_numpy(dtype="float64")
+        x_values, x_type = _axis_values(x)
+        if chart_type == "line":
+            order = np.argsort(x_values, kind="stable") if x_type != "nominal" else np.arange(len(y))
+            x_values, y = x_values[order], y[order]
+            idx, reduction = _minmax_indices(y, max_points)
+            values, mark = _records(_labels(x_values[idx], x_type), y[idx]), "line"
+        elif len(y) > max_points and x_type != "nominal":
+            return _heatmap_spec(x_values, y, x_type, x_axis_col, y_axis_col, len(df), max_points)
+        else:
+            idx = np.arange(len(y))
+            reduction = "none"
+            if len(y) > max_points:  # categorical x: no 2-D bins, use a seeded sample
+                idx = np.sort(np.random.default_rng(0).choice(len(y), max_points, replace=False))
+                reduction = "sample"
+            values, mark = _records(_labels(x_values[idx], x_type), y[idx]), "point"
+
+    y_title = y_axis_col if chart_type != "bar" else f"{aggregate}({y_axis_col})" if aggregate != "count" else "count"
+    return {
+        "$schema": VEGA_LITE_SCHEMA,
+        "title": f"{y_axis_col} by {x_axis_col}",
+        "data": {"values": values},
+        "mark": {"type": mark, "tooltip": True},
+        "encoding": {
+            "x": {"field": "x", "type": x_type, "title": x_axis_col,
+                  **({"sort": None} if x_type == "nominal" else {})},  # keep the data's order
+            "y": {"field": "y", "type": "quantitative", "title": y_title},
+        },
+        "usermeta": {"rows": int(len(df)), "points": len(values), "reduction": reduction},
+    }
+
+
+def _bar_values(x: "pd.Series", y: "pd.Series", aggregate: str) -> Tuple[List[Dict[str, Any]], str, str]:
+    """Aggregate y per category, in first-seen order; overflow categories become "Other"."""
+    import pandas as pd
+
+    if aggregate == "count":
+        grouped = x.value_counts(sort=False)
+    else:
+        grouped = y.groupby(x, sort=False).agg(aggregate).dropna()
+    reduction = "aggregate"
+    if len(grouped) > CHART_MAX_BARS:
+        top = grouped.nlargest(CHART_MAX_BARS - 1)
+        rest = ~x.isin(top.index)
+        other = rest.sum() if aggregate == "count" else y[rest].agg(aggregate)
+        grouped = pd.concat([top, pd.Series([other], index=["Other"])])
+        reduction = "aggregate_top"
+    labels = grouped.index.astype(str).to_numpy(dtype=object)  # group on raw values, label once
+    return _records(labels, grouped.to_numpy(dtype="float64")), "nominal", reduction
+
+
+def _axis_values(x: "pd.Series") -> Tuple["np.ndarray", str]:
+    """x as something sortable / binnable: float64 (numbers), int64 ns (dates) or strings."""
+    import numpy as np
+    import pandas as pd
+
+    if pd.api.types.is_datetime64_any_dtype(x):
+        return x.to_numpy(dtype="datetime64[ns]").astype(np.int64), "temporal"
+    if pd.api.types.is_numeric_dtype(x) and not pd.api.types.is_bool_dtype(x):
+        return x.to_numpy(dtype="float64"), "quantitative"
+    return x.astype(str).to_numpy(dtype=object), "nominal"
+
+
+def _labels(values: "np.ndarray", x_type: str) -> "np.ndarray":
+    """Axis values as JSON-friendly scalars (ISO timestamps for dates)."""
+    import numpy as np
+
+    if x_type == "temporal":
+        return np.datetime_as_string(values.astype("datetime64[ns]"), unit="s")
+    return values
+
+
+def _minmax_indices(y: "np.ndarray", max_points: int) -> Tuple["np.ndarray", str]:
+    """Row indices keeping the min and max of each of max_points/2 buckets, plus both ends."""
+    import numpy as np
+
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n), "none"
+    buckets = max(max_points // 2, 1)
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    blocks = padded.reshape(buckets, size)
+    filled = ~np.isnan(blocks).all(axis=1)  # the last buckets can be all padding
+    starts = np.arange(buckets)[filled] * size
+    lo = starts + np.nanargmin(blocks[filled], axis=1)
+    hi = starts + np.nanargmax(blocks[filled], axis=1)
+    return np.unique(np.concatenate(([0, n - 1], lo, hi))), "minmax"
+
+
+def _records(xs: "np.ndarray", ys: "np.ndarray") -> List[Dict[str, Any]]:
+    return [{"x": x, "y": y} for x, y in zip(xs.tolist(), ys.tolist())]
+
+
+def _scatter_bins(max_points: int) -> Tuple[int, int]:
+    """(x bins, y bins) around sqrt(max_points) per axis, with at most max_points cells."""
+    x_bins = max(int((max_points * SCATTER_BIN_ASPECT) ** 0.5), 1)
+    return x_bins, max(max_points // x_bins, 1)
+
+
+def _heatmap_spec(x_values: "np.ndarray", y: "np.ndarray", x_type: str,
+                  x_title: str, y_title: str, rows: int, max_points: int) -> Dict[str, Any]:
+    """Scatter too dense to draw point by point: counts over a 2-D grid of bins."""
+    import numpy as np
+
+    counts, x_edges, y_edges = np.histogram2d(x_values.astype("float64"), y, bins=_scatter_bins(max_points))
+    xi, yi = np.nonzero(counts)
+    x0, x1 = x_edges[xi], x_edges[xi + 1]
+    if x_type == "temporal":
+        x0, x1 = (_labels(e.astype(np.int64), x_type) for e in (x0, x1))
+    values = [
+        {"x": a, "x2": b, "y": c, "y2": d, "count": int(n)}
+        for a, b, c, d, n in zip(x0.tolist(), x1.tolist(), y_edges[yi].tolist(),
+                                 y_edges[yi + 1].tolist(), counts[xi, yi].tolist())
+    ]
+    return {
+        "$schema": VEGA_LITE_SCHEMA,
+        "title": f"{y_title} by {x_title}",
+        "data": {"values": values},
+        "mark": {"type": "rect", "tooltip": True},
+        "encoding": {
+            "x": {"field": "x", "type": x_type, "title": x_title},
+            "x2": {"field": "x2"},
+            "y": {"field": "y", "type": "quantitative", "title": y_title},
+            "y2": {"field": "y2"},
+            "color": {"field": "count", "type": "quantitative", "title": "rows"},
+        },
+        "usermeta": {"rows": int(rows), "points": len(values), "reduction": "bin2d"},
+    }
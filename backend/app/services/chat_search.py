@@ -0,0 +1,225 @@
+# backend/app/services/chat_search.py
+"""
+Full-text search over saved chat conversations.
+
+On SQLite the `chat_search` FTS5 table holds one row per conversation
+(title + all message text). It is rewritten in the same transaction as the
+conversation on every save, so it never drifts from chat_conversations, and
+backfilled once when the table is first created. Rows are keyed by a rowid
+derived from (user_id, conversation id), so replacing one is a rowid
+delete rather than a scan of the unindexed columns. Each row carries an
+indexed owner token, so a search only intersects posting lists for the
+caller's conversations instead of filtering every user's matches.
+Results are ranked with BM25 (title weighted CHAT_SEARCH_TITLE_WEIGHT times
+the messages) and come with HTML-escaped title and message snippets, with
+<mark>…</mark> around matches.
+
+Other databases, or SQLite builds without FTS5, fall back to a LIKE scan of
+the caller's conversations.
+"""
+import hashlib
+import html
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import String, cast, func, or_, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import IS_SQLITE
+from app.models.chat import ChatConversationDB
+
+CHAT_SEARCH_TITLE_WEIGHT = float(os.getenv("CHAT_SEARCH_TITLE_WEIGHT", "5.0"))
+# Words of context in a snippet
+SNIPPET_TOKENS = 16
+HIGHLIGHT_OPEN, HIGHLIGHT_CLOSE = "<mark>", "</mark>"
+# What FTS5 wraps matches in; swapped for the tags after escaping the text
+_SENTINEL_OPEN, _SENTINEL_CLOSE = "\x02", "\x03"
+MAX_QUERY_TERMS = 16
+
+# Set by ensure_index() at startup
+fts_enabled = False
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+_CREATE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS chat_search USING fts5("
+    "owner, conv_id UNINDEXED, title, body, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+
+
+def owner_token(user_id: str) -> str:
+    return "u" + hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:16]
+
+
+def conversation_rowid(user_id: str, conv_id: str) -> int:
+    """Stable 63-bit rowid for a conversation's search row."""
+    digest = hashlib.sha256(f"{user_id}\0{conv_id}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") & (2 ** 63 - 1)
+
+
+def message_body(messages: List[Dict[str, Any]]) -> str:
+    return "\n".join(str(m.get("text", "")) for m in messages or [])
+
+
+def fts_query(query: str) -> Optional[str]:
+    """
+    User input -> FTS5 expression: every word must match, the last one as a
+    prefix (search-as-you-type). Words are quoted, so operators are literal.
+    """
+    terms = _TERM.findall(query)[:MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    quoted = [f'"{t}"' for t in terms]
+    quoted[-1] += "*"
+    return " AND ".join(quoted)
+
+
+def ensure_index(engine) -> None:
+    """Create (and on first creation, fill) the FTS table. Called from the lifespan."""
+    global fts_enabled
+    if not IS_SQLITE:
+        logging.info("[CHAT SEARCH] not on SQLite, search scans conversations with LIKE")
+        return
+    raw = engine.raw_connection()
+    try:
+        conn = raw.driver_connection
+        isolation_level = conn.isolation_level
+        conn.isolation_level = None  # explicit BEGIN/COMMIT below
+        conn.create_function("owner_token", 1, owner_token, deterministic=True)
+        conn.create_function("conversation_rowid", 2, conversation_rowid, deterministic=True)
+        # Write lock for create + backfill, so concurrent workers can't both fill it
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            columns = [row[1] for row in conn.execute("PRAGMA table_xinfo(chat_search)")]
+            if "user_id" in columns:
+                # Earlier layout without rowid keys: rebuild it
+                logging.info("[CHAT SEARCH] rebuilding search index keyed by conversation")
+                conn.execute("DROP TABLE chat_search")
+            conn.execute(_CREATE)
+            conn.execute(
+                "INSERT INTO chat_search (rowid, owner, conv_id, title, body) "
+                "SELECT conversation_rowid(c.user_id, c.id), owner_token(c.user_id), c.id, c.title, "
+                "coalesce((SELECT group_concat(json_extract(m.value, '$.text'), char(10)) "
+                "FROM json_each(c.messages) AS m), '') "
+                "FROM chat_conversations AS c WHERE NOT EXISTS (SELECT 1 FROM chat_search)"
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.isolation_level = isolation_level
+        fts_enabled = True
+    except Exception as e:
+        logging.warning(f"⚠ [CHAT SEARCH] FTS5 unavailable ({e}), search scans conversations with LIKE")
+    finally:
+        raw.close()
+
+
+async def index_conversation(db: AsyncSession, user_id: str, conv_id: str, title: str,
+                             messages: List[Dict[str, Any]]) -> None:
+    """Replace the conversation's search row; part of the caller's transaction."""
+    if not fts_enabled:
+        return
+    rowid = conversation_rowid(user_id, conv_id)
+    await db.execute(text("DELETE FROM chat_search WHERE rowid = :rowid"), {"rowid": rowid})
+    await db.execute(
+        text("INSERT INTO chat_search (rowid, owner, conv_id, title, body) "
+             "VALUES (:rowid, :owner, :conv_id, :title, :body)"),
+        {"rowid": rowid, "owner": owner_token(user_id), "conv_id": conv_id,
+         "title": title, "body": message_body(messages)},
+    )
+
+
+async def search(db: AsyncSession, user_id: str, query: str, limit: int, offset: int) -> Dict[str, Any]:
+    """{"total", "results": [{"id", "title", "title_highlight", "snippet", "score", "updated_at"}]}"""
+    expression = fts_query(query)
+    if expression is None:
+        return {"total": 0, "results": []}
+    if not fts_enabled:
+        return await _search_like(db, user_id, query, limit, offset)
+
+    match = f'owner : "{owner_token(user_id)}" AND {{title body}} : ({expression})'
+    total = (await db.execute(
+        text("SELECT count(*) FROM chat_search WHERE chat_search MATCH :match"), {"match": match}
+    )).scalar_one()
+    # No join here: FTS5 only keeps the top LIMIT rows (and builds their
+    # snippets) when ranking a plain MATCH query
+    rows = (await db.execute(
+        text(
+            "SELECT conv_id, title, "
+            "highlight(chat_search, 2, :open, :close) AS title_highlight, "
+            "snippet(chat_search, 3, :open, :close, '…', :tokens) AS snippet, "
+            "bm25(chat_search, 0, 0, :title_weight, 1.0) AS score "
+            "FROM chat_search WHERE chat_search MATCH :match "
+            "ORDER BY score LIMIT :limit OFFSET :offset"
+        ),
+        {"match": match, "open": _SENTINEL_OPEN, "close": _SENTINEL_CLOSE, "tokens": SNIPPET_TOKENS,
+         "title_weight": CHAT_SEARCH_TITLE_WEIGHT, "limit": limit, "offset": offset},
+    )).all()
+    updated = dict((await db.execute(
+        select(ChatConversationDB.id, ChatConversationDB.updated_at).where(
+            ChatConversationDB.user_id == user_id, ChatConversationDB.id.in_([r.conv_id for r in rows])
+        )
+    )).all()) if rows else {}
+    return {
+        "total": total,
+        "results": [
+            {"id": r.conv_id, "title": r.title, "title_highlight": _marked_html(r.title_highlight),
+             "snippet": _marked_html(r.snippet), "score": round(-r.score, 4), "updated_at": updated.get(r.conv_id)}
+            for r in rows
+        ],
+    }
+
+
+def _marked_html(value: str) -> str:
+    """Escape text whose matches are wrapped in sentinels, then turn those into <mark> tags."""
+    return (html.escape(value or "")
+            .replace(_SENTINEL_OPEN, HIGHLIGHT_OPEN)
+            .replace(_SENTINEL_CLOSE, HIGHLIGHT_CLOSE))
+
+
+def _highlight(value: str, terms: List[str]) -> str:
+    value = value.replace(_SENTINEL_OPEN, "").replace(_SENTINEL_CLOSE, "")
+    pattern = re.compile("|".join(re.escape(t) for t in terms), re.IGNORECASE)
+    return _marked_html(pattern.sub(lambda m: f"{_SENTINEL_OPEN}{m.group(0)}{_SENTINEL_CLOSE}", value))
+
+
+def _snippet(body: str, terms: List[str]) -> str:
+    lower = body.lower()
+    hit = min((i for i in (lower.find(t.lower()) for t in terms) if i >= 0), default=0)
+    start = max(0, hit - 60)
+    end = min(len(body), hit + 120)
+    return ("…" if start else "") + _highlight(body[start:end], terms) + ("…" if end < len(body) else "")
+
+
+def _like_pattern(term: str) -> str:
+    """Substring LIKE pattern matching term literally (escape character "\\")."""
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+async def _search_like(db: AsyncSession, user_id: str, query: str, limit: int, offset: int) -> Dict[str, Any]:
+    """Fallback without FTS5: every word must appear in the title or the messages."""
+    terms = _TERM.findall(query)[:MAX_QUERY_TERMS]
+    conditions = [
+        or_(ChatConversationDB.title.ilike(_like_pattern(t), escape="\\"),
+            cast(ChatConversationDB.messages, String).ilike(_like_pattern(t), escape="\\"))
+        for t in terms
+    ]
+    base = select(ChatConversationDB).where(ChatConversationDB.user_id == user_id, *conditions)
+    total = (await db.execute(select(func.count()).select_from(base.subquery()))).scalar_one()
+    convs = (await db.execute(
+        base.order_by(ChatConversationDB.updated_at.desc()).limit(limit).offset(offset)
+    )).scalars().all()
+    return {
+        "total": total,
+        "results": [
+            {"id": c.id, "title": c.title, "title_highlight": _highlight(c.title, terms),
+             "snippet": _snippet(message_body(c.messages), terms), "score": None, "updated_at": c.updated_at}
+            for c in convs
+        ],
+    }
@@ -0,0 +1,299 @@
+# backend/app/services/dataset_dedup.py
+"""
+Exact and near-duplicate removal for training datasets.
+
+Records are streamed in batches. Each record gets a 64-bit hash of its
+normalized text (exact duplicates) and a MinHash signature over word
+shingles. Signatures are split into LSH bands to find candidates; a
+candidate only counts as a near duplicate if the Jaccard similarity
+estimated from the signatures reaches the threshold. Shingling, MinHash,
+band lookups and the similarity check are vectorized in NumPy per batch.
+
+Memory is bounded per *kept* record: one uint64 exact key, one uint32 key
+and uint32 id per band, and a 1-byte-per-permutation signature (b-bit
+MinHash), about 200 bytes with the defaults, all in NumPy arrays rather
+than Python sets. The first occurrence of a record is kept, so output
+order follows input order.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import zlib
+from typing import Any, Dict, IO, Iterable, Iterator, List
+
+import numpy as np
+
+# Records per vectorized batch, and a cap on the batch's text size: the
+# MinHash matrix is num_perm x (shingles in batch) uint64s (~40 MB at 400k chars)
+BATCH_SIZE = 4096
+MAX_BATCH_CHARS = 400_000
+# Word n-gram size for shingles
+SHINGLE_SIZE = 3
+# 64 permutations in 16 bands of 4 rows: pairs above ~0.6 Jaccard almost always
+# share a band; candidates are then checked against JACCARD_THRESHOLD
+NUM_PERM = 64
+NUM_BANDS = 16
+JACCARD_THRESHOLD = 0.8
+# Rough chars-per-token ratio used for savings estimates
+CHARS_PER_TOKEN = 4
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def record_text(rec: Any) -> str:
+    """The text a record contributes to training."""
+    if isinstance(rec, str):
+        return rec
+    if isinstance(rec, dict):
+        if "question" in rec or "answer" in rec:
+            return f"{rec.get('question', '')}\n{rec.get('answer', '')}"
+        return str(rec.get("text", ""))
+    return str(rec)
+
+
+def _exact_key(text: str) -> int:
+    normalized = " ".join(text.lower().split())
+    return int.from_bytes(hashlib.blake2b(normalized.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class DedupStats:
+    """Filled in while a dataset is being deduplicated."""
+
+    def __init__(self):
+        self.total = 0
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+        self.total_chars = 0
+        self.dropped_chars = 0
+
+    @property
+    def kept(self) -> int:
+        return self.total - self.exact_duplicates - self.near_duplicates
+
+    def as_dict(self) -> Dict[str, Any]:
+        dropped = self.exact_duplicates + self.near_duplicates
+        return {
+            "total": self.total,
+            "kept": self.kept,
+            "dropped": dropped,
+            "exact_duplicates": self.exact_duplicates,
+            "near_duplicates": self.near_duplicates,
+            "estimated_tokens_saved": self.dropped_chars // CHARS_PER_TOKEN,
+            # training time scales with tokens, so this is also the share of time saved
+            "estimated_time_saved_pct": round(100.0 * self.dropped_chars / self.total_chars, 2)
+            if self.total_chars else 0.0,
+        }
+
+
+class _SortedKeyIndex:
+    """
+    Map of integer keys -> record ids in sorted arrays, plus an unsorted tail
+    that is merged in once it grows past a fraction of the main arrays.
+    The first id stored for a key wins.
+    """
+
+    def __init__(self, dtype=np.uint64):
+        self._dtype = dtype
+        self._keys = np.empty(0, dtype=dtype)
+        self._ids = np.empty(0, dtype=np.uint32)
+        self._tail: List[tuple] = []
+        self._tail_len = 0
+
+    def __len__(self) -> int:
+        return len(self._keys) + self._tail_len
+
+    def _merge(self) -> None:
+        if not self._tail:
+            return
+        keys = np.concatenate([self._keys] + [k for k, _ in self._tail])
+        ids = np.concatenate([self._ids] + [i for _, i in self._tail])
+        order = np.argsort(keys, kind="stable")
+        keys, ids = keys[order], ids[order]
+        _, first = np.unique(keys, return_index=True)
+        self._keys, self._ids = keys[first], ids[first]
+        self._tail, self._tail_len = [], 0
+
+    def lookup(self, keys: np.ndarray) -> np.ndarray:
+        """Stored id per key (int64, -1 when absent), same shape as keys."""
+        self._merge()
+        flat = keys.ravel().astype(self._dtype, copy=False)
+        if not len(self._keys):
+            return np.full(keys.shape, -1, dtype=np.int64)
+        pos = np.searchsorted(self._keys, flat)
+        pos[pos == len(self._keys)] = 0
+        found = self._keys[pos] == flat
+        return np.where(found, self._ids[pos].astype(np.int64), -1).reshape(keys.shape)
+
+    def add(self, keys: np.ndarray, ids: np.ndarray) -> None:
+        keys = keys.ravel().astype(self._dtype, copy=False)
+        self._tail.append((keys, np.broadcast_to(ids, keys.shape).astype(np.uint32)))
+        self._tail_len += keys.size
+        if self._tail_len > max(65536, len(self._keys) // 8):
+            self._merge()
+
+
+class _SignatureStore:
+    """Append-only uint8 matrix of b-bit signatures, grown by doubling."""
+
+    def __init__(self, width: int):
+        self._data = np.empty((1024, width), dtype=np.uint8)
+        self.count = 0
+
+    def append(self, rows: np.ndarray) -> np.ndarray:
+        n = len(rows)
+        while self.count + n > len(self._data):
+            self._data = np.concatenate([self._data, np.empty_like(self._data)])
+        ids = np.arange(self.count, self.count + n, dtype=np.uint32)
+        self._data[self.count:self.count + n] = rows
+        self.count += n
+        return ids
+
+    def __getitem__(self, ids: np.ndarray) -> np.ndarray:
+        return self._data[ids]
+
+
+def _estimated_jaccard(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Jaccard estimate from 8-bit MinHash signatures along the last axis."""
+    match = (a == b).mean(axis=-1)
+    return np.clip((match - 1 / 256) / (1 - 1 / 256), 0.0, 1.0)
+
+
+class MinHashDeduper:
+    """Streaming exact + MinHash/LSH near-duplicate filter."""
+
+    def __init__(self, num_perm: int = NUM_PERM, bands: int = NUM_BANDS,
+                 threshold: float = JACCARD_THRESHOLD, shingle_size: int = SHINGLE_SIZE, seed: int = 0):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        # multiply-shift hash family: h(x) = (a*x + b) >> 32 with odd a
+        self._a = rng.integers(1, 2**63, size=(num_perm, 1), dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2**63, size=(num_perm, 1), dtype=np.uint64)
+        self._band_mix = rng.integers(1, 2**63, size=(self.rows,), dtype=np.uint64) | np.uint64(1)
+        self._band_salt = rng.integers(0, 2**63, size=(bands,), dtype=np.uint64)
+        self._shingle_mix = np.array(
+            [pow(0x9E3779B97F4A7C15, i, 2**64) for i in range(shingle_size)], dtype=np.uint64
+        )
+        self._exact = _SortedKeyIndex(np.uint64)
+        self._bands_index = _SortedKeyIndex(np.uint32)
+        self._signatures = _SignatureStore(num_perm)
+        self.stats = DedupStats()
+
+    def _minhash(self, texts: List[str]) -> np.ndarray:
+        """(n, num_perm) uint32 MinHash signatures for a batch."""
+        k = self.shingle_size
+        word_lists = []
+        for text in texts:
+            words = [zlib.crc32(w.encode("utf-8")) for w in _WORD.findall(text.lower())]
+            if len(words) < k:
+                words += [0] * (k - len(words))  # short texts still get one shingle
+            word_lists.append(words)
+        lengths = np.fromiter((len(w) for w in word_lists), dtype=np.int64, count=len(texts))
+        words = np.fromiter((w for ws in word_lists for w in ws), dtype=np.uint64, count=int(lengths.sum()))
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+        # shingles over the concatenated batch, dropping windows that cross records
+        with np.errstate(over="ignore"):
+            windows = np.lib.stride_tricks.sliding_window_view(words, k)
+            shingles = (windows * self._shingle_mix).sum(axis=1, dtype=np.uint64)
+            record_of = np.repeat(np.arange(len(texts)), lengths)
+            valid = record_of[: len(shingles)] == record_of[k - 1:]
+            shingles = shingles[valid]
+            offsets = starts - np.arange(len(texts)) * (k - 1)  # each record loses k-1 windows
+            hashed = (self._a * shingles + self._b) >> np.uint64(32)  # (num_perm, total)
+        return np.minimum.reduceat(hashed, offsets, axis=1).T.astype(np.uint32)
+
+    def filter_batch(self, records: List[Any]) -> List[Any]:
+        """Records of this batch that are not duplicates of anything seen so far."""
+        texts = [record_text(r) for r in records]
+        n = len(texts)
+        exact = np.fromiter((_exact_key(t) for t in texts), dtype=np.uint64, count=n)
+        signatures = self._minhash(texts)
+        with np.errstate(over="ignore"):
+            bands = signatures.astype(np.uint64).reshape(n, self.bands, self.rows)
+            band_keys = ((bands * self._band_mix).sum(axis=2, dtype=np.uint64) ^ self._band_salt) >> np.uint64(32)
+        small = (signatures & 0xFF).astype(np.uint8)
+
+        # exact: seen before, or an earlier record of this batch has the same key
+        is_exact = self._exact.lookup(exact) >= 0
+        _, first = np.unique(exact, return_index=True)
+        earlier = np.ones(n, dtype=bool)
+        earlier[first] = False
+        is_exact |= earlier
+
+        # near: a band candidate (stored, or earlier in the batch) that is similar enough
+        cand = self._bands_index.lookup(band_keys)  # (n, bands) stored ids
+        has = cand >= 0
+        sim = np.zeros(cand.shape)
+        if has.any():
+            sim[has] = _estimated_jaccard(self._signatures[cand[has]], np.repeat(small, self.bands, axis=0)[has.ravel()])
+        is_near = (sim >= self.threshold).any(axis=1)
+        flat = band_keys.ravel()
+        _, first_pos, inverse = np.unique(flat, return_index=True, return_inverse=True)
+        first_row = (first_pos // self.bands)[inverse.ravel()].reshape(n, self.bands)
+        in_batch = first_row < np.arange(n)[:, None]
+        if in_batch.any():
+            rows_i, cols_i = np.nonzero(in_batch)
+            close = _estimated_jaccard(small[rows_i], small[first_row[rows_i, cols_i]]) >= self.threshold
+            is_near[rows_i[close]] = True
+        is_near &= ~is_exact
+
+        keep = ~(is_exact | is_near)
+        ids = self._signatures.append(small[keep])
+        self._exact.add(exact[keep], ids)
+        self._bands_index.add(band_keys[keep], np.repeat(ids, self.bands))
+
+        lengths = np.fromiter((len(t) for t in texts), dtype=np.int64, count=n)
+        self.stats.total += n
+        self.stats.exact_duplicates += int(is_exact.sum())
+        self.stats.near_duplicates += int(is_near.sum())
+        self.stats.total_chars += int(lengths.sum())
+        self.stats.dropped_chars += int(lengths[~keep].sum())
+        return [r for r, k in zip(records, keep) if k]
+
+    def filter(self, records: Iterable[Any], batch_size: int = BATCH_SIZE) -> Iterator[Any]:
+        batch: List[Any] = []
+        batch_chars = 0
+        for rec in records:
+            batch.append(rec)
+            batch_chars += len(record_text(rec))
+            if len(batch) >= batch_size or batch_chars >= MAX_BATCH_CHARS:
+                yield from self.filter_batch(batch)
+                batch, batch_chars = [], 0
+        if batch:
+            yield from self.filter_batch(batch)
+
+
+def dedup_to_jsonl(records: Iterable[Any], out_path: str, **kwargs) -> Dict[str, Any]:
+    """
+    Write the deduplicated records to out_path as JSONL (atomically).
+    Strings are written as {"text": ...}. Returns DedupStats.as_dict().
+    """
+    deduper = MinHashDeduper(**kwargs)
+    tmp_path = f"{out_path}.{os.getpid()}.part"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as out:
+            _write_records(deduper.filter(records), out)
+        os.replace(tmp_path, out_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    stats = deduper.stats.as_dict()
+    logging.info(
+        f"[DEDUP] kept {stats['kept']}/{stats['total']} "
+        f"({stats['exact_duplicates']} exact, {stats['near_duplicates']} near duplicates, "
+        f"~{stats['estimated_time_saved_pct']}% training time saved)"
+    )
+    return stats
+
+
+def _write_records(records: Iterable[Any], out: IO[str]) -> None:
+    for rec in records:
+        out.write(json.dumps({"text": rec} if isinstance(rec, str) else rec, ensure_ascii=False))
+        out.write("\n")
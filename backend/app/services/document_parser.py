@@ -0,0 +1,291 @@
+# backend/app/services/document_parser.py
+"""
+Parsing of training uploads (PDF, DOCX, XLSX, TXT) into normalized text chunks.
+
+A document is split into units of work (a range of PDF pages, one worksheet,
+the whole DOCX body) that are parsed in a process pool; the resulting chunks
+are streamed in document order to a JSONL file of {"text", "source"} records.
+Output is cached by the file's content hash, so training again on the same
+upload skips parsing entirely.
+
+JSON/JSONL uploads are already records and are not handled here.
+"""
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+PARSE_CACHE_DIR = os.getenv("PARSE_CACHE_DIR", "/code/parse_cache")
+# Disk budget for cached parses; least recently used files go first
+PARSE_CACHE_MAX_MB = int(os.getenv("PARSE_CACHE_MAX_MB", "1024"))
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+# PDF pages handed to a worker at once (each worker opens the PDF once per range)
+PDF_PAGES_PER_TASK = 16
+# Target chunk size in characters (~500 tokens)
+CHUNK_CHARS = 2000
+# Bump when parsing/normalization changes so old cache entries are ignored
+PARSER_VERSION = 1
+
+PARSED_EXTENSIONS = {".pdf", ".docx", ".xlsx", ".txt", ".md", ".csv"}
+
+ProgressCallback = Callable[[float, str], None]
+# (extension, path, unit index, unit argument) -> [(source label, text chunk), ...]
+Unit = Tuple[str, str, int, object]
+
+_WHITESPACE = re.compile(r"[ \t ]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def normalize_text(text: str) -> str:
+    """NFKC, unified newlines, collapsed runs of spaces and blank lines, no control chars."""
+    text = unicodedata.normalize("NFKC", text or "")
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = "".join(ch for ch in text if ch == "\n" or ch == "\t" or unicodedata.category(ch)[0] != "C")
+    text = "\n".join(_WHITESPACE.sub(" ", line).strip() for line in text.split("\n"))
+    return _BLANK_LINES.sub("\n\n", text).strip()
+
+
+def chunk_text(text: str, size: int = CHUNK_CHARS) -> List[str]:
+    """Split on paragraph boundaries into chunks of at most ~size characters."""
+    chunks: List[str] = []
+    buf: List[str] = []
+    buf_len = 0
+    for para in text.split("\n\n"):
+        if not para:
+            continue
+        while len(para) > size:  # a single huge paragraph: hard split
+            if buf:
+                chunks.append("\n\n".join(buf))
+                buf, buf_len = [], 0
+            cut = para.rfind(" ", 0, size)
+            cut = cut if cut > size // 2 else size
+            chunks.append(para[:cut].strip())
+            para = para[cut:].strip()
+        if buf and buf_len + len(para) + 2 > size:
+            chunks.append("\n\n".join(buf))
+            buf, buf_len = [], 0
+        buf.append(para)
+        buf_len += len(para) + 2
+    if buf:
+        chunks.append("\n\n".join(buf))
+    return chunks
+
+
+# --- Workers (run in the process pool, must stay importable top-level functions) ---
+
+def _parse_pdf_pages(path: str, pages: Tuple[int, int]) -> List[Tuple[str, str]]:
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    out: List[Tuple[str, str]] = []
+    for page_no in range(*pages):
+        try:
+            text = reader.pages[page_no].extract_text() or ""
+        except Exception as e:  # one broken page shouldn't sink the document
+            logging.warning(f"[PARSE] {os.path.basename(path)} page {page_no + 1}: {e}")
+            continue
+        out.extend((f"page {page_no + 1}", chunk) for chunk in chunk_text(normalize_text(text)))
+    return out
+
+
+def _parse_xlsx_sheet(path: str, sheet_name: str) -> List[Tuple[str, str]]:
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb[sheet_name].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return []
+        header = [str(h).strip() if h is not None else f"column {i + 1}" for i, h in enumerate(header)]
+        lines = []
+        for row in rows:
+            cells = [f"{h}: {v}" for h, v in zip(header, row) if v is not None and str(v).strip()]
+            if cells:
+                lines.append(", ".join(cells))
+    finally:
+        wb.close()
+    # one row per line, rows grouped into chunks
+    return [(f"sheet {sheet_name}", c) for c in chunk_text(normalize_text("\n\n".join(lines)))]
+
+
+def _parse_docx(path: str) -> List[Tuple[str, str]]:
+    import docx
+
+    document = docx.Document(path)
+    parts = [p.text for p in document.paragraphs]
+    for table in document.tables:
+        for row in table.rows:
+            parts.append(" | ".join(cell.text.strip() for cell in row.cells))
+    return [("document", c) for c in chunk_text(normalize_text("\n\n".join(parts)))]
+
+
+def _parse_unit(unit: Unit) -> List[Tuple[str, str]]:
+    ext, path, _index, arg = unit
+    if ext == ".pdf":
+        return _parse_pdf_pages(path, arg)
+    if ext == ".xlsx":
+        return _parse_xlsx_sheet(path, arg)
+    if ext == ".docx":
+        return _parse_docx(path)
+    raise ValueError(f"No parser for {ext}")
+
+
+# --- Planning / caching ---
+
+def _plan_units(path: str, ext: str) -> Tuple[List[Unit], str]:
+    """Split a document into independently parseable units; returns (units, unit label)."""
+    if ext == ".pdf":
+        from pypdf import PdfReader
+
+        n_pages = len(PdfReader(path).pages)
+        ranges = [(s, min(s + PDF_PAGES_PER_TASK, n_pages)) for s in range(0, n_pages, PDF_PAGES_PER_TASK)]
+        return [(ext, path, i, r) for i, r in enumerate(ranges)], f"{n_pages} pages"
+    if ext == ".xlsx":
+        from openpyxl import load_workbook
+
+        wb = load_workbook(path, read_only=True)
+        try:
+            sheets = list(wb.sheetnames)
+        finally:
+            wb.close()
+        return [(ext, path, i, s) for i, s in enumerate(sheets)], f"{len(sheets)} sheets"
+    if ext == ".docx":
+        # python-docx parses the whole body at once; there is nothing to split
+        return [(ext, path, 0, None)], "1 document"
+    raise ValueError(f"Unsupported document type: {ext}")
+
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cache_path_for(digest: str) -> str:
+    return os.path.join(PARSE_CACHE_DIR, f"{digest}.v{PARSER_VERSION}.jsonl")
+
+
+def _prune_cache(keep: str) -> None:
+    """Drop least recently used cache files until the cache fits PARSE_CACHE_MAX_MB."""
+    try:
+        entries = [
+            os.path.join(PARSE_CACHE_DIR, name)
+            for name in os.listdir(PARSE_CACHE_DIR)
+            if name.endswith(".jsonl")
+        ]
+        stats = sorted(((os.stat(p), p) for p in entries), key=lambda sp: sp[0].st_mtime)
+    except OSError:
+        return
+    total = sum(st.st_size for st, _ in stats)
+    limit = PARSE_CACHE_MAX_MB * 1024 * 1024
+    for st, p in stats:
+        if total <= limit:
+            break
+        if p == keep:
+            continue
+        try:
+            os.remove(p)
+            total -= st.st_size
+        except OSError:
+            pass
+
+
+def _iter_text_file(path: str) -> Iterator[Tuple[str, str]]:
+    """Plain text is read line by line in-process; paragraphs are grouped into chunks."""
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        paragraph: List[str] = []
+        pending: List[str] = []
+        pending_len = 0
+        for line in f:
+            if line.strip():
+                paragraph.append(line.rstrip())
+                continue
+            if paragraph:
+                pending.append("\n".join(paragraph))
+                pending_len += sum(len(l) for l in paragraph)
+                paragraph = []
+            if pending_len >= CHUNK_CHARS:
+                yield from (("text", c) for c in chunk_text(normalize_text("\n\n".join(pending))))
+                pending, pending_len = [], 0
+        if paragraph:
+            pending.append("\n".join(paragraph))
+        if pending:
+            yield from (("text", c) for c in chunk_text(normalize_text("\n\n".join(pending))))
+
+
+def _iter_parsed(path: str, ext: str, progress_cb: Optional[ProgressCallback]) -> Iterator[Tuple[str, str]]:
+    report = progress_cb or (lambda _p, _m: None)
+    name = os.path.basename(path)
+    if ext not in (".pdf", ".xlsx", ".docx"):
+        report(0.0, f"Reading {name}")
+        yield from _iter_text_file(path)
+        return
+
+    units, label = _plan_units(path, ext)
+    report(0.0, f"Parsing {name} ({label})")
+    if len(units) <= 1 or PARSE_WORKERS <= 1:
+        results: Iterable[List[Tuple[str, str]]] = map(_parse_unit, units)
+        executor = None
+    else:
+        # spawn for the same reason as job_service: no forking of threaded parents
+        executor = ProcessPoolExecutor(
+            max_workers=min(PARSE_WORKERS, len(units)),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        results = executor.map(_parse_unit, units)
+    try:
+        for done, chunks in enumerate(results, start=1):
+            yield from chunks
+            report(done / len(units), f"Parsed {done}/{len(units)} parts of {name}")
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def parse_to_jsonl(path: str, progress_cb: Optional[ProgressCallback] = None) -> Dict[str, object]:
+    """
+    Parse a document into a cached JSONL file of {"text", "source"} records.
+    Returns {"path", "chunks", "cached", "digest"}; raises ValueError for
+    unsupported types.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in PARSED_EXTENSIONS:
+        raise ValueError(f"Unsupported document type: {ext or 'no extension'}")
+
+    digest = file_digest(path)
+    out_path = cache_path_for(digest)
+    if os.path.exists(out_path):
+        os.utime(out_path)  # mark as recently used
+        with open(out_path, "rb") as f:
+            count = sum(1 for _ in f)
+        logging.info(f"[PARSE] cache hit for {os.path.basename(path)} ({count} chunks)")
+        if progress_cb:
+            progress_cb(1.0, f"Using cached parse of {os.path.basename(path)}")
+        return {"path": out_path, "chunks": count, "cached": True, "digest": digest}
+
+    os.makedirs(PARSE_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{out_path}.{os.getpid()}.part"
+    count = 0
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as out:
+            for source, text in _iter_parsed(path, ext, progress_cb):
+                if not text:
+                    continue
+                out.write(json.dumps({"text": text, "source": source}, ensure_ascii=False))
+                out.write("\n")
+                count += 1
+        os.replace(tmp_path, out_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    _prune_cache(keep=out_path)
+    logging.info(f"✅ [PARSE] {os.path.basename(path)}: {count} chunks -> {out_path}")
+    return {"path": out_path, "chunks": count, "cached": False, "digest": digest}
@@ -0,0 +1,409 @@
+# backend/app/services/job_service.py
+"""
+Background job subsystem for model builds, adapter training and evaluations.
+
+Jobs are persisted in the `training_jobs` table and executed in a small
+process pool, so a long `ollama create` or training run never ties up a
+request thread. Workers report progress by updating the job row; the API
+reads it back. Cancellation is cooperative: the API sets `cancel_requested`
+and the worker stops at its next progress report.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, Future
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from app.core.database import SessionLocal
+from app.core.metrics import register_stats_source
+from app.models.job import (
+    TrainingJobDB,
+    JOB_QUEUED,
+    JOB_RUNNING,
+    JOB_SUCCEEDED,
+    JOB_FAILED,
+    JOB_CANCELLED,
+    ACTIVE_JOB_STATES,
+)
+
+# --- Configuration ---
+# Keep the pool small: training shares the box with inference.
+MAX_WORKERS = int(os.getenv("TRAINING_MAX_WORKERS", "2"))
+MAX_ACTIVE_JOBS_PER_USER = int(os.getenv("TRAINING_MAX_JOBS_PER_USER", "1"))
+MAX_QUEUED_JOBS = int(os.getenv("TRAINING_MAX_QUEUED_JOBS", "20"))
+# Worker processes run at a lower CPU priority than the web workers.
+WORKER_NICE = int(os.getenv("TRAINING_WORKER_NICE", "10"))
+# Minimum seconds between progress writes for the same job.
+PROGRESS_WRITE_INTERVAL = 0.5
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+_futures: Dict[str, Future] = {}
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker when the job was cancelled by the user."""
+
+
+# --- Worker side ---
+
+class JobContext:
+    """Handed to job runners so they can report progress and honour cancellation."""
+
+    def __init__(self, db: Session, job: TrainingJobDB):
+        self.db = db
+        self.job = job
+        self._last_write = 0.0
+
+    def report(self, progress: float, message: str = "") -> None:
+        """Persist progress (throttled) and raise JobCancelled if requested."""
+        now = time.monotonic()
+        progress = max(0.0, min(1.0, float(progress)))
+        changed = message and message != self.job.message
+        if changed or progress >= 1.0 or now - self._last_write >= PROGRESS_WRITE_INTERVAL:
+            self.job.progress = progress
+            if message:
+                self.job.message = message
+            self.db.commit()
+            self._last_write = now
+        self.check_cancelled()
+
+    def check_cancelled(self) -> None:
+        self.db.refresh(self.job, attribute_names=["cancel_requested"])
+        if self.job.cancel_requested:
+            raise JobCancelled(self.job.id)
+
+
+def _discard(path: Optional[str]) -> None:
+    """Remove a job's input file once the runner is done with it."""
+    if path:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _run_create_model(params: Dict[str, Any], ctx: JobContext) -> Dict[str, Any]:
+    from app.services import training_service
+
+    try:
+        return training_service.create_custom_model_from_data(
+            base_model=params["base_model"],
+            custom_model_name=params["new_model_name"],
+            training_file_path=params.get("file_path"),
+            qa_path=params.get("qa_path"),
+            progress_cb=ctx.report,
+            ollama_host=params.get("ollama_host"),
+            max_examples=params.get("max_examples"),
+            token_budget=params.get("token_budget"),
+            sample_examples=params.get("sample_examples", False),
+        )
+    finally:
+        _discard(params.get("qa_path"))
+        _discard(params.get("file_path"))
+
+
+def _run_train_adapter(params: Dict[str, Any], ctx: JobContext) -> Dict[str, Any]:
+    from app.services import training_service
+
+    try:
+        return training_service.train_lora_adapter_from_file(
+            base_model=params["base_model"],
+            custom_model_name=params["new_model_name"],
+            training_file_path=params["file_path"],
+            progress_cb=ctx.report,
+            config=params.get("lora_config"),
+        )
+    finally:
+        _discard(params["file_path"])
+
+
+def _run_train_sql_adapter(params: Dict[str, Any], ctx: JobContext) -> Dict[str, Any]:
+    from app.services import training_service
+
+    try:
+        return training_service.train_sql_lora_adapter(
+            base_model=params["base_model"],
+            custom_model_name=params["new_model_name"],
+            qa_path=params["qa_path"],
+            progress_cb=ctx.report,
+            config=params.get("lora_config"),
+        )
+    finally:
+        _discard(params["qa_path"])
+
+
+def _run_evaluate_sql(params: Dict[str, Any], ctx: JobContext) -> Dict[str, Any]:
+    from app.services import sql_eval
+
+    try:
+        return sql_eval.evaluate_sql_models(
+            schema=params["schema"],
+            candidates=params["candidates"],
+            qa_path=params.get("qa_path"),
+            num_examples=params.get("num_examples", 200),
+            seed=params.get("seed", 0),
+            holdout_fraction=params.get("holdout_fraction", 0.2),
+            max_pairs=params.get("max_pairs", 200),
+            concurrency=params.get("concurrency", sql_eval.SQL_EVAL_CONCURRENCY),
+            max_tokens=params.get("max_tokens", 128),
+            include_schema=params.get("include_schema", True),
+            progress_cb=ctx.report,
+        )
+    finally:
+        _discard(params.get("qa_path"))
+
+
+def _run_index_document(params: Dict[str, Any], ctx: JobContext) -> Dict[str, Any]:
+    from app.services import retrieval_index
+
+    try:
+        return retrieval_index.index_document(
+            user_id=ctx.job.user_id,
+            file_path=params["file_path"],
+            filename=params["filename"],
+            document_id=params.get("document_id"),
+            progress_cb=ctx.report,
+        )
+    finally:
+        _discard(params["file_path"])
+
+
+JOB_RUNNERS: Dict[str, Callable[[Dict[str, Any], JobContext], Dict[str, Any]]] = {
+    "create_model": _run_create_model,
+    "train_adapter": _run_train_adapter,
+    "train_sql_adapter": _run_train_sql_adapter,
+    "index_document": _run_index_document,
+    "evaluate_sql": _run_evaluate_sql,
+}
+
+
+def _worker_init():
+    """Runs once in every pool process."""
+    try:
+        os.nice(WORKER_NICE)
+    except (AttributeError, OSError):
+        pass
+
+
+def _execute_job(job_id: str) -> None:
+    """Entry point inside a worker process."""
+    db = SessionLocal()
+    try:
+        job = db.get(TrainingJobDB, job_id)
+        if job is None:
+            logging.error(f"[JOBS] job {job_id} vanished before it could run")
+            return
+        if job.status != JOB_QUEUED:
+            return  # cancelled (or picked up elsewhere) while waiting in the queue
+        if job.cancel_requested:
+            job.status = JOB_CANCELLED
+            job.finished_at = datetime.utcnow()
+            db.commit()
+            return
+
+        job.status = JOB_RUNNING
+        job.started_at = datetime.utcnow()
+        job.message = "Starting"
+        db.commit()
+
+        ctx = JobContext(db, job)
+        try:
+            result = JOB_RUNNERS[job.kind](dict(job.params or {}), ctx)
+        except JobCancelled:
+            db.rollback()
+            job.status = JOB_CANCELLED
+            job.message = "Cancelled"
+            logging.info(f"[JOBS] job {job_id} cancelled")
+        except Exception as e:
+            db.rollback()
+            logging.error(f"❌ [JOBS] job {job_id} failed: {e}", exc_info=True)
+            job.status = JOB_FAILED
+            job.error = str(e)
+            job.message = "Failed"
+        else:
+            job.status = JOB_SUCCEEDED
+            job.progress = 1.0
+            job.result = result
+            job.message = "Done"
+            logging.info(f"✅ [JOBS] job {job_id} finished")
+        job.finished_at = datetime.utcnow()
+        db.commit()
+    finally:
+        db.close()
+
+
+# --- Web process side ---
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: never fork a process that is running an event loop and threads
+            _executor = ProcessPoolExecutor(
+                max_workers=MAX_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_worker_init,
+            )
+        return _executor
+
+
+def shutdown_executor() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def _queue_stats():
+    """Active jobs across all web workers (from the DB) and this process' futures."""
+    db = SessionLocal()
+    try:
+        counts = dict(
+            db.query(TrainingJobDB.status, func.count())
+            .filter(TrainingJobDB.status.in_(ACTIVE_JOB_STATES))
+            .group_by(TrainingJobDB.status)
+            .all()
+        )
+    finally:
+        db.close()
+    jobs = GaugeMetricFamily("training_jobs", "Training jobs by state", labels=["status"])
+    for status in ACTIVE_JOB_STATES:
+        jobs.add_metric([status], counts.get(status, 0))
+    yield jobs
+    yield GaugeMetricFamily(
+        "training_executor_futures", "Jobs submitted to this process' worker pool and not finished",
+        value=len(_futures),
+    )
+    yield GaugeMetricFamily("training_max_queued_jobs", "Queue capacity", value=MAX_QUEUED_JOBS)
+
+
+register_stats_source(_queue_stats)
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def fail_orphaned_jobs(db: Session) -> int:
+    """
+    Mark active jobs whose owning web process is gone as failed.
+    Called on startup so stale rows don't count against user limits.
+    """
+    orphans = [
+        job
+        for job in db.query(TrainingJobDB).filter(TrainingJobDB.status.in_(ACTIVE_JOB_STATES))
+        if not _pid_alive(job.owner_pid)
+    ]
+    for job in orphans:
+        job.status = JOB_FAILED
+        job.error = "Interrupted by a server restart"
+        job.finished_at = datetime.utcnow()
+    if orphans:
+        db.commit()
+        logging.warning(f"[JOBS] marked {len(orphans)} orphaned job(s) as failed")
+    return len(orphans)
+
+
+def submit_job(db: Session, user_id: str, kind: str, params: Dict[str, Any]) -> TrainingJobDB:
+    """Persist a new job and queue it on the worker pool. Returns immediately."""
+    if kind not in JOB_RUNNERS:
+        raise HTTPException(status_code=400, detail=f"Unknown job kind '{kind}'")
+
+    # The limits are checked after inserting the row, inside the same
+    # transaction: on SQLite the insert holds the write lock until commit,
+    # on PostgreSQL an advisory lock serializes submits per user. Either
+    # way concurrent submits see each other's rows and can't both get in.
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": f"training_jobs:{user_id}"})
+    job = TrainingJobDB(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        kind=kind,
+        status=JOB_QUEUED,
+        progress=0.0,
+        message="Queued",
+        params=params,
+        owner_pid=os.getpid(),
+    )
+    db.add(job)
+    db.flush()
+
+    active_for_user = (
+        db.query(TrainingJobDB)
+        .filter(TrainingJobDB.user_id == user_id, TrainingJobDB.status.in_(ACTIVE_JOB_STATES))
+        .count()
+    )
+    if active_for_user > MAX_ACTIVE_JOBS_PER_USER:
+        db.rollback()
+        raise HTTPException(
+            status_code=429,
+            detail=f"You already have {active_for_user - 1} active training job(s). "
+                   f"Wait for it to finish or cancel it first.",
+        )
+
+    queued_total = db.query(TrainingJobDB).filter(TrainingJobDB.status == JOB_QUEUED).count()
+    if queued_total > MAX_QUEUED_JOBS:
+        db.rollback()
+        raise HTTPException(status_code=503, detail="Training queue is full, try again later")
+
+    db.commit()
+    db.refresh(job)
+
+    future = _get_executor().submit(_execute_job, job.id)
+    _futures[job.id] = future
+    future.add_done_callback(lambda _f, job_id=job.id: _futures.pop(job_id, None))
+
+    logging.info(f"[JOBS] queued {kind} job {job.id} for user={user_id}")
+    return job
+
+
+def get_job(db: Session, job_id: str, user_id: str) -> TrainingJobDB:
+    job = db.get(TrainingJobDB, job_id)
+    if job is None or job.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+def list_jobs(db: Session, user_id: str, limit: int = 50) -> List[TrainingJobDB]:
+    return (
+        db.query(TrainingJobDB)
+        .filter(TrainingJobDB.user_id == user_id)
+        .order_by(TrainingJobDB.created_at.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def cancel_job(db: Session, job: TrainingJobDB) -> TrainingJobDB:
+    """Request cancellation. Queued jobs are dropped at once, running ones stop at their next checkpoint."""
+    if job.status not in ACTIVE_JOB_STATES:
+        return job
+
+    job.cancel_requested = True
+    future = _futures.get(job.id)
+    if job.status == JOB_QUEUED and (future is None or future.cancel()):
+        job.status = JOB_CANCELLED
+        job.message = "Cancelled"
+        job.finished_at = datetime.utcnow()
+    db.commit()
+    db.refresh(job)
+    return job
@@ -0,0 +1,64 @@
+# backend/app/services/lora_config.py
+"""
+LoRA training settings and the base models that may be trained. Kept
+apart from lora_trainer (which imports torch) so the API can validate a
+job before queueing it.
+"""
+import json
+import os
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, ConfigDict
+
+# Ollama tag -> Hugging Face repo id / local path. Extend with LORA_BASE_MODELS='{"tag": "org/repo"}'.
+# Only these checkpoints are ever downloaded or loaded for training.
+BASE_MODEL_MAP: Dict[str, str] = {
+    "smollm2:135m": "HuggingFaceTB/SmolLM2-135M-Instruct",
+    "smollm2:360m": "HuggingFaceTB/SmolLM2-360M-Instruct",
+    "qwen2.5:0.5b": "Qwen/Qwen2.5-0.5B-Instruct",
+    "qwen2.5:1.5b": "Qwen/Qwen2.5-1.5B-Instruct",
+    "tinyllama": "TinyLlama/TinyLlama-1.1B-Chat-v1.0",
+    "llama3.2:1b": "meta-llama/Llama-3.2-1B-Instruct",
+}
+BASE_MODEL_MAP.update(json.loads(os.getenv("LORA_BASE_MODELS", "{}")))
+
+
+def resolve_base_model(base_model: str) -> str:
+    """Ollama tag (or a checkpoint listed in BASE_MODEL_MAP) -> Hugging Face id/path."""
+    if base_model in BASE_MODEL_MAP:
+        return BASE_MODEL_MAP[base_model]
+    if base_model in BASE_MODEL_MAP.values():
+        return base_model
+    raise ValueError(
+        f"No trainable checkpoint known for '{base_model}'. "
+        f"Known: {', '.join(sorted(BASE_MODEL_MAP))} (extend via LORA_BASE_MODELS)."
+    )
+
+
+class LoraTrainingConfig(BaseModel):
+    model_config = ConfigDict(extra="forbid")  # a misspelt setting is an error, not a default
+
+    # Adapter shape (matches loras/TEST-1/adapter_config.json)
+    r: int = 8
+    lora_alpha: int = 16
+    lora_dropout: float = 0.0
+    target_modules: List[str] = ["q_proj", "v_proj"]
+    # Optimisation
+    seq_len: int = 512
+    micro_batch_size: int = 1
+    grad_accum_steps: int = 8
+    epochs: int = 1
+    max_steps: Optional[int] = None
+    learning_rate: float = 2e-4
+    weight_decay: float = 0.0
+    warmup_steps: int = 10
+    max_grad_norm: float = 1.0
+    gradient_checkpointing: bool = True
+    bf16: bool = False  # CPU autocast; only worth it on CPUs with AVX512-BF16/AMX
+    # Dataset preparation (applied by training_service before tokenizing)
+    dedup: bool = True
+    dedup_threshold: float = 0.8  # estimated Jaccard above which records count as copies
+    # Housekeeping
+    checkpoint_every: int = 25  # optimizer steps
+    num_threads: Optional[int] = None
+    seed: int = 0
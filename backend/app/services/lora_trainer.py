@@ -0,0 +1,377 @@
+# backend/app/services/lora_trainer.py
+"""
+CPU LoRA fine-tuning for small causal language models.
+
+Ollama serves GGUF files, which can't be trained directly, so each Ollama base
+model is mapped to its Hugging Face checkpoint (LORA_BASE_MODELS). The base
+weights stay frozen; rank-r adapters are injected into the attention
+projections and trained with packed sequences, gradient accumulation and
+gradient checkpointing. Training state is checkpointed so an interrupted or
+cancelled job resumes where it stopped. The result is written as
+<name>/<name>.safetensors plus adapter_config.json (PEFT naming), the layout
+Ollama's ADAPTER directive reads.
+
+transformers/safetensors are imported lazily: only the training worker needs them.
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+import struct
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import torch
+from torch import nn
+
+from app.services.lora_config import (  # noqa: F401  (re-exported)
+    BASE_MODEL_MAP, LoraTrainingConfig, resolve_base_model,
+)
+
+# Refuse base models larger than this on CPU (checked before downloading weights)
+MAX_BASE_PARAMS = float(os.getenv("LORA_MAX_BASE_PARAMS", "2e9"))
+# Cores left free for the web process / inference
+RESERVED_CORES = int(os.getenv("LORA_RESERVED_CORES", "1"))
+CHECKPOINT_DIRNAME = ".checkpoints"
+
+ProgressCallback = Callable[[float, str], None]
+
+
+class LoraLinear(nn.Module):
+    """y = W x + (alpha / r) * B A x, with W frozen and A, B trainable."""
+
+    def __init__(self, base: nn.Linear, r: int, alpha: int, dropout: float):
+        super().__init__()
+        self.base = base
+        self.scaling = alpha / r
+        self.lora_A = nn.Linear(base.in_features, r, bias=False)
+        self.lora_B = nn.Linear(r, base.out_features, bias=False)
+        self.dropout = nn.Dropout(dropout) if dropout > 0 else nn.Identity()
+        nn.init.kaiming_uniform_(self.lora_A.weight, a=math.sqrt(5))
+        nn.init.zeros_(self.lora_B.weight)
+
+    def forward(self, x):
+        return self.base(x) + self.lora_B(self.lora_A(self.dropout(x))) * self.scaling
+
+
+def lr_multiplier(step: int, warmup_steps: int, total_steps: int) -> float:
+    """
+    Linear warmup to the configured rate, then linear decay to 0. Runs no
+    longer than the warmup skip it (small datasets), so the rate never
+    exceeds the configured one.
+    """
+    warmup = warmup_steps if total_steps > warmup_steps else 0
+    if step < warmup:
+        return (step + 1) / warmup
+    return max(0.0, (total_steps - step) / max(1, total_steps - warmup))
+
+
+def _safetensors_params(path: str) -> int:
+    """Parameter count from a .safetensors header, without reading the tensors."""
+    with open(path, "rb") as f:
+        (header_len,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_len))
+    return sum(math.prod(t["shape"]) for name, t in header.items() if name != "__metadata__")
+
+
+def checkpoint_param_count(base_path: str) -> int:
+    """
+    Parameters of a checkpoint from its safetensors headers: read locally for
+    a directory or a Hub repo already in the local cache, otherwise fetched
+    as metadata (a few KB) from the Hub.
+    """
+    from huggingface_hub import get_safetensors_metadata, snapshot_download
+
+    local = base_path
+    if not os.path.isdir(local):
+        try:
+            local = snapshot_download(base_path, local_files_only=True)
+        except Exception:
+            local = None  # not cached yet
+    if local:
+        files = [os.path.join(local, n) for n in os.listdir(local) if n.endswith(".safetensors")]
+        if files:
+            return sum(_safetensors_params(f) for f in files)
+        if local == base_path:
+            raise ValueError(f"{base_path} has no .safetensors weights to size-check")
+    try:
+        metadata = get_safetensors_metadata(base_path)
+    except Exception as e:
+        raise ValueError(f"Could not read the size of {base_path} before downloading it: {e}") from e
+    return sum(metadata.parameter_count.values())
+
+
+def check_base_model_size(base_model: str, base_path: str) -> int:
+    n_params = checkpoint_param_count(base_path)
+    if n_params > MAX_BASE_PARAMS:
+        raise ValueError(
+            f"{base_model} has {n_params / 1e9:.1f}B parameters; CPU training is limited to "
+            f"{MAX_BASE_PARAMS / 1e9:.1f}B (LORA_MAX_BASE_PARAMS)"
+        )
+    return n_params
+
+
+def configure_torch_threads(num_threads: Optional[int] = None) -> int:
+    """Use the cores this process may run on, minus RESERVED_CORES for inference."""
+    if num_threads is None:
+        try:
+            available = len(os.sched_getaffinity(0))
+        except AttributeError:
+            available = os.cpu_count() or 1
+        num_threads = max(1, available - RESERVED_CORES)
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # already fixed once parallel work has started in this process
+    return num_threads
+
+
+def inject_lora(model: nn.Module, cfg: LoraTrainingConfig) -> Dict[str, LoraLinear]:
+    """Freeze the model and wrap every targeted nn.Linear with a LoraLinear."""
+    for p in model.parameters():
+        p.requires_grad_(False)
+    targets = [
+        (name, module)
+        for name, module in model.named_modules()
+        if isinstance(module, nn.Linear) and name.rsplit(".", 1)[-1] in cfg.target_modules
+    ]
+    if not targets:
+        raise ValueError(f"None of {cfg.target_modules} found in the base model")
+    wrapped = {}
+    for name, module in targets:
+        parent_name, _, child = name.rpartition(".")
+        parent = model.get_submodule(parent_name) if parent_name else model
+        lora = LoraLinear(module, cfg.r, cfg.lora_alpha, cfg.lora_dropout)
+        setattr(parent, child, lora)
+        wrapped[name] = lora
+    return wrapped
+
+
+def lora_state_dict(wrapped: Dict[str, LoraLinear]) -> Dict[str, torch.Tensor]:
+    """Adapter weights under PEFT key names (base_model.model.<module>.lora_A.weight)."""
+    state = {}
+    for name, lora in wrapped.items():
+        state[f"base_model.model.{name}.lora_A.weight"] = lora.lora_A.weight.detach().contiguous()
+        state[f"base_model.model.{name}.lora_B.weight"] = lora.lora_B.weight.detach().contiguous()
+    return state
+
+
+def _load_lora_state(wrapped: Dict[str, LoraLinear], state: Dict[str, torch.Tensor]) -> None:
+    for name, lora in wrapped.items():
+        lora.lora_A.weight.data.copy_(state[f"base_model.model.{name}.lora_A.weight"])
+        lora.lora_B.weight.data.copy_(state[f"base_model.model.{name}.lora_B.weight"])
+
+
+def pack_tokens(texts: Iterable[str], tokenizer, seq_len: int) -> torch.Tensor:
+    """
+    Tokenize texts, join them with EOS and cut the stream into full
+    seq_len blocks (packed sequences: no padding, every token trains).
+    Returns an int32 tensor of shape (num_blocks, seq_len).
+    """
+    eos = tokenizer.eos_token_id
+    flat: List[int] = []
+    blocks: List[torch.Tensor] = []
+    for text in texts:
+        ids = tokenizer(text, add_special_tokens=False)["input_ids"]
+        flat.extend(ids)
+        if eos is not None:
+            flat.append(eos)
+        while len(flat) >= seq_len:
+            blocks.append(torch.tensor(flat[:seq_len], dtype=torch.int32))
+            del flat[:seq_len]
+    if flat and not blocks:
+        # Tiny dataset: keep one short block rather than nothing
+        blocks.append(torch.tensor(flat, dtype=torch.int32))
+    if not blocks:
+        raise ValueError("Training data is empty")
+    return torch.stack(blocks)
+
+
+def format_qa_pair(tokenizer, question: str, answer: str) -> str:
+    """Render one QA pair the way the model will see it at inference time."""
+    if getattr(tokenizer, "chat_template", None):
+        return tokenizer.apply_chat_template(
+            [{"role": "user", "content": question}, {"role": "assistant", "content": answer}],
+            tokenize=False,
+        )
+    return f"### Question:\n{question}\n### Answer:\n{answer}"
+
+
+def _fingerprint(base_path: str, cfg: LoraTrainingConfig, blocks: torch.Tensor) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(base_path.encode())
+    h.update(cfg.model_dump_json(exclude={"checkpoint_every", "num_threads"}).encode())
+    h.update(blocks.numpy().tobytes())
+    return h.hexdigest()
+
+
+def _atomic_torch_save(obj: Any, path: str) -> None:
+    tmp = f"{path}.tmp"
+    torch.save(obj, tmp)
+    os.replace(tmp, path)
+
+
+def train_lora(
+    base_model: str,
+    adapter_name: str,
+    output_root: str,
+    texts: Callable[[Any], Iterable[str]],
+    cfg: Optional[LoraTrainingConfig] = None,
+    progress_cb: Optional[ProgressCallback] = None,
+) -> Dict[str, Any]:
+    """
+    Train a LoRA adapter on CPU and write it to output_root/adapter_name/.
+    texts(tokenizer) must return the training texts (it gets the tokenizer so
+    QA pairs can be rendered with the model's chat template).
+    """
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    from safetensors.torch import save_file
+
+    cfg = cfg or LoraTrainingConfig()
+    report = progress_cb or (lambda _p, _m: None)
+    threads = configure_torch_threads(cfg.num_threads)
+    torch.manual_seed(cfg.seed)
+
+    base_path = resolve_base_model(base_model)
+    n_params = check_base_model_size(base_model, base_path)
+    report(0.01, f"Loading {base_path} ({n_params / 1e9:.2f}B parameters, {threads} threads)")
+    tokenizer = AutoTokenizer.from_pretrained(base_path)
+    model = AutoModelForCausalLM.from_pretrained(base_path, torch_dtype=torch.float32)
+    model.config.use_cache = False
+    if cfg.gradient_checkpointing and getattr(model, "supports_gradient_checkpointing", False):
+        model.gradient_checkpointing_enable(gradient_checkpointing_kwargs={"use_reentrant": False})
+    wrapped = inject_lora(model, cfg)
+    trainable = [p for lora in wrapped.values() for p in (lora.lora_A.weight, lora.lora_B.weight)]
+
+    report(0.03, "Tokenizing and packing training data")
+    blocks = pack_tokens(texts(tokenizer), tokenizer, cfg.seq_len)
+    n_blocks = blocks.shape[0]
+    micro_per_epoch = math.ceil(n_blocks / cfg.micro_batch_size)
+    steps_per_epoch = math.ceil(micro_per_epoch / cfg.grad_accum_steps)
+    total_steps = steps_per_epoch * cfg.epochs
+    if cfg.max_steps:
+        total_steps = min(total_steps, cfg.max_steps)
+
+    optimizer = torch.optim.AdamW(trainable, lr=cfg.learning_rate, weight_decay=cfg.weight_decay)
+    scheduler = torch.optim.lr_scheduler.LambdaLR(
+        optimizer, lambda s: lr_multiplier(s, cfg.warmup_steps, total_steps)
+    )
+
+    # --- Resume from checkpoint if one matches this exact run ---
+    ckpt_dir = os.path.join(output_root, CHECKPOINT_DIRNAME, adapter_name)
+    ckpt_path = os.path.join(ckpt_dir, "checkpoint.pt")
+    fingerprint = _fingerprint(base_path, cfg, blocks)
+    step, epoch, micro_start, tokens_done = 0, 0, 0, 0
+    if os.path.exists(ckpt_path):
+        ckpt = torch.load(ckpt_path, map_location="cpu", weights_only=False)
+        if ckpt.get("fingerprint") == fingerprint:
+            _load_lora_state(wrapped, ckpt["lora"])
+            optimizer.load_state_dict(ckpt["optimizer"])
+            scheduler.load_state_dict(ckpt["scheduler"])
+            step, epoch, micro_start = ckpt["step"], ckpt["epoch"], ckpt["micro"]
+            tokens_done = ckpt.get("tokens", 0)
+            logging.info(f"[LORA] resuming {adapter_name} at step {step}/{total_steps}")
+        else:
+            logging.info(f"[LORA] ignoring stale checkpoint for {adapter_name}")
+
+    def save_checkpoint(micro_next: int):
+        os.makedirs(ckpt_dir, exist_ok=True)
+        _atomic_torch_save(
+            {
+                "fingerprint": fingerprint,
+                "lora": lora_state_dict(wrapped),
+                "optimizer": optimizer.state_dict(),
+                "scheduler": scheduler.state_dict(),
+                "step": step,
+                "epoch": epoch,
+                "micro": micro_next,
+                "tokens": tokens_done,
+            },
+            ckpt_path,
+        )
+
+    report(0.05, f"Training on {n_blocks} packed blocks x {blocks.shape[1]} tokens, {total_steps} steps")
+    model.train()
+    autocast = torch.autocast("cpu", dtype=torch.bfloat16, enabled=cfg.bf16)
+    started = time.perf_counter()
+    session_tokens = 0
+    last_loss = float("nan")
+    resume_micro = micro_start  # first micro-batch after the last optimizer step
+    try:
+        while epoch < cfg.epochs and step < total_steps:
+            order = torch.randperm(n_blocks, generator=torch.Generator().manual_seed(cfg.seed + epoch))
+            micro = resume_micro = micro_start
+            while micro < micro_per_epoch and step < total_steps:
+                idx = order[micro * cfg.micro_batch_size:(micro + 1) * cfg.micro_batch_size]
+                batch = blocks[idx].long()
+                with autocast:
+                    loss = model(input_ids=batch, labels=batch).loss
+                (loss / cfg.grad_accum_steps).backward()
+                last_loss = loss.item()
+                session_tokens += batch.numel()
+                tokens_done += batch.numel()
+                micro += 1
+
+                if micro % cfg.grad_accum_steps == 0 or micro == micro_per_epoch:
+                    torch.nn.utils.clip_grad_norm_(trainable, cfg.max_grad_norm)
+                    optimizer.step()
+                    scheduler.step()
+                    optimizer.zero_grad(set_to_none=True)
+                    step += 1
+                    resume_micro = micro
+                    elapsed = time.perf_counter() - started
+                    tps = session_tokens / elapsed if elapsed > 0 else 0.0
+                    report(
+                        0.05 + 0.9 * step / total_steps,
+                        f"step {step}/{total_steps} loss {last_loss:.4f} {tps:.0f} tok/s",
+                    )
+                    if cfg.checkpoint_every and step % cfg.checkpoint_every == 0:
+                        save_checkpoint(micro)
+            epoch += 1
+            micro_start = 0
+    except BaseException:
+        # Cancelled or crashed: keep progress up to the last full step so a retry resumes
+        if step:
+            save_checkpoint(resume_micro)
+        raise
+
+    # --- Write adapter ---
+    elapsed = time.perf_counter() - started
+    out_dir = os.path.join(output_root, adapter_name)
+    os.makedirs(out_dir, exist_ok=True)
+    adapter_file = os.path.join(out_dir, f"{adapter_name}.safetensors")
+    save_file(lora_state_dict(wrapped), adapter_file, metadata={"format": "pt"})
+    adapter_config = {
+        "r": cfg.r,
+        "lora_alpha": cfg.lora_alpha,
+        "lora_dropout": cfg.lora_dropout,
+        "bias": "none",
+        "task_type": "CAUSAL_LM",
+        "peft_type": "LORA",
+        "target_modules": list(cfg.target_modules),
+        "base_model_name_or_path": base_path,
+    }
+    with open(os.path.join(out_dir, "adapter_config.json"), "w") as f:
+        json.dump(adapter_config, f, indent=2)
+    if os.path.exists(ckpt_path):
+        os.remove(ckpt_path)
+
+    tokens_per_sec = session_tokens / elapsed if elapsed > 0 else 0.0
+    logging.info(
+        f"✅ [LORA] {adapter_name}: {step} steps, {tokens_done} tokens, "
+        f"{tokens_per_sec:.0f} tok/s, final loss {last_loss:.4f}"
+    )
+    report(1.0, f"Adapter written ({tokens_per_sec:.0f} tok/s)")
+    return {
+        "adapter_dir": adapter_name,
+        "adapter_filename": os.path.relpath(adapter_file, output_root),
+        "base_model": base_model,
+        "base_checkpoint": base_path,
+        "steps": step,
+        "tokens": tokens_done,
+        "tokens_per_sec": round(tokens_per_sec, 1),
+        "final_loss": None if math.isnan(last_loss) else round(last_loss, 4),
+        "threads": threads,
+    }
@@ -0,0 +1,258 @@
+# backend/app/services/lora_variants.py
+"""
+On-demand Ollama models for (base model, LoRA adapter) pairs.
+
+The first prompt for a pair creates a variant model in Ollama: the adapter
+files are uploaded to Ollama's blob store and referenced in a structured
+/api/create request (`from` + `adapters`), so Ollama needs no access to
+LORA_DIR. Later prompts reuse the variant. Variants are
+named after the pair and a fingerprint of the adapter files, so replacing
+an adapter yields a new variant and the old one ages out.
+
+At most LORA_VARIANT_MAX variants are kept. When a new one is created the
+least recently used are deleted from Ollama, but never one used in the
+last LORA_VARIANT_MIN_IDLE_SECONDS, which could still be generating in
+another worker. The registry (registry.json) is shared by all workers under
+an flock; creating a variant holds a per-variant lock, so concurrent
+requests for the same pair, in any worker, wait for one creation instead
+of each building it.
+"""
+import asyncio
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Tuple
+
+from fastapi import HTTPException
+from prometheus_client.core import GaugeMetricFamily
+
+from app.core.metrics import register_stats_source
+from app.services import ollama_service
+from app.services.training_service import LORA_DIR
+
+LORA_VARIANT_DIR = os.getenv("LORA_VARIANT_DIR", "./data/lora_variants")
+LORA_VARIANT_MAX = int(os.getenv("LORA_VARIANT_MAX", "4"))
+LORA_VARIANT_MIN_IDLE_SECONDS = float(os.getenv("LORA_VARIANT_MIN_IDLE_SECONDS", "300"))
+# Minimum seconds between last_used writes for the same variant
+_TOUCH_INTERVAL = 30
+
+_SLUG = re.compile(r"[^a-z0-9]+")
+# Files of an adapter directory that Ollama's importer reads (not checkpoints etc.)
+ADAPTER_FILE_EXTENSIONS = (".safetensors", ".gguf", ".bin", ".json")
+
+# name -> when this worker last recorded a use (skips the registry on hot paths)
+_touched: Dict[str, float] = {}
+# (base, adapter) -> creation in progress in this worker
+_pending: Dict[Tuple[str, str], asyncio.Future] = {}
+_stats = {"hits": 0, "created": 0, "evicted": 0}
+
+
+def resolve_adapter(adapter: str) -> str:
+    """Adapter file or directory name in LORA_DIR -> its path."""
+    name = os.path.basename(adapter or "")
+    if not name or name != adapter or name.startswith("."):
+        raise HTTPException(status_code=400, detail="Invalid adapter name")
+    local = os.path.join(LORA_DIR, name)
+    if not os.path.exists(local):
+        raise HTTPException(status_code=404, detail=f"Adapter '{name}' not found")
+    return local
+
+
+def adapter_files(path: str) -> List[str]:
+    """The files to upload for an adapter: itself, or the adapter files of its directory."""
+    if not os.path.isdir(path):
+        return [path]
+    return sorted(
+        e.path for e in os.scandir(path)
+        if e.is_file() and not e.name.startswith(".") and e.name.lower().endswith(ADAPTER_FILE_EXTENSIONS)
+    )
+
+
+def adapter_fingerprint(path: str) -> str:
+    """Changes whenever the adapter's files are replaced."""
+    parts = []
+    for file in adapter_files(path):
+        st = os.stat(file)
+        parts.append(f"{os.path.basename(file)}:{st.st_size}:{st.st_mtime_ns}")
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def variant_name(base_model: str, adapter: str, fingerprint: str) -> str:
+    digest = hashlib.sha256(f"{base_model}\0{adapter}\0{fingerprint}".encode("utf-8")).hexdigest()[:10]
+    slug = _SLUG.sub("-", os.path.splitext(adapter)[0].lower()).strip("-")[:40] or "adapter"
+    return f"lora-{slug}-{digest}:latest"
+
+
+# --- Registry (shared by workers) ---
+
+def _registry_path() -> str:
+    return os.path.join(LORA_VARIANT_DIR, "registry.json")
+
+
+@contextmanager
+def _file_lock(name: str) -> Iterator[None]:
+    os.makedirs(LORA_VARIANT_DIR, exist_ok=True)
+    with open(os.path.join(LORA_VARIANT_DIR, name), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _read_registry() -> Dict[str, Dict[str, Any]]:
+    try:
+        with open(_registry_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _write_registry(registry: Dict[str, Dict[str, Any]]) -> None:
+    tmp = _registry_path() + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(registry, f, indent=1)
+    os.replace(tmp, _registry_path())
+
+
+@contextmanager
+def _registry() -> Iterator[Dict[str, Dict[str, Any]]]:
+    """The registry under the lock; changes made to it are written back."""
+    with _file_lock("registry.lock"):
+        registry = _read_registry()
+        before = json.dumps(registry, sort_keys=True)
+        yield registry
+        if json.dumps(registry, sort_keys=True) != before:
+            _write_registry(registry)
+
+
+def _touch(name: str) -> bool:
+    """Record a use; False if the variant is not in the registry."""
+    now = time.time()
+    if now - _touched.get(name, 0.0) < _TOUCH_INTERVAL:
+        return True
+    with _registry() as registry:
+        entry = registry.get(name)
+        if entry is None:
+            _touched.pop(name, None)
+            return False
+        entry["last_used"] = now
+    _touched[name] = now
+    return True
+
+
+def _evict(registry: Dict[str, Dict[str, Any]], keep: str) -> List[str]:
+    """Drop the least recently used idle variants beyond LORA_VARIANT_MAX; returns their names."""
+    now = time.time()
+    idle = sorted(
+        (n for n, e in registry.items()
+         if n != keep and now - e["last_used"] >= LORA_VARIANT_MIN_IDLE_SECONDS),
+        key=lambda n: registry[n]["last_used"],
+    )
+    excess = len(registry) - max(LORA_VARIANT_MAX, 1)
+    evicted = idle[:max(excess, 0)]
+    for name in evicted:
+        del registry[name]
+    if excess > len(evicted):
+        logging.info(f"[LORA VARIANTS] {len(registry)} variants kept (max {LORA_VARIANT_MAX}); the rest are in use")
+    return evicted
+
+
+def _create(name: str, base_model: str, local: str) -> None:
+    local_models = {m["name"] for m in ollama_service.list_local_models()}
+    if base_model not in local_models and f"{base_model}:latest" not in local_models:
+        # FROM an unknown model would make Ollama pull it
+        raise HTTPException(status_code=404, detail=f"Base model '{base_model}' is not available in Ollama")
+    files = adapter_files(local)
+    if not files:
+        raise HTTPException(status_code=422, detail="Adapter directory has no adapter files")
+    adapters = {os.path.basename(path): ollama_service.push_blob(path) for path in files}
+    try:
+        for _ in ollama_service.create_model(name, base_model, adapters=adapters):
+            pass
+    except RuntimeError as e:  # e.g. adapter doesn't match the base model's architecture
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+def ensure_variant(base_model: str, adapter: str) -> Tuple[str, bool]:
+    """
+    Name of the Ollama model for (base_model, adapter), creating it if needed.
+    Returns (name, created). Blocking: call from a worker thread.
+    """
+    local = resolve_adapter(adapter)
+    name = variant_name(base_model, adapter, adapter_fingerprint(local))
+    if _touch(name):
+        _stats["hits"] += 1
+        return name, False
+    # One creation per variant across workers; the others wait here and find it ready
+    with _file_lock(f"{hashlib.sha256(name.encode('utf-8')).hexdigest()[:16]}.lock"):
+        if _touch(name):
+            _stats["hits"] += 1
+            return name, False
+        started = time.perf_counter()
+        _create(name, base_model, local)
+        now = time.time()
+        with _registry() as registry:
+            registry[name] = {"base_model": base_model, "adapter": adapter, "created_at": now, "last_used": now}
+            evicted = _evict(registry, keep=name)
+        _touched[name] = now
+        _stats["created"] += 1
+        logging.info(f"🧩 [LORA VARIANTS] created {name} ({base_model} + {adapter}) in {time.perf_counter() - started:.1f}s")
+    for old in evicted:
+        _touched.pop(old, None)
+        _stats["evicted"] += 1
+        try:
+            ollama_service.delete_model(old)
+            logging.info(f"[LORA VARIANTS] deleted cold variant {old}")
+        except HTTPException as e:
+            logging.warning(f"⚠ [LORA VARIANTS] could not delete {old}: {e.detail}")
+    return name, True
+
+
+def forget(name: str) -> None:
+    """Drop a variant Ollama no longer has (e.g. its volume was reset); the next use recreates it."""
+    _touched.pop(name, None)
+    with _registry() as registry:
+        registry.pop(name, None)
+
+
+async def get_variant(base_model: str, adapter: str) -> Tuple[str, bool]:
+    """
+    Async ensure_variant. Concurrent calls for the same pair in this worker
+    share one creation.
+    """
+    key = (base_model, adapter)
+    future = _pending.get(key)
+    if future is None:
+        future = asyncio.ensure_future(asyncio.to_thread(ensure_variant, base_model, adapter))
+        _pending[key] = future
+
+        def done(f: asyncio.Future) -> None:
+            _pending.pop(key, None)
+            if not f.cancelled():
+                f.exception()  # counts as retrieved if every caller went away
+
+        future.add_done_callback(done)
+    return await asyncio.shield(future)  # the creation outlives a caller that went away
+
+
+def list_variants() -> List[Dict[str, Any]]:
+    """Registered variants, most recently used first."""
+    with _registry() as registry:
+        entries = [{"name": n, **e} for n, e in registry.items()]
+    return sorted(entries, key=lambda e: e["last_used"], reverse=True)
+
+
+def _variant_stats():
+    events = GaugeMetricFamily("lora_variant_events", "LoRA variant lookups and changes (this process)", labels=["event"])
+    for event, count in _stats.items():
+        events.add_metric([event], count)
+    yield events
+
+
+register_stats_source(_variant_stats)
@@ -0,0 +1,171 @@
+# backend/app/services/modelfile_builder.py
+"""
+Streaming few-shot example builder for Ollama models.
+
+iter_messages yields QA pairs as the "messages" of a structured /api/create
+request (see ollama_service.create_model) one at a time, so large datasets
+are never concatenated in memory. Budgets are estimated against the
+equivalent Modelfile text (FROM/SYSTEM header plus one MESSAGE
+user/assistant block per pair).
+
+Every MESSAGE pair becomes few-shot context that Ollama re-evaluates on each
+request, so the number of examples can be capped by count and by an
+estimated token budget, optionally with a seeded random sample.
+"""
+import os
+import random
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# Rough chars-per-token ratio for budget estimates (no tokenizer on the backend)
+CHARS_PER_TOKEN = 4
+# Default few-shot budget in estimated tokens; 0 disables the cap
+DEFAULT_TOKEN_BUDGET = int(os.getenv("MODELFILE_TOKEN_BUDGET", "8192"))
+
+SQL_SYSTEM_PROMPT = (
+    "You are a specialized SQL assistant. Answer the user's question by generating "
+    "a valid SQL query based on the examples provided."
+)
+
+
+class ModelfileStats:
+    """Filled in while a Modelfile is being generated."""
+
+    def __init__(self):
+        self.examples_seen = 0
+        self.examples_written = 0
+        self.estimated_tokens = 0
+        self.truncated = False
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "examples_seen": self.examples_seen,
+            "examples_written": self.examples_written,
+            "estimated_tokens": self.estimated_tokens,
+            "truncated": self.truncated,
+        }
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def escape_block(text: str) -> str:
+    """Make text safe inside a triple-quoted Modelfile block."""
+    return (text or "").replace('"""', '\\"""')
+
+
+def message_block(question: str, answer: str) -> str:
+    return (
+        f'\nMESSAGE user """{escape_block(question)}"""'
+        f'\nMESSAGE assistant """{escape_block(answer)}"""'
+    )
+
+
+def _reservoir_sample(pairs: Iterable[Dict[str, str]], k: int, seed: int, stats: ModelfileStats) -> List[Dict[str, str]]:
+    """Uniform sample of k pairs from a stream of unknown length (Algorithm R)."""
+    rng = random.Random(seed)
+    reservoir: List[Dict[str, str]] = []
+    for i, pair in enumerate(pairs):
+        stats.examples_seen += 1
+        if i < k:
+            reservoir.append(pair)
+        else:
+            j = rng.randint(0, i)
+            if j < k:
+                reservoir[j] = pair
+    return reservoir
+
+
+def _counting(pairs: Iterable[Dict[str, str]], stats: ModelfileStats) -> Iterator[Dict[str, str]]:
+    for pair in pairs:
+        stats.examples_seen += 1
+        yield pair
+
+
+def _few_shot_pairs(
+    qa_pairs: Iterable[Dict[str, str]],
+    max_examples: Optional[int],
+    token_budget: Optional[int],
+    sample: bool,
+    seed: int,
+    stats: ModelfileStats,
+) -> Iterator[Dict[str, str]]:
+    """The QA pairs that fit max_examples / token_budget on top of the header already in stats."""
+    budget = DEFAULT_TOKEN_BUDGET if token_budget is None else token_budget
+
+    if sample and max_examples:
+        pairs: Iterable[Dict[str, str]] = _reservoir_sample(qa_pairs, max_examples, seed, stats)
+        stats.truncated = stats.examples_seen > max_examples
+    else:
+        pairs = _counting(qa_pairs, stats)
+
+    for pair in pairs:
+        if max_examples is not None and stats.examples_written >= max_examples:
+            stats.truncated = True
+            break
+        cost = estimate_tokens(message_block(pair.get("question", ""), pair.get("answer", "")))
+        if budget and stats.estimated_tokens + cost > budget:
+            stats.truncated = True
+            break
+        stats.estimated_tokens += cost
+        stats.examples_written += 1
+        yield pair
+
+
+def _header(base_model: str, system_prompt: Optional[str]) -> str:
+    header = f"FROM {base_model}\n"
+    if system_prompt:
+        header += f'SYSTEM """{escape_block(system_prompt)}"""\n'
+    return header
+
+
+def iter_messages(
+    base_model: str,
+    system_prompt: Optional[str] = None,
+    qa_pairs: Optional[Iterable[Dict[str, str]]] = None,
+    max_examples: Optional[int] = None,
+    token_budget: Optional[int] = None,
+    sample: bool = False,
+    seed: int = 0,
+    stats: Optional[ModelfileStats] = None,
+) -> Iterator[Dict[str, str]]:
+    """
+    The few-shot examples as /api/create "messages" ({"role", "content"}).
+    - max_examples: keep at most this many QA pairs
+    - token_budget: stop once the examples would exceed this many estimated
+      tokens (None -> DEFAULT_TOKEN_BUDGET, 0 -> unlimited)
+    - sample: with max_examples, take a seeded uniform sample of the whole
+      stream instead of the first N pairs (holds N pairs in memory)
+    """
+    stats = stats if stats is not None else ModelfileStats()
+    stats.estimated_tokens = estimate_tokens(_header(base_model, system_prompt))
+    if qa_pairs is None:
+        return
+    for pair in _few_shot_pairs(qa_pairs, max_examples, token_budget, sample, seed, stats):
+        yield {"role": "user", "content": pair.get("question", "")}
+        yield {"role": "assistant", "content": pair.get("answer", "")}
+
+
+def reference_system_prompt(
+    base_prompt: str,
+    texts: Iterable[str],
+    token_budget: Optional[int] = None,
+    stats: Optional[ModelfileStats] = None,
+) -> str:
+    """
+    base_prompt followed by as many reference text chunks as fit in
+    token_budget (None -> DEFAULT_TOKEN_BUDGET, 0 -> unlimited).
+    """
+    budget = DEFAULT_TOKEN_BUDGET if token_budget is None else token_budget
+    parts = [base_prompt]
+    used = estimate_tokens(base_prompt)
+    for text in texts:
+        cost = estimate_tokens(text)
+        if budget and used + cost > budget:
+            if stats is not None:
+                stats.truncated = True
+            break
+        parts.append(text)
+        used += cost
+    return "\n\n".join(parts)
+
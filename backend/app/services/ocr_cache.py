@@ -0,0 +1,213 @@
+# backend/app/services/ocr_cache.py
+"""
+Result cache for OCR / describe calls.
+
+Results are keyed by (user, SHA-256 of the image bytes, mode, model) and
+kept in two tiers: a small in-process LRU and JSON files on disk that
+survive restarts and are shared by all web workers. Nothing is shared
+between users.
+
+Optionally (OCR_CACHE_PHASH=1) a 64-bit difference hash (dHash) of the
+normalized image finds earlier uploads of the same picture in other file
+encodings. dHash alone is far too coarse for text (documents that differ
+in one number hash the same), so a candidate is only served if the
+downscaled pixels the model would see are identical.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from prometheus_client.core import GaugeMetricFamily
+
+from app.core.metrics import register_stats_source
+
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", "/code/ocr_cache")
+OCR_CACHE_MEMORY_ITEMS = int(os.getenv("OCR_CACHE_MEMORY_ITEMS", "512"))
+OCR_CACHE_MAX_MB = int(os.getenv("OCR_CACHE_MAX_MB", "256"))
+# Perceptual matching: on with OCR_CACHE_PHASH=1; max differing bits of 64
+# for a candidate (which must then have identical downscaled pixels)
+OCR_CACHE_PHASH = os.getenv("OCR_CACHE_PHASH", "0") == "1"
+PHASH_MAX_DISTANCE = int(os.getenv("OCR_CACHE_PHASH_DISTANCE", "4"))
+PHASH_MAX_ITEMS = 4096
+# Check the disk budget every this many writes
+_PRUNE_EVERY = 50
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def pixel_hash(img) -> str:
+    """SHA-256 of a PIL image's decoded pixels (plus size), independent of the file encoding."""
+    return hashlib.sha256(f"{img.mode}{img.size}".encode("ascii") + img.tobytes()).hexdigest()
+
+
+def dhash(img) -> int:
+    """64-bit difference hash of a PIL image (brightness gradient of a 9x8 thumbnail)."""
+    import numpy as np
+
+    small = np.asarray(img.convert("L").resize((9, 8)), dtype=np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+class OcrResultCache:
+    def __init__(self, directory: str = OCR_CACHE_DIR, memory_items: int = OCR_CACHE_MEMORY_ITEMS):
+        self.directory = directory
+        self.memory_items = memory_items
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # (user_id, mode, model) -> OrderedDict[phash -> (result key, pixel hash)]
+        self._phashes: Dict[tuple, "OrderedDict[int, Tuple[str, str]]"] = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "perceptual_hits": 0, "misses": 0, "stores": 0}
+
+    @staticmethod
+    def key(digest: str, mode: str, model: str, user_id: str) -> str:
+        return hashlib.sha256(f"{user_id}\0{digest}\0{mode}\0{model}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _remember(self, key: str, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def _load(self, key: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """Memory first, then disk (promoted to memory). Returns (value, tier)."""
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                return value, "memory"
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)  # LRU order for disk pruning
+        except (OSError, ValueError):
+            return None, None
+        self._remember(key, value)
+        return value, "disk"
+
+    def lookup(self, key: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """(value, "memory" | "disk") on a hit, (None, None) otherwise."""
+        value, tier = self._load(key)
+        if value is not None:
+            with self._lock:
+                self.stats[f"{tier}_hits"] += 1
+        return value, tier
+
+    def get_similar(self, phash: int, pixels: str, user_id: str, mode: str, model: str) -> Optional[Dict[str, Any]]:
+        """This user's cached result for the same image in another encoding, if any."""
+        import numpy as np
+
+        with self._lock:
+            index = self._phashes.get((user_id, mode, model))
+            if not index:
+                return None
+            hashes = np.fromiter(index.keys(), dtype=np.uint64, count=len(index))
+            distances = np.unpackbits((hashes ^ np.uint64(phash)).view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+            candidates = [entry for entry, distance in zip(index.values(), distances.tolist())
+                          if distance <= PHASH_MAX_DISTANCE]
+            key = next((k for k, candidate_pixels in candidates if candidate_pixels == pixels), None)
+            if key is None:
+                return None
+        value, _tier = self._load(key)
+        if value is not None:
+            with self._lock:
+                self.stats["perceptual_hits"] += 1
+        return value
+
+    def record_miss(self) -> None:
+        with self._lock:
+            self.stats["misses"] += 1
+
+    def put(self, key: str, value: Dict[str, Any], phash: Optional[int] = None, pixels: Optional[str] = None,
+            user_id: str = "", mode: str = "", model: str = "") -> None:
+        self._remember(key, value)
+        if phash is not None and pixels is not None:
+            with self._lock:
+                index = self._phashes.setdefault((user_id, mode, model), OrderedDict())
+                index[phash] = (key, pixels)
+                while len(index) > PHASH_MAX_ITEMS:
+                    index.popitem(last=False)
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except OSError as e:
+            logging.warning(f"[OCR CACHE] could not write {path}: {e}")
+            return
+        with self._lock:
+            self.stats["stores"] += 1
+            self._writes += 1
+            prune = self._writes % _PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+
+    def _disk_entries(self):
+        for root, _dirs, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        yield path, os.stat(path)
+                    except OSError:
+                        pass
+
+    def prune(self, max_mb: int = OCR_CACHE_MAX_MB) -> int:
+        """Remove least recently used disk entries beyond max_mb. Returns files removed."""
+        entries = sorted(self._disk_entries(), key=lambda e: e[1].st_mtime)
+        total = sum(st.st_size for _, st in entries)
+        removed = 0
+        for path, st in entries:
+            if total <= max_mb * 1024 * 1024:
+                break
+            try:
+                os.remove(path)
+                total -= st.st_size
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def snapshot(self, include_disk: bool = True) -> Dict[str, Any]:
+        """Counters and sizes; include_disk=False skips walking the cache directory."""
+        entries = list(self._disk_entries()) if include_disk else []
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_items"] = len(self._memory)
+            stats["perceptual_items"] = sum(len(i) for i in self._phashes.values())
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["perceptual_hits"] + stats["misses"]
+        stats["hit_rate"] = round((lookups - stats["misses"]) / lookups, 4) if lookups else 0.0
+        if include_disk:
+            stats["disk_items"] = len(entries)
+            stats["disk_bytes"] = sum(st.st_size for _, st in entries)
+        return stats
+
+
+cache = OcrResultCache()
+
+
+def _cache_stats():
+    stats = cache.snapshot(include_disk=False)
+    lookups = GaugeMetricFamily("ocr_cache_lookups", "OCR cache lookups by outcome (this process)", labels=["outcome"])
+    for outcome in ("memory_hits", "disk_hits", "perceptual_hits", "misses"):
+        lookups.add_metric([outcome], stats[outcome])
+    yield lookups
+    yield GaugeMetricFamily("ocr_cache_hit_rate", "OCR cache hit rate (this process)", value=stats["hit_rate"])
+    yield GaugeMetricFamily("ocr_cache_memory_items", "Entries in the in-memory OCR cache", value=stats["memory_items"])
+
+
+register_stats_source(_cache_stats)
@@ -0,0 +1,150 @@
+# backend/app/services/ocr_service.py
+"""
+OCR / image description through an Ollama vision model.
+
+Images never touch the disk: uploads are decoded from memory, EXIF-rotated,
+flattened to RGB and downscaled to the model's input size, then sent as
+base64 in the /api/generate request. Batches run with bounded concurrency
+so a large upload can't monopolise the vision model.
+"""
+import asyncio
+import base64
+import io
+import logging
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.profiling import phase
+from app.services import ollama_service
+from app.services.ocr_cache import cache as result_cache, content_hash, dhash, pixel_hash, OCR_CACHE_PHASH
+
+OCR_MODEL = os.getenv("OCR_MODEL", "qwen2.5vl:7b")  # pulled by ollama_entrypoint.sh
+# Longest image side sent to the model; larger inputs only cost upload and
+# encoder time (most vision encoders work at well under 1024px)
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "1024"))
+OCR_JPEG_QUALITY = 90
+# Vision requests in flight per web process
+OCR_CONCURRENCY = int(os.getenv("OCR_CONCURRENCY", "2"))
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+MAX_BATCH_IMAGES = 16
+
+OCR_PROMPTS = {
+    "ocr": (
+        "Extract all text from this image exactly as written, preserving line breaks. "
+        "Return only the text, with no commentary."
+    ),
+    "describe": "Describe this image in detail, including any text it contains.",
+}
+
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(OCR_CONCURRENCY)
+    return _semaphore
+
+
+def prepare_image(data: bytes, max_side: int = OCR_MAX_SIDE) -> Tuple[bytes, Dict[str, Any]]:
+    """
+    Decode, normalize and downscale an image held in memory.
+    Returns (JPEG bytes, info); info["phash"] is the image's dHash when
+    perceptual caching is on. Raises ValueError for anything that isn't an image.
+    """
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        img = Image.open(io.BytesIO(data))
+        original_size = img.size
+        if img.format == "JPEG":
+            img.draft("RGB", (max_side, max_side))  # decode at reduced scale, much faster for photos
+        img = ImageOps.exif_transpose(img)
+    except (UnidentifiedImageError, OSError) as e:
+        raise ValueError("Not a readable image (JPEG, PNG or WebP expected)") from e
+
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        img = background
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
+    img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=OCR_JPEG_QUALITY, optimize=True)
+    info = {"original_size": list(original_size), "sent_size": list(img.size)}
+    if OCR_CACHE_PHASH:
+        info["phash"], info["pixels"] = dhash(img), pixel_hash(img)
+    return out.getvalue(), info
+
+
+def run_ocr(data: bytes, mode: str = "ocr", model: Optional[str] = None, user_id: str = "") -> Dict[str, Any]:
+    """
+    Blocking: prepare one image and run it through the vision model.
+    Results are cached per user by (image hash, mode, model); "cached" in the
+    result says where a cached answer came from ("memory", "disk", "perceptual").
+    """
+    if mode not in OCR_PROMPTS:
+        raise ValueError(f"Unknown mode '{mode}'")
+    model = model or OCR_MODEL
+    key = result_cache.key(content_hash(data), mode, model, user_id)
+    cached, tier = result_cache.lookup(key)
+    if cached is not None:
+        return {**cached, "cached": tier}
+
+    with phase("cpu"):
+        jpeg, info = prepare_image(data)
+    phash, pixels = info.pop("phash", None), info.pop("pixels", None)
+    if phash is not None:
+        similar = result_cache.get_similar(phash, pixels, user_id, mode, model)
+        if similar is not None:
+            result_cache.put(key, similar)  # exact hit next time
+            return {**similar, "cached": "perceptual"}
+    result_cache.record_miss()
+
+    text = ollama_service.run_vision_prompt(
+        OCR_PROMPTS[mode], [base64.b64encode(jpeg).decode("ascii")], model=model
+    )
+    result = {"text": text, **info}
+    result_cache.put(key, result, phash=phash, pixels=pixels, user_id=user_id, mode=mode, model=model)
+    return {**result, "cached": None}
+
+
+async def run_ocr_async(data: bytes, mode: str = "ocr", model: Optional[str] = None,
+                        user_id: str = "") -> Dict[str, Any]:
+    """run_ocr off the event loop, limited to OCR_CONCURRENCY at a time."""
+    async with _get_semaphore():
+        return await run_in_threadpool(run_ocr, data, mode, model, user_id)
+
+
+async def iter_batch_results(
+    images: List[Tuple[str, bytes]], mode: str = "ocr", model: Optional[str] = None, user_id: str = ""
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run a batch of (filename, bytes) images and yield one result per image
+    as soon as it finishes (not in input order; each result has its index).
+    Failures are reported per image instead of failing the batch.
+    """
+
+    async def one(index: int, filename: str, data: bytes) -> Dict[str, Any]:
+        try:
+            result = await run_ocr_async(data, mode, model, user_id)
+            return {"index": index, "filename": filename, "status": "ok", **result}
+        except ValueError as e:
+            return {"index": index, "filename": filename, "status": "error", "error": str(e)}
+        except Exception as e:
+            logging.error(f"❌ OCR failed for {filename}: {e}")
+            detail = getattr(e, "detail", None) or str(e)
+            return {"index": index, "filename": filename, "status": "error", "error": detail}
+
+    tasks = [asyncio.create_task(one(i, name, data)) for i, (name, data) in enumerate(images)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        for task in tasks:
+            task.cancel()  # client went away: drop the queued ones
@@ -1,10 +1,22 @@
 # backend/app/services/ollama_service.py
-import logging, os, requests, inspect
+import logging, os, requests, inspect, json, random, time, asyncio, threading, hashlib
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import HTTPException
-from typing import Optional, Dict, Any, List
+from requests.adapters import HTTPAdapter
+from typing import Optional, Dict, Any, List, Iterator, Iterable, AsyncIterator, Tuple
+from app.core import cancellation
+from app.core.metrics import upstream_timer, observe_ollama_generation, observe_generation_cancelled
+from app.services import semantic_cache
 
 # OLLAMA_HOST like "http://ollama-dev:11434"
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://ollama:11434")
+# Optional multi-host setup: OLLAMA_HOSTS="http://ollama-a:11434,http://ollama-b:11434"
+# The first entry is the default backend.
+OLLAMA_HOSTS = [
+    h.strip().rstrip("/")
+    for h in os.getenv("OLLAMA_HOSTS", OLLAMA_HOST).split(",")
+    if h.strip()
+] or [OLLAMA_HOST]
 
 MINIMAX_API_KEY = os.getenv("MINIMAX_API_KEY")  # You must set this in env
 MINIMAX_ENDPOINT = os.getenv(
@@ -13,13 +25,47 @@ MINIMAX_ENDPOINT = os.getenv(
 )
 
 GRANITE_MODEL = os.getenv("GRANITE_MODEL", "granite4:tiny-h")
+# Longest reply a caller may ask for (max_tokens of the prompt / chat endpoints)
+MAX_GENERATION_TOKENS = int(os.getenv("MAX_GENERATION_TOKENS", "4096"))
+# Ollama options callers may set; num_ctx, num_predict etc. stay server-controlled
+CALLER_OPTIONS = ("temperature", "top_p", "seed", "stop")
+EMBED_MODEL = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
 
 
-def _ollama_request(method: str, path: str, **kwargs):
+# Model builds can sit quietly for minutes (e.g. while pulling a base model)
+CREATE_READ_TIMEOUT = float(os.getenv("OLLAMA_CREATE_TIMEOUT", "900"))
+# /api/create bodies are sent in pieces of about this many characters
+CREATE_CHUNK_SIZE = 64 * 1024
+
+# Shared HTTP client: keeps connections to each Ollama host alive across calls
+_http = requests.Session()
+_http.mount("http://", HTTPAdapter(pool_connections=len(OLLAMA_HOSTS), pool_maxsize=32))
+_http.mount("https://", HTTPAdapter(pool_connections=len(OLLAMA_HOSTS), pool_maxsize=32))
+
+
+def resolve_ollama_host(host: Optional[str] = None) -> str:
+    """
+    Map an optional host (full URL or index into OLLAMA_HOSTS) to a configured
+    Ollama backend. Only configured hosts are accepted.
+    """
+    if host is None or host == "":
+        return OLLAMA_HOSTS[0]
+    if str(host).isdigit() and int(host) < len(OLLAMA_HOSTS):
+        return OLLAMA_HOSTS[int(host)]
+    normalized = str(host).rstrip("/")
+    if normalized in OLLAMA_HOSTS:
+        return normalized
+    raise HTTPException(status_code=400, detail=f"Unknown Ollama host '{host}'")
+
+
+def _ollama_request(method: str, path: str, host: Optional[str] = None, timeout=60, **kwargs):
     """Helper to call Ollama, raise HTTPException on error."""
-    url = f"{OLLAMA_HOST}{path}"
+    url = f"{resolve_ollama_host(host)}{path}"
+    timeout = cancellation.remaining(timeout)  # inside a request: never outlive its deadline
     try:
-        r = requests.request(method, url, timeout=60, **kwargs)
+        # For stream=True this times the wait for the response headers
+        with upstream_timer("ollama", path):
+            r = _http.request(method, url, timeout=timeout, **kwargs)
     except Exception as e:
         logging.error(f"Ollama request failed: {e}")
         raise HTTPException(status_code=503, detail="Ollama unreachable")
@@ -31,6 +77,111 @@ def _ollama_request(method: str, path: str, **kwargs):
     return r
 
 
+def _iter_ndjson(r: requests.Response) -> Iterator[Dict[str, Any]]:
+    """Yield decoded JSON objects from a streamed Ollama response."""
+    try:
+        for line in r.iter_lines():
+            if line:
+                yield json.loads(line)
+    finally:
+        r.close()
+
+
+def _iter_create_body(fields: Dict[str, Any], messages: Iterable[Dict[str, str]]) -> Iterator[bytes]:
+    """
+    Encode the /api/create JSON body incrementally so a long list of few-shot
+    messages is sent with chunked transfer encoding instead of being built
+    in memory. Messages are coalesced into pieces of about CREATE_CHUNK_SIZE.
+    """
+    head = json.dumps(fields, ensure_ascii=False)
+    buf = [head[:-1], ', "messages": [']
+    size = 0
+    for i, message in enumerate(messages):
+        piece = ("," if i else "") + json.dumps(message, ensure_ascii=False)
+        buf.append(piece)
+        size += len(piece)
+        if size >= CREATE_CHUNK_SIZE:
+            yield "".join(buf).encode("utf-8")
+            buf, size = [], 0
+    buf.append("]}")
+    yield "".join(buf).encode("utf-8")
+
+
+def _file_digest(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(block)
+    return f"sha256:{sha.hexdigest()}"
+
+
+def push_blob(path: str, host: Optional[str] = None) -> str:
+    """Upload a file to Ollama's blob store (skipped if it is already there). Returns its digest."""
+    digest = _file_digest(path)
+    url = f"{resolve_ollama_host(host)}/api/blobs/{digest}"
+    try:
+        if _http.head(url, timeout=10).status_code == 200:
+            return digest
+    except requests.RequestException as e:
+        logging.error(f"Ollama request failed: {e}")
+        raise HTTPException(status_code=503, detail="Ollama unreachable")
+    with open(path, "rb") as f:
+        _ollama_request("POST", f"/api/blobs/{digest}", host=host, data=f, timeout=(10, CREATE_READ_TIMEOUT))
+    return digest
+
+
+def create_model(
+    model_name: str,
+    base_model: str,
+    system: Optional[str] = None,
+    messages: Optional[Iterable[Dict[str, str]]] = None,
+    parameters: Optional[Dict[str, Any]] = None,
+    adapters: Optional[Dict[str, str]] = None,
+    host: Optional[str] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Build a model through Ollama's /api/create endpoint (structured request:
+    current Ollama no longer parses Modelfile text server-side).
+    messages may be any iterable of {"role", "content"} (e.g. from
+    modelfile_builder.iter_messages) and is streamed as the request body.
+    adapters maps file names to blob digests (see push_blob).
+    Yields the progress events Ollama streams back, e.g.
+    {"status": "pulling ...", "digest": "...", "total": 123, "completed": 45}
+    and finally {"status": "success"}. Raises RuntimeError if Ollama reports an error.
+    """
+    fields: Dict[str, Any] = {"model": model_name, "from": base_model, "stream": True}
+    if system:
+        fields["system"] = system
+    if parameters:
+        fields["parameters"] = parameters
+    if adapters:
+        fields["adapters"] = adapters
+    if messages is None:
+        request_kwargs = {"json": fields}
+    else:
+        request_kwargs = {
+            "data": _iter_create_body(fields, messages),
+            "headers": {"Content-Type": "application/json"},
+        }
+    r = _ollama_request(
+        "POST", "/api/create", host=host, stream=True,
+        timeout=(10, CREATE_READ_TIMEOUT), **request_kwargs,
+    )
+    for event in _iter_ndjson(r):
+        if "error" in event:
+            raise RuntimeError(f"Ollama create failed: {event['error']}")
+        yield event
+
+
+def delete_model(model_name: str, host: Optional[str] = None) -> None:
+    """Remove a model from Ollama; a model that is already gone is fine."""
+    try:
+        _ollama_request("DELETE", "/api/delete", host=host, json={"name": model_name, "model": model_name})
+    except HTTPException as e:
+        if e.status_code != 404:
+            raise
+
+
 def list_local_models() -> List[Dict[str, Any]]:
     """
     Return [{name: 'granite4:tiny-h'}, ...] from Ollama.
@@ -61,10 +212,125 @@ def run_granite_prompt(prompt_text: str, max_tokens: int = 256) -> str:
     }
     r = _ollama_request("POST", "/api/generate", json=body)
     data = r.json()
+    observe_ollama_generation(GRANITE_MODEL, data)
     # Ollama returns {'response': "..."} for non-stream
     return data.get("response", "").strip()
 
 
+def embed_texts(texts: List[str], model: str = EMBED_MODEL, host: Optional[str] = None) -> List[List[float]]:
+    """
+    Embed texts with Ollama /api/embed (one request for the whole list).
+    """
+    r = _ollama_request("POST", "/api/embed", host=host, timeout=30, json={"model": model, "input": texts})
+    embeddings = r.json().get("embeddings") or []
+    if len(embeddings) != len(texts):
+        raise HTTPException(status_code=502, detail="Ollama returned no embeddings")
+    return embeddings
+
+
+# --- Semantic cache for public prompts (see semantic_cache.py) ---
+
+# After a failed embedding call, skip the cache for this long instead of
+# paying for a failing request on every prompt (e.g. embed model not pulled)
+_EMBED_RETRY_SECONDS = 60
+_embed_unavailable_until = 0.0
+# Audits run one at a time; more hits while one is running are not audited
+_audit_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="semantic-audit")
+_audit_pending = False
+
+
+def _embed_for_cache(text: str) -> Optional[List[float]]:
+    global _embed_unavailable_until
+    if time.monotonic() < _embed_unavailable_until:
+        return None
+    try:
+        return embed_texts([text])[0]
+    except Exception as e:
+        _embed_unavailable_until = time.monotonic() + _EMBED_RETRY_SECONDS
+        logging.warning(f"⚠ [SEMANTIC CACHE] embedding with {EMBED_MODEL} failed, bypassing cache: {e}")
+        return None
+
+
+def _audit_hit(prompt_text: str, max_tokens: int, vector: List[float], hit: Dict[str, Any]) -> None:
+    """Ask the model again and compare its answer with the cached one."""
+    global _audit_pending
+    try:
+        fresh = run_granite_prompt(prompt_text, max_tokens)
+        cached_vec, fresh_vec = embed_texts([hit["answer"], fresh])
+        import numpy as np
+
+        a, b = np.asarray(cached_vec, dtype=np.float32), np.asarray(fresh_vec, dtype=np.float32)
+        similarity = float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b) or 1.0))
+        if semantic_cache.cache.record_audit(hit, prompt_text, similarity):
+            # The bad entry is gone; keep the fresh answer for this prompt instead
+            semantic_cache.cache.put(hit["namespace"], prompt_text, vector, fresh)
+    except Exception as e:
+        logging.info(f"[SEMANTIC CACHE] audit skipped: {e}")
+    finally:
+        _audit_pending = False
+
+
+def _maybe_audit(prompt_text: str, max_tokens: int, vector: List[float], hit: Dict[str, Any]) -> None:
+    global _audit_pending
+    if _audit_pending or random.random() >= semantic_cache.SEMANTIC_CACHE_AUDIT_RATE:
+        return
+    _audit_pending = True
+    _audit_executor.submit(_audit_hit, prompt_text, max_tokens, vector, hit)
+
+
+def _semantic_lookup(prompt_text: str, namespace: str) -> Tuple[Optional[List[float]], Optional[Dict[str, Any]]]:
+    """(prompt embedding or None, cached entry or None); an exact hit needs no embedding."""
+    cache = semantic_cache.cache
+    hit = cache.lookup_exact(namespace, prompt_text)
+    if hit is not None:
+        return None, hit
+    vector = _embed_for_cache(prompt_text)
+    if vector is None:
+        cache.record_miss()
+        return None, None
+    return vector, cache.lookup(namespace, vector)
+
+
+def _cacheable(prompt_text: str) -> bool:
+    return semantic_cache.SEMANTIC_CACHE and len(prompt_text) <= semantic_cache.SEMANTIC_CACHE_MAX_PROMPT_CHARS
+
+
+def run_public_prompt(prompt_text: str, max_tokens: int = 256) -> str:
+    """
+    Granite for anonymous users, answered from the semantic cache when a
+    close enough prompt was already answered with the same settings.
+    """
+    if not _cacheable(prompt_text):
+        return run_granite_prompt(prompt_text, max_tokens)
+    namespace = f"{GRANITE_MODEL}:{max_tokens}"
+    vector, hit = _semantic_lookup(prompt_text, namespace)
+    if hit is not None:
+        if vector is not None:
+            _maybe_audit(prompt_text, max_tokens, vector, hit)
+        return hit["answer"]
+    text = run_granite_prompt(prompt_text, max_tokens)
+    if vector is not None:
+        semantic_cache.cache.put(namespace, prompt_text, vector, text)
+    return text
+
+
+def run_vision_prompt(prompt_text: str, images_b64: List[str], model: str, host: Optional[str] = None) -> str:
+    """
+    Call Ollama /api/generate with base64-encoded images for a vision model.
+    Return final text (not streaming).
+    """
+    body = {
+        "model": model,
+        "prompt": prompt_text,
+        "images": images_b64,
+        "stream": False,
+    }
+    r = _ollama_request("POST", "/api/generate", host=host, timeout=300, json=body)
+    data = r.json()
+    observe_ollama_generation(model, data)
+    return data.get("response", "").strip()
+
+
 def run_minimax_prompt(prompt_text: str, max_tokens: int = 256, user: Dict[str,Any] | None = None) -> str:
     """
     Call MiniMax cloud.
@@ -91,7 +357,8 @@ def run_minimax_prompt(prompt_text: str, max_tokens: int = 256, user: Dict[str,A
     }
 
     try:
-        resp = requests.post(MINIMAX_ENDPOINT, json=payload, headers=headers, timeout=60)
+        with upstream_timer("minimax", "chat"):
+            resp = requests.post(MINIMAX_ENDPOINT, json=payload, headers=headers, timeout=60)
         if resp.status_code != 200:
             logging.error(f"MiniMax error {resp.status_code}: {resp.text}")
             raise HTTPException(status_code=502, detail="MiniMax upstream error")
@@ -112,9 +379,270 @@ def run_minimax_prompt(prompt_text: str, max_tokens: int = 256, user: Dict[str,A
 def run_chat(prompt_text: str, max_tokens: int, user: Optional[Dict[str, Any]]) -> str:
     """
     Smart router:
-      - no user  -> granite (public)
+      - no user  -> granite (public, semantic cache)
       - user     -> minimax (private tier)
     """
     if user:
         return run_minimax_prompt(prompt_text, max_tokens, user=user)
-    return run_granite_prompt(prompt_text, max_tokens)
+    return run_public_prompt(prompt_text, max_tokens)
+
+
+# --- Async generation (cancellable; see app.core.cancellation) ---
+# Generations are streamed from the backend. Cancelling the awaiting task
+# (client gone, deadline passed) closes the stream, which makes Ollama stop
+# decoding; the decode time that was not spent is estimated for metrics.
+
+_async_http = None
+_async_http_loop = None
+
+
+def _get_async_http():
+    """Shared httpx.AsyncClient for the running event loop."""
+    global _async_http, _async_http_loop
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    if _async_http is None or _async_http_loop is not loop:
+        _async_http = httpx.AsyncClient(limits=httpx.Limits(max_connections=64, max_keepalive_connections=32))
+        _async_http_loop = loop
+    return _async_http
+
+
+async def aclose() -> None:
+    """Close the async client (app shutdown)."""
+    global _async_http
+    if _async_http is not None:
+        await _async_http.aclose()
+        _async_http = None
+
+
+class _GenerationRates:
+    """Moving averages of decode speed and completion length per backend."""
+
+    ALPHA = 0.1
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, List[float]] = {}  # backend -> [tokens/s, completion tokens]
+
+    def observe(self, backend: str, tokens: int, decode_seconds: float) -> None:
+        if tokens < 2 or decode_seconds <= 0:
+            return
+        rate = (tokens - 1) / decode_seconds
+        with self._lock:
+            stats = self._stats.get(backend)
+            if stats is None:
+                self._stats[backend] = [rate, float(tokens)]
+            else:
+                stats[0] += self.ALPHA * (rate - stats[0])
+                stats[1] += self.ALPHA * (tokens - stats[1])
+
+    def saved_seconds(self, backend: str, max_tokens: int, produced: int, decode_seconds: float) -> float:
+        """Decode time the rest of an aborted generation would have taken (0 if unknown)."""
+        with self._lock:
+            rate, typical = self._stats.get(backend, (0.0, float(max_tokens)))
+        if produced >= 2 and decode_seconds > 0:
+            rate = (produced - 1) / decode_seconds
+        if rate <= 0:
+            return 0.0
+        expected = min(max_tokens, max(typical, produced))
+        return max(expected - produced, 0) / rate
+
+
+_rates = _GenerationRates()
+
+
+class _GenerationProgress:
+    """Tokens seen so far in one streamed generation."""
+
+    def __init__(self, backend: str, max_tokens: int):
+        self.backend = backend
+        self.max_tokens = max_tokens
+        self.tokens = 0
+        self.first_at: Optional[float] = None
+
+    def token(self) -> None:
+        self.tokens += 1
+        if self.first_at is None:
+            self.first_at = time.perf_counter()
+
+    def decode_seconds(self) -> float:
+        return time.perf_counter() - self.first_at if self.first_at else 0.0
+
+    def finished(self) -> None:
+        _rates.observe(self.backend, self.tokens, self.decode_seconds())
+
+    def cancelled(self, exc: BaseException) -> None:
+        reason = cancellation.cancel_reason(exc)
+        saved = _rates.saved_seconds(self.backend, self.max_tokens, self.tokens, self.decode_seconds())
+        observe_generation_cancelled(self.backend, reason, saved)
+        logging.info(
+            f"[UPSTREAM] {self.backend} generation aborted ({reason}) after {self.tokens} tokens, ~{saved:.1f}s saved"
+        )
+
+
+async def _astream_lines(backend: str, operation: str, url: str, timeout: float, **kwargs) -> AsyncIterator[str]:
+    """POST and yield non-empty response lines; HTTP errors become HTTPException."""
+    import httpx
+
+    timeout = cancellation.remaining(timeout)
+    try:
+        with upstream_timer(backend, operation):
+            async with _get_async_http().stream(
+                "POST", url, timeout=httpx.Timeout(timeout, connect=min(10.0, timeout)), **kwargs
+            ) as r:
+                if r.status_code >= 400:
+                    detail = (await r.aread()).decode("utf-8", errors="replace")
+                    logging.error(f"{backend} error {r.status_code}: {detail}")
+                    raise HTTPException(status_code=502 if backend == "minimax" else r.status_code, detail=detail)
+                async for line in r.aiter_lines():
+                    if line:
+                        yield line
+    except httpx.TimeoutException:
+        raise HTTPException(status_code=504, detail=f"{backend} timed out")
+    except httpx.HTTPError as e:
+        logging.error(f"{backend} request failed: {e}")
+        raise HTTPException(status_code=502 if backend == "minimax" else 503, detail=f"{backend} unreachable")
+
+
+async def astream_ollama_generate(
+    prompt_text: str,
+    model: str = GRANITE_MODEL,
+    max_tokens: int = 256,
+    host: Optional[str] = None,
+    options: Optional[Dict[str, Any]] = None,
+    stats: Optional[Dict[str, Any]] = None,
+) -> AsyncIterator[str]:
+    """
+    Streamed /api/generate on one Ollama host, yielding text as it is
+    decoded; stops the model when cancelled.
+    `options` are extra Ollama options (temperature, seed, ...). A `stats`
+    dict is filled with Ollama's final counters (eval_count, eval_duration, ...).
+    """
+    body = {
+        "model": model,
+        "prompt": prompt_text,
+        "options": {**(options or {}), "num_predict": max_tokens},
+        "stream": True,
+    }
+    url = f"{resolve_ollama_host(host)}/api/generate"
+    progress = _GenerationProgress("ollama", max_tokens)
+    final: Dict[str, Any] = {}
+    try:
+        async for line in _astream_lines("ollama", "/api/generate", url, 60, json=body):
+            event = json.loads(line)
+            if "error" in event:
+                raise HTTPException(status_code=502, detail=event["error"])
+            if event.get("response"):
+                progress.token()
+                yield event["response"]
+            if event.get("done"):
+                final = event
+    except asyncio.CancelledError as e:
+        progress.cancelled(e)
+        raise
+    progress.finished()
+    observe_ollama_generation(model, final)
+    if stats is not None:
+        stats.update({k: v for k, v in final.items() if k.endswith(("_count", "_duration"))})
+
+
+async def arun_ollama_generate(
+    prompt_text: str,
+    model: str = GRANITE_MODEL,
+    max_tokens: int = 256,
+    host: Optional[str] = None,
+    options: Optional[Dict[str, Any]] = None,
+    stats: Optional[Dict[str, Any]] = None,
+) -> str:
+    """astream_ollama_generate, collected."""
+    parts = [part async for part in astream_ollama_generate(prompt_text, model, max_tokens, host, options, stats)]
+    return "".join(parts).strip()
+
+
+async def arun_granite_prompt(prompt_text: str, max_tokens: int = 256) -> str:
+    """
+    Async run_granite_prompt: streams from Ollama and stops it when cancelled.
+    """
+    return await arun_ollama_generate(prompt_text, GRANITE_MODEL, max_tokens)
+
+
+def _transcript(messages: List[Dict[str, str]]) -> str:
+    """Chat messages as one plain prompt, for completion-only backends."""
+    if len(messages) == 1:
+        return messages[0]["content"]
+    lines = [f"{'User' if m['role'] == 'user' else 'Assistant'}: {m['content']}" for m in messages]
+    return "\n\n".join(lines) + "\n\nAssistant:"
+
+
+async def astream_minimax_chat(messages: List[Dict[str, str]], max_tokens: int = 256) -> AsyncIterator[str]:
+    """
+    Streamed MiniMax chat completion (OpenAI-style SSE) over `messages`
+    ([{"role": "user"|"assistant", "content"}], oldest first), yielding text
+    as it arrives; cancelling stops the upstream generation.
+    """
+    if not MINIMAX_API_KEY:
+        logging.warning("MINIMAX_API_KEY not set, falling back to granite.")
+        async for part in astream_ollama_generate(_transcript(messages), GRANITE_MODEL, max_tokens):
+            yield part
+        return
+
+    headers = {
+        "Authorization": f"Bearer {MINIMAX_API_KEY}",
+        "Content-Type": "application/json",
+    }
+    payload = {
+        "model": "minimax-m2",  # adjust to your actual MiniMax model name
+        "messages": [{"role": "system", "content": "You are a helpful assistant."}, *messages],
+        "max_tokens": max_tokens,
+        "temperature": 0.7,
+        "stream": True,
+    }
+    progress = _GenerationProgress("minimax", max_tokens)
+    try:
+        async for line in _astream_lines("minimax", "chat", MINIMAX_ENDPOINT, 60, json=payload, headers=headers):
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            choices = json.loads(data).get("choices") or [{}]
+            content = (choices[0].get("delta") or {}).get("content")
+            if content:
+                progress.token()
+                yield content
+    except asyncio.CancelledError as e:
+        progress.cancelled(e)
+        raise
+    progress.finished()
+
+
+async def arun_minimax_prompt(prompt_text: str, max_tokens: int = 256, user: Dict[str, Any] | None = None) -> str:
+    """
+    Async run_minimax_prompt, streamed so it can be cancelled.
+    """
+    messages = [{"role": "user", "content": prompt_text}]
+    return "".join([part async for part in astream_minimax_chat(messages, max_tokens)]).strip()
+
+
+async def arun_public_prompt(prompt_text: str, max_tokens: int = 256) -> str:
+    """Async run_public_prompt (cache lookups run in a worker thread)."""
+    if not _cacheable(prompt_text):
+        return await arun_granite_prompt(prompt_text, max_tokens)
+    namespace = f"{GRANITE_MODEL}:{max_tokens}"
+    vector, hit = await asyncio.to_thread(_semantic_lookup, prompt_text, namespace)
+    if hit is not None:
+        if vector is not None:
+            _maybe_audit(prompt_text, max_tokens, vector, hit)
+        return hit["answer"]
+    text = await arun_granite_prompt(prompt_text, max_tokens)
+    if vector is not None:
+        semantic_cache.cache.put(namespace, prompt_text, vector, text)
+    return text
+
+
+async def arun_chat(prompt_text: str, max_tokens: int, user: Optional[Dict[str, Any]]) -> str:
+    """Async run_chat."""
+    if user:
+        return await arun_minimax_prompt(prompt_text, max_tokens, user=user)
+    return await arun_public_prompt(prompt_text, max_tokens)
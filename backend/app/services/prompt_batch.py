@@ -0,0 +1,196 @@
+# backend/app/services/prompt_batch.py
+"""
+Batch prompts: many Ollama generations in one request.
+
+Items run concurrently, at most `concurrency` at a time per batch and at
+most PROMPT_BATCH_HOST_CONCURRENCY batch generations per Ollama host across
+all batches in this worker, so interactive traffic keeps its share. An item
+goes to the configured host with the fewest batch generations running,
+unless it names one. Results are yielded as items finish; a failed item is
+reported and the others carry on.
+
+Successful results are appended to a per-batch file. Sending the same
+batch_id again replays items that already succeeded (same id and same
+prompt/options) and only runs the rest, so a client that lost the
+connection or got failures resumes instead of starting over.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from typing import Any, AsyncIterator, Dict, List
+
+from fastapi import HTTPException
+from prometheus_client.core import GaugeMetricFamily
+
+from app.core.cancellation import CANCEL_DISCONNECT, run_with_deadline
+from app.core.metrics import observe_batch_item, register_stats_source
+from app.services import ollama_service
+
+PROMPT_BATCH_DIR = os.getenv("PROMPT_BATCH_DIR", "./data/prompt_batches")
+PROMPT_BATCH_MAX_ITEMS = int(os.getenv("PROMPT_BATCH_MAX_ITEMS", "500"))
+PROMPT_BATCH_CONCURRENCY = int(os.getenv("PROMPT_BATCH_CONCURRENCY", "4"))
+PROMPT_BATCH_MAX_CONCURRENCY = int(os.getenv("PROMPT_BATCH_MAX_CONCURRENCY", "16"))
+PROMPT_BATCH_HOST_CONCURRENCY = int(os.getenv("PROMPT_BATCH_HOST_CONCURRENCY", "4"))
+# Result files of batches not touched for this long are deleted
+PROMPT_BATCH_TTL_HOURS = float(os.getenv("PROMPT_BATCH_TTL_HOURS", "24"))
+
+_BATCH_ID = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+# Ollama host -> batch generations running / slots (this worker)
+_in_flight: Dict[str, int] = {}
+_host_slots: Dict[str, asyncio.Semaphore] = {}
+
+
+def valid_batch_id(batch_id: str) -> bool:
+    return bool(_BATCH_ID.match(batch_id)) and batch_id not in (".", "..")
+
+
+def batch_path(user_id: str, batch_id: str) -> str:
+    owner = hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:32]
+    return os.path.join(PROMPT_BATCH_DIR, owner, f"{batch_id}.jsonl")
+
+
+def fingerprint(item: Dict[str, Any]) -> str:
+    """Identifies what an item asked for; a changed item is run again on resume."""
+    key = {k: item.get(k) for k in ("prompt_text", "model", "max_tokens", "options")}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()[:32]
+
+
+def _load_finished(path: str) -> Dict[str, Dict[str, Any]]:
+    """id -> stored result; a torn last line (crash mid-write) is ignored."""
+    finished: Dict[str, Dict[str, Any]] = {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                finished[record["id"]] = record
+    except FileNotFoundError:
+        pass
+    return finished
+
+
+def _append(path: str, record: Dict[str, Any]) -> None:
+    # One write per line in append mode, so concurrent writers don't interleave
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def _prune(directory: str) -> None:
+    cutoff = time.time() - PROMPT_BATCH_TTL_HOURS * 3600
+    try:
+        for entry in os.scandir(directory):
+            if entry.name.endswith(".jsonl") and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+    except OSError as e:
+        logging.info(f"[PROMPT BATCH] pruning {directory} skipped: {e}")
+
+
+def _open_batch(path: str) -> Dict[str, Dict[str, Any]]:
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    _prune(directory)
+    finished = _load_finished(path)
+    with open(path, "a"):
+        os.utime(path)  # resuming keeps the batch alive for another TTL
+    return finished
+
+
+def _host_slot(host: str) -> asyncio.Semaphore:
+    slot = _host_slots.get(host)
+    if slot is None:
+        slot = _host_slots[host] = asyncio.Semaphore(PROMPT_BATCH_HOST_CONCURRENCY)
+    return slot
+
+
+def _pick_host() -> str:
+    return min(ollama_service.OLLAMA_HOSTS, key=lambda h: _in_flight.get(h, 0))
+
+
+async def iter_batch(
+    user_id: str,
+    batch_id: str,
+    items: List[Dict[str, Any]],
+    concurrency: int = PROMPT_BATCH_CONCURRENCY,
+    timeout: float = 60.0,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run a batch and yield one result per item as it finishes (not in input
+    order): {"id", "status": "ok", "text", "model", "host", "seconds",
+    "resumed"} or {"id", "status": "error", "error", "status_code"}.
+    Items are {"id", "prompt_text", "max_tokens", "model", "host", "options"};
+    `timeout` applies to each item from the moment it starts running.
+    """
+    path = batch_path(user_id, batch_id)
+    finished = await asyncio.to_thread(_open_batch, path)
+    batch_slots = asyncio.Semaphore(max(1, min(concurrency, PROMPT_BATCH_MAX_CONCURRENCY)))
+
+    async def one(item: Dict[str, Any]) -> Dict[str, Any]:
+        async with batch_slots:
+            host = item.get("host") or _pick_host()
+            _in_flight[host] = _in_flight.get(host, 0) + 1
+            try:
+                async with _host_slot(host):
+                    started = time.perf_counter()
+                    text = await run_with_deadline(
+                        ollama_service.arun_ollama_generate(
+                            item["prompt_text"], item["model"], item["max_tokens"], host, item["options"]
+                        ),
+                        timeout,
+                    )
+            except HTTPException as e:
+                observe_batch_item("error")
+                return {"id": item["id"], "status": "error", "error": e.detail, "status_code": e.status_code}
+            except Exception as e:
+                logging.error(f"❌ [PROMPT BATCH] item {item['id']} failed: {e}")
+                observe_batch_item("error")
+                return {"id": item["id"], "status": "error", "error": str(e), "status_code": 500}
+            finally:
+                _in_flight[host] -= 1
+        result = {
+            "id": item["id"], "status": "ok", "text": text, "model": item["model"], "host": host,
+            "seconds": round(time.perf_counter() - started, 3), "fingerprint": fingerprint(item),
+        }
+        await asyncio.to_thread(_append, path, result)
+        observe_batch_item("ok")
+        return result
+
+    pending = []
+    for item in items:
+        done = finished.get(item["id"])
+        if done is not None and done.get("fingerprint") == fingerprint(item):
+            observe_batch_item("resumed")
+            yield {**_public(done), "resumed": True}
+        else:
+            pending.append(item)
+
+    tasks = [asyncio.create_task(one(item)) for item in pending]
+    try:
+        for task in asyncio.as_completed(tasks):
+            result = await task
+            yield {**_public(result), "resumed": False} if result["status"] == "ok" else result
+    finally:
+        for task in tasks:
+            task.cancel(CANCEL_DISCONNECT)  # client went away: stop running and queued items
+
+
+def _public(result: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in result.items() if k != "fingerprint"}
+
+
+def _batch_stats():
+    running = GaugeMetricFamily(
+        "prompt_batch_in_flight", "Batch generations running per Ollama host (this worker)", labels=["host"]
+    )
+    for host in ollama_service.OLLAMA_HOSTS:
+        running.add_metric([host], _in_flight.get(host, 0))
+    yield running
+
+
+register_stats_source(_batch_stats)
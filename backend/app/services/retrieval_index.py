@@ -0,0 +1,527 @@
+# backend/app/services/retrieval_index.py
+"""
+Per-user retrieval index over uploaded documents, for grounded chatbot answers.
+
+Documents are parsed by document_parser, re-chunked to RETRIEVAL_CHUNK_CHARS
+and embedded with Ollama (ollama_service.embed_texts). Each user gets a
+directory under RETRIEVAL_DIR with append-only files:
+
+    index.json           manifest: row count, files, documents, IVF state
+    vectors.<n>.f32      (rows, dim) unit-length float32, memory-mapped for search
+    offsets.<n>.u64      byte offset of each row's line in chunks.<n>.jsonl
+    chunks.<n>.jsonl     {"d": document id, "s": source, "t": text} per row
+    ivf.<n>.npy          IVF centroids, assign.<n>.i32 the list of each row
+
+Only rows counted in index.json exist for readers, so an interrupted
+ingestion leaves nothing visible and is truncated away by the next writer.
+Writers (ingestion job, deletes) hold an flock on the directory; deleting
+a document compacts into new files and swaps the manifest.
+
+Search is one matrix-vector product over the memory-mapped rows (scanned in
+blocks) and an argpartition for the top k. Past RETRIEVAL_IVF_MIN_ROWS rows
+a coarse index is trained (spherical k-means, ~sqrt(rows) lists) and only
+the RETRIEVAL_IVF_NPROBE closest lists are scored.
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.services import document_parser
+
+RETRIEVAL_DIR = os.getenv("RETRIEVAL_DIR", "./data/retrieval")
+RETRIEVAL_CHUNK_CHARS = int(os.getenv("RETRIEVAL_CHUNK_CHARS", "1000"))
+RETRIEVAL_MAX_CHUNKS_PER_USER = int(os.getenv("RETRIEVAL_MAX_CHUNKS_PER_USER", "200000"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+# Chunks scoring below this are not put into the prompt
+RETRIEVAL_MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", "0.3"))
+# Upper bound for the excerpts injected into one prompt
+RETRIEVAL_CONTEXT_CHARS = int(os.getenv("RETRIEVAL_CONTEXT_CHARS", "6000"))
+# Coarse (IVF) index from this many rows on; 0 always searches exhaustively
+RETRIEVAL_IVF_MIN_ROWS = int(os.getenv("RETRIEVAL_IVF_MIN_ROWS", "20000"))
+RETRIEVAL_IVF_NPROBE = int(os.getenv("RETRIEVAL_IVF_NPROBE", "8"))
+# Task prefixes of nomic-embed-text; set both to "" for models without them
+RETRIEVAL_DOC_PREFIX = os.getenv("RETRIEVAL_DOC_PREFIX", "search_document: ")
+RETRIEVAL_QUERY_PREFIX = os.getenv("RETRIEVAL_QUERY_PREFIX", "search_query: ")
+
+EMBED_BATCH = 32
+# Rows per block when scanning the matrix (bounds the temporary score arrays)
+_SCAN_ROWS = 65536
+_KMEANS_ITERATIONS = 10
+_KMEANS_SAMPLE = 50_000
+# Retrain the IVF lists once the index has grown this much since the last training
+_IVF_RETRAIN_GROWTH = 2.0
+_MAX_OPEN_VIEWS = 32
+
+ProgressCallback = Callable[[float, str], None]
+
+
+class IndexBusy(Exception):
+    """Another writer (ingestion or delete) holds the user's index."""
+
+
+def user_dir(user_id: str) -> str:
+    return os.path.join(RETRIEVAL_DIR, hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:32])
+
+
+def _empty_manifest() -> Dict[str, Any]:
+    return {"format": 1, "model": None, "dim": None, "rows": 0, "text_bytes": 0,
+            "files": None, "ivf": None, "next_file_id": 1, "documents": []}
+
+
+def _read_manifest(directory: str) -> Dict[str, Any]:
+    try:
+        with open(os.path.join(directory, "index.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return _empty_manifest()
+
+
+def _normalize_rows(matrix):
+    import numpy as np
+
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1)
+
+
+def _kmeans(vectors, nlist: int, seed: int = 0):
+    """Spherical k-means on unit vectors; returns (nlist, dim) unit centroids."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    sample = vectors
+    if len(vectors) > _KMEANS_SAMPLE:
+        sample = vectors[np.sort(rng.choice(len(vectors), _KMEANS_SAMPLE, replace=False))]
+    sample = np.asarray(sample, dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(_KMEANS_ITERATIONS):
+        assign = (sample @ centroids.T).argmax(axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        counts = np.bincount(assign, minlength=nlist)
+        empty = np.flatnonzero(counts == 0)
+        if empty.size:  # re-seed empty lists with random points
+            sums[empty] = sample[rng.choice(len(sample), empty.size, replace=False)]
+        centroids = _normalize_rows(sums).astype(np.float32)
+    return centroids
+
+
+def _assign(vectors, centroids):
+    import numpy as np
+
+    out = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), _SCAN_ROWS):
+        block = np.asarray(vectors[start:start + _SCAN_ROWS])
+        out[start:start + len(block)] = (block @ centroids.T).argmax(axis=1)
+    return out
+
+
+# --- Writing ---
+
+class _IndexWriter:
+    """Exclusive access to one user's index; changes become visible on commit()."""
+
+    def __init__(self, user_id: str, wait: bool = True):
+        self.directory = user_dir(user_id)
+        self.wait = wait
+        self._lock_file = None
+        self.manifest: Dict[str, Any] = {}
+
+    def __enter__(self) -> "_IndexWriter":
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock_file = open(os.path.join(self.directory, "lock"), "w")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | (0 if self.wait else fcntl.LOCK_NB))
+        except BlockingIOError:
+            self._lock_file.close()
+            raise IndexBusy(self.directory)
+        self.manifest = _read_manifest(self.directory)
+        self._truncate_uncommitted()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        self._lock_file.close()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _new_name(self, pattern: str) -> str:
+        file_id = self.manifest["next_file_id"]
+        self.manifest["next_file_id"] = file_id + 1
+        return pattern.format(file_id)
+
+    def _truncate_uncommitted(self) -> None:
+        """Drop rows an interrupted writer appended but never committed."""
+        m = self.manifest
+        if not m["files"]:
+            return
+        sizes = [
+            (m["files"]["vectors"], m["rows"] * m["dim"] * 4),
+            (m["files"]["offsets"], m["rows"] * 8),
+            (m["files"]["chunks"], m["text_bytes"]),
+        ]
+        if m["ivf"]:
+            sizes.append((m["ivf"]["assign"], m["rows"] * 4))
+        for name, size in sizes:
+            path = self._path(name)
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+
+    def _start_files(self, model: str, dim: int) -> None:
+        self.manifest.update(model=model, dim=dim, files={
+            "vectors": self._new_name("vectors.{}.f32"),
+            "offsets": self._new_name("offsets.{}.u64"),
+            "chunks": self._new_name("chunks.{}.jsonl"),
+        })
+        for name in self.manifest["files"].values():
+            open(self._path(name), "wb").close()
+
+    def append(self, document_id: str, records: List[Tuple[str, str]], vectors, model: str) -> None:
+        """Append (source, text) records and their embeddings (uncommitted)."""
+        import numpy as np
+
+        m = self.manifest
+        vectors = _normalize_rows(np.asarray(vectors, dtype=np.float32))
+        if not m["files"]:
+            self._start_files(model, vectors.shape[1])
+        elif m["dim"] != vectors.shape[1] or m["model"] != model:
+            raise ValueError(
+                f"Index was built with {m['model']} ({m['dim']} dims); delete its documents to switch models"
+            )
+        offsets = np.empty(len(records), dtype=np.uint64)
+        position = m["text_bytes"]
+        with open(self._path(m["files"]["chunks"]), "ab") as f:
+            for i, (source, text) in enumerate(records):
+                line = (json.dumps({"d": document_id, "s": source, "t": text}, ensure_ascii=False) + "\n").encode("utf-8")
+                offsets[i] = position
+                f.write(line)
+                position += len(line)
+        with open(self._path(m["files"]["vectors"]), "ab") as f:
+            f.write(vectors.tobytes())
+        with open(self._path(m["files"]["offsets"]), "ab") as f:
+            f.write(offsets.tobytes())
+        if m["ivf"]:
+            centroids = np.load(self._path(m["ivf"]["centroids"]))
+            with open(self._path(m["ivf"]["assign"]), "ab") as f:
+                f.write(_assign(vectors, centroids).tobytes())
+        m["rows"] += len(records)
+        m["text_bytes"] = position
+
+    def _vectors(self):
+        import numpy as np
+
+        m = self.manifest
+        return np.memmap(self._path(m["files"]["vectors"]), dtype=np.float32, mode="r", shape=(m["rows"], m["dim"]))
+
+    def _maybe_train_ivf(self) -> None:
+        import numpy as np
+
+        m = self.manifest
+        rows = m["rows"]
+        if not RETRIEVAL_IVF_MIN_ROWS or rows < RETRIEVAL_IVF_MIN_ROWS:
+            m["ivf"] = None
+            return
+        if m["ivf"] and rows < m["ivf"]["rows_at_build"] * _IVF_RETRAIN_GROWTH:
+            return
+        nlist = int(min(4096, max(16, np.sqrt(rows))))
+        vectors = self._vectors()
+        centroids = _kmeans(vectors, nlist)
+        ivf = {"centroids": self._new_name("ivf.{}.npy"), "assign": self._new_name("assign.{}.i32"),
+               "nlist": nlist, "rows_at_build": rows}
+        np.save(self._path(ivf["centroids"]), centroids)
+        _assign(vectors, centroids).tofile(self._path(ivf["assign"]))
+        m["ivf"] = ivf
+        logging.info(f"[RETRIEVAL] trained IVF index: {nlist} lists over {rows} rows in {self.directory}")
+
+    def commit(self) -> None:
+        self._maybe_train_ivf()
+        tmp = self._path(f"index.json.{os.getpid()}.part")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp, self._path("index.json"))
+        self._remove_unreferenced()
+
+    def _remove_unreferenced(self) -> None:
+        m = self.manifest
+        keep = {"index.json", "lock", "uploads"}
+        keep.update((m["files"] or {}).values())
+        if m["ivf"]:
+            keep.update((m["ivf"]["centroids"], m["ivf"]["assign"]))
+        for name in os.listdir(self.directory):
+            if name not in keep and not name.endswith(".part"):
+                try:
+                    os.remove(self._path(name))
+                except OSError:
+                    pass
+
+    def remove_document(self, document_id: str) -> bool:
+        """Rewrite the index without one document's rows (uncommitted)."""
+        import numpy as np
+
+        m = self.manifest
+        doc = next((d for d in m["documents"] if d["id"] == document_id), None)
+        if doc is None:
+            return False
+        m["documents"] = [d for d in m["documents"] if d["id"] != document_id]
+        start, end = doc["start"], doc["start"] + doc["count"]
+        for d in m["documents"]:
+            if d["start"] >= end:
+                d["start"] -= doc["count"]
+        if not m["documents"]:
+            m.update(_empty_manifest(), next_file_id=m["next_file_id"])
+            return True
+
+        old_files, old_rows = m["files"], m["rows"]
+        vectors = np.memmap(self._path(old_files["vectors"]), dtype=np.float32, mode="r", shape=(old_rows, m["dim"]))
+        offsets = np.fromfile(self._path(old_files["offsets"]), dtype=np.uint64, count=old_rows)
+        self._start_files(m["model"], m["dim"])
+        m["ivf"] = None
+        new = m["files"]
+        # Keep rows [0, start) and [end, old_rows); the chunk text is copied in two slices
+        bounds = [(0, start), (end, old_rows)]
+        new_offsets = []
+        position = 0
+        with open(self._path(old_files["chunks"]), "rb") as src, \
+                open(self._path(new["chunks"]), "wb") as chunks_out:
+            for lo, hi in bounds:
+                if lo >= hi:
+                    continue
+                src.seek(int(offsets[lo]))
+                byte_end = int(offsets[hi]) if hi < old_rows else m["text_bytes"]
+                data = src.read(byte_end - int(offsets[lo]))
+                new_offsets.append(offsets[lo:hi] - offsets[lo] + np.uint64(position))
+                chunks_out.write(data)
+                position += len(data)
+        with open(self._path(new["vectors"]), "wb") as f:
+            for lo, hi in bounds:
+                for block in range(lo, hi, _SCAN_ROWS):
+                    f.write(np.asarray(vectors[block:min(hi, block + _SCAN_ROWS)]).tobytes())
+        np.concatenate(new_offsets).astype(np.uint64).tofile(self._path(new["offsets"]))
+        m["rows"] = old_rows - doc["count"]
+        m["text_bytes"] = position
+        return True
+
+
+# --- Reading ---
+
+class _IndexView:
+    """Read-only, memory-mapped snapshot of one committed manifest."""
+
+    def __init__(self, directory: str, manifest: Dict[str, Any]):
+        import numpy as np
+
+        self.directory = directory
+        self.manifest = manifest
+        rows, dim = manifest["rows"], manifest["dim"]
+        files = manifest["files"]
+        self.vectors = np.memmap(os.path.join(directory, files["vectors"]), dtype=np.float32, mode="r",
+                                 shape=(rows, dim))
+        self.offsets = np.memmap(os.path.join(directory, files["offsets"]), dtype=np.uint64, mode="r",
+                                 shape=(rows,))
+        self.chunks_path = os.path.join(directory, files["chunks"])
+        self.documents = {d["id"]: d for d in manifest["documents"]}
+        self.centroids = None
+        if manifest["ivf"]:
+            ivf = manifest["ivf"]
+            self.centroids = np.load(os.path.join(directory, ivf["centroids"]))
+            assign = np.fromfile(os.path.join(directory, ivf["assign"]), dtype=np.int32, count=rows)
+            # Inverted lists: rows sorted by list, and where each list starts
+            self.list_rows = np.argsort(assign, kind="stable").astype(np.int64)
+            self.list_bounds = np.searchsorted(assign[self.list_rows], np.arange(ivf["nlist"] + 1))
+
+    def _candidates(self, query, nprobe: int):
+        import numpy as np
+
+        probe = np.argsort(self.centroids @ query)[::-1][:nprobe]
+        parts = [self.list_rows[self.list_bounds[c]:self.list_bounds[c + 1]] for c in probe]
+        return np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+    def search(self, query, k: int, nprobe: int = RETRIEVAL_IVF_NPROBE) -> List[Tuple[int, float]]:
+        """[(row, cosine score)] best first."""
+        import numpy as np
+
+        rows = len(self.vectors)
+        if self.centroids is not None and nprobe < len(self.centroids):
+            candidates = self._candidates(query, nprobe)
+            scores = np.concatenate([
+                np.asarray(self.vectors[candidates[i:i + _SCAN_ROWS]]) @ query
+                for i in range(0, len(candidates), _SCAN_ROWS)
+            ]) if len(candidates) else np.empty(0, dtype=np.float32)
+        else:
+            candidates = None
+            scores = np.concatenate([
+                np.asarray(self.vectors[i:i + _SCAN_ROWS]) @ query for i in range(0, rows, _SCAN_ROWS)
+            ])
+        if not len(scores):
+            return []
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        found = candidates[top] if candidates is not None else top
+        return [(int(r), float(scores[t])) for r, t in zip(found, top)]
+
+    def chunk(self, row: int) -> Dict[str, Any]:
+        with open(self.chunks_path, "rb") as f:
+            f.seek(int(self.offsets[row]))
+            return json.loads(f.readline())
+
+
+_views: "OrderedDict[str, Tuple[float, _IndexView]]" = OrderedDict()
+_views_lock = threading.Lock()
+
+
+def _view(user_id: str) -> Optional[_IndexView]:
+    """Cached view of the user's committed index, reopened when index.json changes."""
+    directory = user_dir(user_id)
+    try:
+        mtime = os.stat(os.path.join(directory, "index.json")).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _views_lock:
+        cached = _views.get(directory)
+        if cached and cached[0] == mtime:
+            _views.move_to_end(directory)
+            return cached[1]
+    manifest = _read_manifest(directory)
+    view = _IndexView(directory, manifest) if manifest["rows"] else None
+    with _views_lock:
+        _views[directory] = (mtime, view)
+        _views.move_to_end(directory)
+        while len(_views) > _MAX_OPEN_VIEWS:
+            _views.popitem(last=False)
+    return view
+
+
+# --- Public API ---
+
+def _iter_chunks(parsed_path: str) -> Iterator[Tuple[str, str]]:
+    with open(parsed_path, "r", encoding="utf-8") as f:
+        for line in f:
+            rec = json.loads(line)
+            for text in document_parser.chunk_text(rec["text"], RETRIEVAL_CHUNK_CHARS):
+                if text.strip():
+                    yield rec.get("source", ""), text
+
+
+def index_document(
+    user_id: str,
+    file_path: str,
+    filename: str,
+    document_id: Optional[str] = None,
+    progress_cb: Optional[ProgressCallback] = None,
+) -> Dict[str, Any]:
+    """
+    Parse, chunk and embed one document into the user's index.
+    Re-uploading a document with the same content returns the existing entry.
+    """
+    from app.services import ollama_service
+
+    report = progress_cb or (lambda _p, _m: None)
+    document_id = document_id or uuid.uuid4().hex
+    parsed = document_parser.parse_to_jsonl(file_path, progress_cb=lambda p, msg: report(0.3 * p, msg))
+    with _IndexWriter(user_id) as writer:
+        existing = next((d for d in writer.manifest["documents"] if d["digest"] == parsed["digest"]), None)
+        if existing:
+            report(1.0, f"{filename} is already indexed")
+            return {**existing, "already_indexed": True}
+        start = writer.manifest["rows"]
+        batch: List[Tuple[str, str]] = []
+        done = 0
+
+        def flush():
+            nonlocal done
+            if start + done + len(batch) > RETRIEVAL_MAX_CHUNKS_PER_USER:
+                raise ValueError(f"Document index is limited to {RETRIEVAL_MAX_CHUNKS_PER_USER} chunks per user")
+            vectors = ollama_service.embed_texts([RETRIEVAL_DOC_PREFIX + t for _s, t in batch])
+            writer.append(document_id, batch, vectors, ollama_service.EMBED_MODEL)
+            done += len(batch)
+            batch.clear()
+            # parse chunks are ~2x our chunk size, so this is an estimate
+            estimate = max(parsed["chunks"] * document_parser.CHUNK_CHARS // RETRIEVAL_CHUNK_CHARS, done)
+            report(0.3 + 0.7 * min(done / estimate, 0.99), f"Embedded {done} chunks of {filename}")
+
+        for record in _iter_chunks(parsed["path"]):
+            batch.append(record)
+            if len(batch) >= EMBED_BATCH:
+                flush()
+        if batch:
+            flush()
+        if not done:
+            raise ValueError(f"No text found in {filename}")
+        document = {"id": document_id, "filename": filename, "digest": parsed["digest"], "start": start,
+                    "count": done, "created_at": datetime.utcnow().isoformat()}
+        writer.manifest["documents"].append(document)
+        writer.commit()
+    logging.info(f"✅ [RETRIEVAL] indexed {filename}: {done} chunks for user={user_id}")
+    return document
+
+
+def list_documents(user_id: str) -> Dict[str, Any]:
+    manifest = _read_manifest(user_dir(user_id))
+    return {
+        "documents": [{k: d[k] for k in ("id", "filename", "count", "created_at")} for d in manifest["documents"]],
+        "chunks": manifest["rows"],
+        "model": manifest["model"],
+        "ivf_lists": manifest["ivf"]["nlist"] if manifest["ivf"] else None,
+    }
+
+
+def delete_document(user_id: str, document_id: str) -> bool:
+    """Remove a document; raises IndexBusy while an ingestion is running."""
+    with _IndexWriter(user_id, wait=False) as writer:
+        if not writer.remove_document(document_id):
+            return False
+        writer.commit()
+    return True
+
+
+def search(user_id: str, query: str, k: int = RETRIEVAL_TOP_K) -> List[Dict[str, Any]]:
+    """Top-k chunks of the user's documents for a query, best first."""
+    import numpy as np
+
+    from app.services import ollama_service
+
+    view = _view(user_id)
+    if view is None:
+        return []
+    if view.manifest["model"] != ollama_service.EMBED_MODEL:
+        logging.warning(f"[RETRIEVAL] index built with {view.manifest['model']}, not {ollama_service.EMBED_MODEL}")
+        return []
+    vector = np.asarray(ollama_service.embed_texts([RETRIEVAL_QUERY_PREFIX + query])[0], dtype=np.float32)
+    vector /= float(np.linalg.norm(vector)) or 1.0
+    hits = []
+    for row, score in view.search(vector, k):
+        chunk = view.chunk(row)
+        document = view.documents.get(chunk["d"], {})
+        hits.append({"document_id": chunk["d"], "filename": document.get("filename"),
+                     "source": chunk["s"], "text": chunk["t"], "score": round(score, 4)})
+    return hits
+
+
+def build_grounded_prompt(question: str, hits: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]]]:
+    """Prompt with the usable excerpts in front of the question, and the excerpts used."""
+    used, budget, parts = [], RETRIEVAL_CONTEXT_CHARS, []
+    for hit in hits:
+        if hit["score"] < RETRIEVAL_MIN_SCORE or len(hit["text"]) > budget:
+            continue
+        budget -= len(hit["text"])
+        used.append(hit)
+        # Plain-text parses label every chunk "text"; only pages/sheets are worth citing
+        label = f"{hit['filename']} ({hit['source']})" if hit["source"] not in ("", "text") else hit["filename"]
+        parts.append(f"[{len(used)}] {label}\n{hit['text']}")
+    if not used:
+        return question, []
+    prompt = (
+        "Answer the question using the document excerpts below and cite them as [n]. "
+        "If they don't contain the answer, say so before answering from general knowledge.\n\n"
+        + "\n\n".join(parts)
+        + f"\n\nQuestion: {question}"
+    )
+    return prompt, used
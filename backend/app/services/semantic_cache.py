@@ -0,0 +1,375 @@
+# backend/app/services/semantic_cache.py
+"""
+Semantic response cache for public (Granite) prompts.
+
+Prompts are embedded (Ollama /api/embed) and kept as rows of a normalized
+float32 matrix, so a lookup is one matrix-vector product over all cached
+prompts; the best row answers the prompt if its cosine similarity reaches
+SEMANTIC_CACHE_THRESHOLD. Repeats of the exact same (whitespace/case
+normalized) prompt are answered from a dict without an embedding call.
+
+Entries are namespaced (model + max_tokens), evicted least recently used
+once SEMANTIC_CACHE_MAX_ITEMS or SEMANTIC_CACHE_MAX_MB is reached, and
+snapshotted to SEMANTIC_CACHE_DIR (vectors.npy + entries.json) every
+_SAVE_EVERY stores and on shutdown. The snapshot is loaded through mmap on
+first use. Each worker keeps its own index; the last one to save wins.
+
+A sample of semantic hits (SEMANTIC_CACHE_AUDIT_RATE) is audited: the
+model is asked again in the background and the two answers are compared by
+embedding similarity. Below SEMANTIC_CACHE_AUDIT_MIN_SIMILARITY the hit is
+counted as a false hit, logged, and the entry dropped.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from prometheus_client.core import GaugeMetricFamily
+
+from app.core.metrics import register_stats_source
+
+SEMANTIC_CACHE = os.getenv("SEMANTIC_CACHE", "1") == "1"
+# "" keeps the cache in memory only
+SEMANTIC_CACHE_DIR = os.getenv("SEMANTIC_CACHE_DIR", "./data/semantic_cache")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_MAX_ITEMS = int(os.getenv("SEMANTIC_CACHE_MAX_ITEMS", "20000"))
+SEMANTIC_CACHE_MAX_MB = int(os.getenv("SEMANTIC_CACHE_MAX_MB", "64"))
+# Longer prompts are rarely asked twice and cost more to embed
+SEMANTIC_CACHE_MAX_PROMPT_CHARS = int(os.getenv("SEMANTIC_CACHE_MAX_PROMPT_CHARS", "2000"))
+SEMANTIC_CACHE_AUDIT_RATE = float(os.getenv("SEMANTIC_CACHE_AUDIT_RATE", "0.02"))
+SEMANTIC_CACHE_AUDIT_MIN_SIMILARITY = float(os.getenv("SEMANTIC_CACHE_AUDIT_MIN_SIMILARITY", "0.8"))
+_SAVE_EVERY = 100
+_INITIAL_ROWS = 1024
+# Per-entry bookkeeping besides the vector and the text (dict, keys, arrays)
+_ENTRY_OVERHEAD = 300
+_AUDIT_LOG_SIZE = 50
+
+
+def _normalized(prompt: str) -> str:
+    return " ".join(prompt.lower().split())
+
+
+class SemanticCache:
+    def __init__(self, directory: str = SEMANTIC_CACHE_DIR, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 max_items: int = SEMANTIC_CACHE_MAX_ITEMS, max_mb: int = SEMANTIC_CACHE_MAX_MB):
+        self.directory = directory
+        self.threshold = threshold
+        self.max_items = max_items
+        self.max_bytes = max_mb * 1024 * 1024
+        # Rows [0, _size) are in use; removal moves the last row into the gap
+        self._vectors = None      # (capacity, dim) float32, unit length
+        self._namespaces = None   # (capacity,) int32 namespace id
+        self._ticks = None        # (capacity,) int64 LRU clock
+        self._entries: List[Dict[str, Any]] = []
+        self._exact: Dict[str, int] = {}  # exact key -> row
+        self._namespace_ids: Dict[str, int] = {}
+        self._size = 0
+        self._clock = 0
+        self._text_bytes = 0
+        self._unsaved = 0
+        self._saving = False
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0,
+                      "evictions": 0, "audits": 0, "false_hits": 0, "errors": 0}
+        self.audit_log: "deque[Dict[str, Any]]" = deque(maxlen=_AUDIT_LOG_SIZE)
+
+    @staticmethod
+    def exact_key(namespace: str, prompt: str) -> str:
+        return hashlib.sha256(f"{namespace}\0{_normalized(prompt)}".encode("utf-8")).hexdigest()
+
+    # --- Index internals (call with the lock held) ---
+
+    def _entry_bytes(self, entry: Dict[str, Any]) -> int:
+        return len(entry["prompt"]) + len(entry["answer"]) + _ENTRY_OVERHEAD
+
+    def _bytes(self) -> int:
+        dim = self._vectors.shape[1] if self._vectors is not None else 0
+        return self._size * (dim * 4 + 12) + self._text_bytes
+
+    def _namespace_id(self, namespace: str) -> int:
+        if namespace not in self._namespace_ids:
+            self._namespace_ids[namespace] = len(self._namespace_ids)
+        return self._namespace_ids[namespace]
+
+    def _touch(self, row: int) -> None:
+        self._clock += 1
+        self._ticks[row] = self._clock
+
+    def _reserve(self, dim: int) -> None:
+        """Make room for one more row of width dim (allocating or growing the arrays)."""
+        import numpy as np
+
+        if self._vectors is None or self._vectors.shape[1] != dim:
+            if self._size:
+                logging.warning(f"[SEMANTIC CACHE] embedding size changed to {dim}, clearing cache")
+                self._clear()
+            self._vectors = np.zeros((_INITIAL_ROWS, dim), dtype=np.float32)
+            self._namespaces = np.zeros(_INITIAL_ROWS, dtype=np.int32)
+            self._ticks = np.zeros(_INITIAL_ROWS, dtype=np.int64)
+        if self._size == len(self._vectors):
+            rows = min(len(self._vectors) * 2, max(self.max_items, 1))
+            grown = np.zeros((rows, dim), dtype=np.float32)
+            grown[: self._size] = self._vectors[: self._size]
+            self._vectors = grown
+            self._namespaces = np.resize(self._namespaces, rows)
+            self._ticks = np.resize(self._ticks, rows)
+
+    def _remove(self, row: int) -> None:
+        entry = self._entries[row]
+        self._exact.pop(entry["key"], None)
+        self._text_bytes -= self._entry_bytes(entry)
+        last = self._size - 1
+        if row != last:
+            self._vectors[row] = self._vectors[last]
+            self._namespaces[row] = self._namespaces[last]
+            self._ticks[row] = self._ticks[last]
+            self._entries[row] = self._entries[last]
+            self._exact[self._entries[row]["key"]] = row
+        self._entries.pop()
+        self._size = last
+
+    def _evict(self, incoming_bytes: int) -> None:
+        dim = self._vectors.shape[1]
+        while self._size and (
+            self._size >= self.max_items
+            or self._bytes() + dim * 4 + 12 + incoming_bytes > self.max_bytes
+        ):
+            self._remove(int(self._ticks[: self._size].argmin()))
+            self.stats["evictions"] += 1
+
+    def _clear(self) -> None:
+        self._entries, self._exact, self._size, self._text_bytes = [], {}, 0, 0
+
+    # --- Public API ---
+
+    def lookup_exact(self, namespace: str, prompt: str) -> Optional[Dict[str, Any]]:
+        """Cached entry for the same normalized prompt, without an embedding."""
+        self._ensure_loaded()
+        key = self.exact_key(namespace, prompt)
+        with self._lock:
+            row = self._exact.get(key)
+            if row is None:
+                return None
+            self._touch(row)
+            self.stats["exact_hits"] += 1
+            return {**self._entries[row], "similarity": 1.0}
+
+    def lookup_many(self, namespace: str, vectors: Sequence[Sequence[float]]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Best entry at or above the threshold for each query vector (one batched
+        matrix product), or None. Counts semantic hits and misses.
+        """
+        import numpy as np
+
+        self._ensure_loaded()
+        queries = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries /= np.where(norms > 0, norms, 1)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(queries)
+        with self._lock:
+            ns = self._namespace_ids.get(namespace)
+            if (ns is not None and self._size and self._vectors is not None
+                    and self._vectors.shape[1] == queries.shape[1]):
+                rows = np.flatnonzero(self._namespaces[: self._size] == ns)
+                if rows.size:
+                    scores = self._vectors[rows] @ queries.T  # (rows, queries)
+                    best = scores.argmax(axis=0)
+                    for i, b in enumerate(best):
+                        similarity = float(scores[b, i])
+                        if similarity >= self.threshold:
+                            row = int(rows[b])
+                            self._touch(row)
+                            results[i] = {**self._entries[row], "similarity": round(similarity, 4)}
+            hits = sum(r is not None for r in results)
+            self.stats["semantic_hits"] += hits
+            self.stats["misses"] += len(results) - hits
+        return results
+
+    def lookup(self, namespace: str, vector: Sequence[float]) -> Optional[Dict[str, Any]]:
+        return self.lookup_many(namespace, [vector])[0]
+
+    def record_miss(self) -> None:
+        """A lookup that could not be made (e.g. embedding failed)."""
+        with self._lock:
+            self.stats["misses"] += 1
+            self.stats["errors"] += 1
+
+    def put(self, namespace: str, prompt: str, vector: Sequence[float], answer: str) -> None:
+        import numpy as np
+
+        self._ensure_loaded()
+        v = np.asarray(vector, dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(v))
+        if not norm or not answer:
+            return
+        entry = {"key": self.exact_key(namespace, prompt), "namespace": namespace, "prompt": prompt, "answer": answer}
+        size = self._entry_bytes(entry)
+        if size > self.max_bytes // 4:
+            return
+        with self._lock:
+            existing = self._exact.get(entry["key"])
+            if existing is not None:
+                self._remove(existing)
+            self._reserve(len(v))
+            self._evict(size)
+            row = self._size
+            self._vectors[row] = v / norm
+            self._namespaces[row] = self._namespace_id(namespace)
+            self._entries.append(entry)
+            self._exact[entry["key"]] = row
+            self._size += 1
+            self._text_bytes += size
+            self._touch(row)
+            self.stats["stores"] += 1
+            self._unsaved += 1
+            save = bool(self.directory) and self._unsaved >= _SAVE_EVERY and not self._saving
+            if save:
+                self._saving = True
+        if save:
+            threading.Thread(target=self.save, name="semantic-cache-save", daemon=True).start()
+
+    def forget(self, key: str) -> bool:
+        with self._lock:
+            row = self._exact.get(key)
+            if row is None:
+                return False
+            self._remove(row)
+            return True
+
+    def record_audit(self, hit: Dict[str, Any], prompt: str, answer_similarity: float) -> bool:
+        """Store an audit result; drops the entry and returns True for a false hit."""
+        false_hit = answer_similarity < SEMANTIC_CACHE_AUDIT_MIN_SIMILARITY
+        with self._lock:
+            self.stats["audits"] += 1
+            if false_hit:
+                self.stats["false_hits"] += 1
+            self.audit_log.append({
+                "prompt": prompt[:200],
+                "cached_prompt": hit["prompt"][:200],
+                "prompt_similarity": hit["similarity"],
+                "answer_similarity": round(answer_similarity, 4),
+                "false_hit": false_hit,
+            })
+        if false_hit:
+            self.forget(hit["key"])
+            logging.warning(
+                f"⚠ [SEMANTIC CACHE] false hit ({hit['similarity']:.3f} prompt / {answer_similarity:.3f} answer): "
+                f"{prompt[:80]!r} served answer for {hit['prompt'][:80]!r}"
+            )
+        return false_hit
+
+    # --- Persistence ---
+
+    def _paths(self) -> Tuple[str, str]:
+        return os.path.join(self.directory, "vectors.npy"), os.path.join(self.directory, "entries.json")
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if self.directory:
+                self._load()
+
+    def _load(self) -> None:
+        import numpy as np
+
+        vectors_path, entries_path = self._paths()
+        try:
+            with open(entries_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            vectors = np.load(vectors_path, mmap_mode="r")
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning(f"[SEMANTIC CACHE] ignoring unreadable snapshot in {self.directory}: {e}")
+            return
+        if vectors.ndim != 2 or len(vectors) != len(entries):
+            logging.warning(f"[SEMANTIC CACHE] snapshot in {self.directory} is inconsistent, ignoring it")
+            return
+        # Oldest first, so LRU order survives the restart; keep what fits the budget
+        for row in sorted(range(len(entries)), key=lambda r: entries[r].get("tick", 0)):
+            entry = entries[row]
+            item = {k: entry[k] for k in ("key", "namespace", "prompt", "answer")}
+            size = self._entry_bytes(item)
+            self._reserve(vectors.shape[1])
+            self._evict(size)
+            i = self._size
+            self._vectors[i] = vectors[row]
+            self._namespaces[i] = self._namespace_id(item["namespace"])
+            self._entries.append(item)
+            self._exact[item["key"]] = i
+            self._size += 1
+            self._text_bytes += size
+            self._touch(i)
+        logging.info(f"[SEMANTIC CACHE] loaded {self._size} entries from {self.directory}")
+
+    def save(self) -> None:
+        """Write the index to SEMANTIC_CACHE_DIR (atomic per file)."""
+        import numpy as np
+
+        try:
+            with self._lock:
+                self._unsaved = 0
+                if not self.directory or self._vectors is None:
+                    return
+                vectors = self._vectors[: self._size].copy()
+                ticks = self._ticks[: self._size].tolist()
+                entries = [{**e, "tick": t} for e, t in zip(self._entries, ticks)]
+            vectors_path, entries_path = self._paths()
+            os.makedirs(self.directory, exist_ok=True)
+            suffix = f".{os.getpid()}.part"
+            with open(vectors_path + suffix, "wb") as f:
+                np.save(f, vectors)
+            with open(entries_path + suffix, "w", encoding="utf-8") as f:
+                json.dump(entries, f, ensure_ascii=False)
+            os.replace(vectors_path + suffix, vectors_path)
+            os.replace(entries_path + suffix, entries_path)
+        except OSError as e:
+            logging.warning(f"[SEMANTIC CACHE] could not save to {self.directory}: {e}")
+        finally:
+            self._saving = False
+
+    def snapshot(self, include_audits: bool = False) -> Dict[str, Any]:
+        """Counters and sizes; include_audits adds recent audits (with prompt text, admin only)."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["items"] = self._size
+            stats["bytes"] = self._bytes()
+            stats["threshold"] = self.threshold
+            if include_audits:
+                stats["recent_audits"] = list(self.audit_log)[-10:]
+        hits = stats["exact_hits"] + stats["semantic_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = round(hits / lookups, 4) if lookups else 0.0
+        stats["false_hit_rate"] = round(stats["false_hits"] / stats["audits"], 4) if stats["audits"] else 0.0
+        return stats
+
+
+cache = SemanticCache()
+
+
+def _cache_stats():
+    stats = cache.snapshot()
+    lookups = GaugeMetricFamily("semantic_cache_lookups", "Semantic cache lookups by outcome (this process)",
+                                labels=["outcome"])
+    for outcome in ("exact_hits", "semantic_hits", "misses"):
+        lookups.add_metric([outcome], stats[outcome])
+    yield lookups
+    yield GaugeMetricFamily("semantic_cache_hit_rate", "Semantic cache hit rate (this process)", value=stats["hit_rate"])
+    yield GaugeMetricFamily("semantic_cache_items", "Entries in the semantic cache", value=stats["items"])
+    yield GaugeMetricFamily("semantic_cache_bytes", "Approximate semantic cache size", value=stats["bytes"])
+    audits = GaugeMetricFamily("semantic_cache_audits", "Audited semantic hits by result (this process)",
+                               labels=["result"])
+    audits.add_metric(["ok"], stats["audits"] - stats["false_hits"])
+    audits.add_metric(["false_hit"], stats["false_hits"])
+    yield audits
+
+
+register_stats_source(_cache_stats)
@@ -0,0 +1,341 @@
+# backend/app/services/sql_data_generator.py
+"""
+Synthetic text-to-SQL pair generator.
+
+Given a schema ({table: [column, ...]} or {table: [{"name": .., "type": ..}, ...]}),
+yields unique {"question", "answer"} pairs lazily. Output is fully determined
+by the seed, duplicates are dropped by hashing, and pairs can be streamed
+straight to a JSONL file or HTTP response without building a list.
+"""
+import hashlib
+import itertools
+import json
+import logging
+import random
+from typing import Any, Dict, IO, Iterable, Iterator, List, Optional, Tuple
+
+# Column-name hints used to guess numeric columns when the schema has no types
+NUMERIC_HINTS = ("id", "amount", "count", "price", "salary", "total", "qty",
+                 "quantity", "age", "score", "year", "number", "cost", "balance")
+NUMERIC_TYPES = ("int", "float", "double", "decimal", "numeric", "real", "number")
+
+AGG_FUNCS = ("SUM", "AVG", "MIN", "MAX", "COUNT")
+COMPARISONS = (("greater than", ">"), ("less than", "<"), ("at least", ">="), ("at most", "<="))
+SAMPLE_WORDS = ("Smith", "Garcia", "Johnson", "Lee", "Brown", "Nguyen", "Khan",
+                "Sales", "Engineering", "Marketing", "Finance", "Support", "Legal",
+                "London", "Paris", "Berlin", "Tokyo", "Toronto", "Sydney", "Mumbai",
+                "active", "pending", "closed", "archived", "new", "shipped",
+                "North", "South", "East", "West", "Alpha", "Beta", "Gamma")
+# Numeric literals are drawn from this range
+MAX_LITERAL = 100_000
+
+# Share of generated pairs kept out of training for evaluation (is_held_out).
+# Training and evaluation default to the same value, so an evaluation never
+# scores a model on pairs it was trained on.
+DEFAULT_HOLDOUT_FRACTION = 0.2
+
+# Stop once this many consecutive candidates were duplicates: the schema's
+# question space is (close to) exhausted.
+MAX_CONSECUTIVE_DUPLICATES = 2000
+
+
+class _Table:
+    __slots__ = ("name", "columns", "numeric", "text")
+
+    def __init__(self, name: str, columns: List[Tuple[str, bool]]):
+        self.name = name
+        self.columns = [c for c, _ in columns]
+        self.numeric = [c for c, is_num in columns if is_num]
+        self.text = [c for c, is_num in columns if not is_num]
+
+
+def _is_numeric(column: str, col_type: Optional[str]) -> bool:
+    if col_type:
+        return any(t in col_type.lower() for t in NUMERIC_TYPES)
+    name = column.lower()
+    return any(h in name for h in NUMERIC_HINTS)
+
+
+def _normalize_schema(schema: Dict[str, Any]) -> List[_Table]:
+    tables = []
+    for table_name in sorted(schema):  # sorted: seed results must not depend on dict order
+        cols = []
+        for col in schema[table_name] or []:
+            if isinstance(col, dict):
+                name, col_type = col.get("name"), col.get("type")
+            else:
+                name, col_type = str(col), None
+            if name:
+                cols.append((name, _is_numeric(name, col_type)))
+        tables.append(_Table(table_name, cols))
+    return tables
+
+
+def _singular(name: str) -> str:
+    if name.endswith("ies"):
+        return name[:-3] + "y"
+    if name.endswith("s"):
+        return name[:-1]
+    return name
+
+
+def infer_foreign_keys(schema: Dict[str, Any]) -> List[Tuple[str, str, str, str]]:
+    """
+    Guess (table, column, ref_table, ref_column) links from naming conventions:
+    employees.department_id -> departments.department_id (or departments.id).
+    """
+    tables = {t.name: t for t in _normalize_schema(schema)}
+    links = []
+    for t in tables.values():
+        for col in t.columns:
+            if not col.lower().endswith("_id"):
+                continue
+            stem = col[:-3].lower()
+            for ref in tables.values():
+                if ref.name == t.name or _singular(ref.name.lower()) != stem:
+                    continue
+                if col in ref.columns:
+                    links.append((t.name, col, ref.name, col))
+                elif "id" in ref.columns:
+                    links.append((t.name, col, ref.name, "id"))
+    return links
+
+
+class SqlPairGenerator:
+    """Seeded, deduplicating generator of text-to-SQL pairs for one schema."""
+
+    def __init__(self, schema: Dict[str, Any], seed: int = 0):
+        self.tables = [t for t in _normalize_schema(schema) if t.columns]
+        self.by_name = {t.name: t for t in self.tables}
+        self.joins = infer_foreign_keys(schema)
+        self.rng = random.Random(seed)
+        self._seen = set()
+        self.duplicates = 0
+
+        # (weight, template) - join templates only when links were inferred
+        self.templates = [
+            (1, self._select_all),
+            (2, self._select_columns),
+            (3, self._filter_eq),
+            (2, self._filter_range),
+            (1, self._count_rows),
+            (2, self._aggregate),
+            (3, self._group_by),
+            (3, self._order_limit),
+            (3, self._filter_compound),
+            (3, self._filter_order_limit),
+        ]
+        if self.joins:
+            self.templates += [(3, self._join), (2, self._join_group), (2, self._join_filter)]
+        self._funcs = [f for _, f in self.templates]
+        self._cum_weights = list(itertools.accumulate(w for w, _ in self.templates))
+
+    # --- helpers ---
+
+    def _literal(self, numeric: bool) -> str:
+        if numeric:
+            return str(self.rng.randint(1, MAX_LITERAL))
+        return f"'{self.rng.choice(SAMPLE_WORDS)}'"
+
+    def _table(self) -> _Table:
+        return self.rng.choice(self.tables)
+
+    # --- templates: each returns (question, answer) or None if not applicable ---
+
+    def _select_all(self):
+        t = self._table()
+        return f"Show me all data from the {t.name} table.", f"SELECT * FROM {t.name};"
+
+    def _select_columns(self):
+        t = self._table()
+        cols = self.rng.sample(t.columns, k=min(len(t.columns), self.rng.randint(1, 3)))
+        listed = " and ".join(cols)
+        return f"List the {listed} of every row in {t.name}.", f"SELECT {', '.join(cols)} FROM {t.name};"
+
+    def _filter_eq(self):
+        t = self._table()
+        col = self.rng.choice(t.columns)
+        value = self._literal(col in t.numeric)
+        return (f"Find all records in {t.name} where {col} is {value}.",
+                f"SELECT * FROM {t.name} WHERE {col} = {value};")
+
+    def _filter_range(self):
+        t = self._table()
+        if not t.numeric:
+            return None
+        col = self.rng.choice(t.numeric)
+        v = self.rng.randint(1, MAX_LITERAL)
+        word, op = self.rng.choice(COMPARISONS)
+        return (f"Which rows in {t.name} have {col} {word} {v}?",
+                f"SELECT * FROM {t.name} WHERE {col} {op} {v};")
+
+    def _count_rows(self):
+        t = self._table()
+        if self.rng.random() < 0.5 or not t.columns:
+            return f"How many rows are in the {t.name} table?", f"SELECT COUNT(*) FROM {t.name};"
+        col = self.rng.choice(t.columns)
+        value = self._literal(col in t.numeric)
+        return (f"How many {t.name} have {col} equal to {value}?",
+                f"SELECT COUNT(*) FROM {t.name} WHERE {col} = {value};")
+
+    def _aggregate(self):
+        t = self._table()
+        if not t.numeric:
+            return None
+        col = self.rng.choice(t.numeric)
+        fn = self.rng.choice(AGG_FUNCS)
+        return (f"What is the {fn.lower()} of {col} in the {t.name} table?",
+                f"SELECT {fn}({col}) FROM {t.name};")
+
+    def _group_by(self):
+        t = self._table()
+        if not t.numeric or len(t.columns) < 2:
+            return None
+        group_col = self.rng.choice(t.text or t.numeric)
+        candidates = [c for c in t.numeric if c != group_col]
+        if not candidates:
+            return None
+        col = self.rng.choice(candidates)
+        fn = self.rng.choice(AGG_FUNCS)
+        return (f"What is the {fn.lower()} of {col} for each {group_col} in {t.name}?",
+                f"SELECT {group_col}, {fn}({col}) FROM {t.name} GROUP BY {group_col};")
+
+    def _order_limit(self):
+        t = self._table()
+        col = self.rng.choice(t.numeric or t.columns)
+        k = self.rng.choice((1, 3, 5, 10, 20, 50, 100))
+        if self.rng.random() < 0.5:
+            return (f"Show the top {k} rows of {t.name} with the highest {col}.",
+                    f"SELECT * FROM {t.name} ORDER BY {col} DESC LIMIT {k};")
+        return (f"Show the {k} rows of {t.name} with the lowest {col}.",
+                f"SELECT * FROM {t.name} ORDER BY {col} ASC LIMIT {k};")
+
+    def _filter_compound(self):
+        t = self._table()
+        if len(t.columns) < 2:
+            return None
+        a, b = self.rng.sample(t.columns, 2)
+        a_val, b_val = self._literal(a in t.numeric), self._literal(b in t.numeric)
+        joiner = self.rng.choice(("AND", "OR"))
+        return (f"Find records in {t.name} where {a} is {a_val} {joiner.lower()} {b} is {b_val}.",
+                f"SELECT * FROM {t.name} WHERE {a} = {a_val} {joiner} {b} = {b_val};")
+
+    def _filter_order_limit(self):
+        t = self._table()
+        if not t.numeric:
+            return None
+        col = self.rng.choice(t.columns)
+        value = self._literal(col in t.numeric)
+        order_col = self.rng.choice(t.numeric)
+        k = self.rng.randint(1, 100)
+        return (f"Among {t.name} with {col} equal to {value}, show the {k} with the highest {order_col}.",
+                f"SELECT * FROM {t.name} WHERE {col} = {value} ORDER BY {order_col} DESC LIMIT {k};")
+
+    def _join(self):
+        table, col, ref_name, ref_col = self.rng.choice(self.joins)
+        ref = self.by_name[ref_name]
+        shown = [c for c in ref.columns if c != ref_col] or ref.columns
+        ref_shown = self.rng.choice(shown)
+        return (f"Show each row of {table} together with its {_singular(ref_name)} {ref_shown}.",
+                f"SELECT {table}.*, {ref_name}.{ref_shown} FROM {table} "
+                f"JOIN {ref_name} ON {table}.{col} = {ref_name}.{ref_col};")
+
+    def _join_group(self):
+        table, col, ref_name, ref_col = self.rng.choice(self.joins)
+        ref = self.by_name[ref_name]
+        label = self.rng.choice([c for c in ref.columns if c != ref_col] or ref.columns)
+        return (f"How many {table} are there per {_singular(ref_name)} {label}?",
+                f"SELECT {ref_name}.{label}, COUNT(*) FROM {table} "
+                f"JOIN {ref_name} ON {table}.{col} = {ref_name}.{ref_col} "
+                f"GROUP BY {ref_name}.{label};")
+
+    def _join_filter(self):
+        table, col, ref_name, ref_col = self.rng.choice(self.joins)
+        ref = self.by_name[ref_name]
+        label = self.rng.choice([c for c in ref.columns if c != ref_col] or ref.columns)
+        value = self._literal(label in ref.numeric)
+        return (f"List the {table} whose {_singular(ref_name)} {label} is {value}.",
+                f"SELECT {table}.* FROM {table} "
+                f"JOIN {ref_name} ON {table}.{col} = {ref_name}.{ref_col} "
+                f"WHERE {ref_name}.{label} = {value};")
+
+    # --- main loop ---
+
+    def _is_new(self, question: str, answer: str) -> bool:
+        digest = hashlib.blake2b(f"{question}\x1f{answer}".encode(), digest_size=8).digest()
+        if digest in self._seen:
+            return False
+        self._seen.add(digest)
+        return True
+
+    def generate(self, num_examples: int) -> Iterator[Dict[str, str]]:
+        """Yield up to num_examples unique pairs."""
+        if not self.tables:
+            return
+        produced = misses = 0
+        rng, funcs, cum_weights = self.rng, self._funcs, self._cum_weights
+        while produced < num_examples:
+            pair = rng.choices(funcs, cum_weights=cum_weights)[0]()
+            if pair is None:
+                continue
+            if not self._is_new(*pair):
+                self.duplicates += 1
+                misses += 1
+                if misses >= MAX_CONSECUTIVE_DUPLICATES:
+                    logging.warning(
+                        f"SQL generator exhausted after {produced} unique pairs "
+                        f"(requested {num_examples})"
+                    )
+                    return
+                continue
+            misses = 0
+            produced += 1
+            yield {"question": pair[0], "answer": pair[1]}
+
+
+def is_held_out(pair: Dict[str, Any], fraction: float) -> bool:
+    """
+    Whether a pair belongs to the evaluation split. Decided by a hash of the
+    question alone, so training and evaluation agree without sharing state.
+    """
+    if fraction <= 0:
+        return False
+    digest = hashlib.blake2b(str(pair.get("question", "")).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2 ** 64 < fraction
+
+
+def iter_sql_training_data(schema: Dict[str, Any], num_examples: int, seed: int = 0) -> Iterator[Dict[str, str]]:
+    """Lazily yield unique QA pairs for schema; same seed, same output."""
+    return SqlPairGenerator(schema, seed=seed).generate(num_examples)
+
+
+def iter_jsonl(pairs: Iterable[Dict[str, Any]], batch_size: int = 1000) -> Iterator[str]:
+    """Encode pairs as JSONL, batching lines so each yielded chunk is a decent size."""
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    batch = []
+    for pair in pairs:
+        batch.append(encode(pair))
+        if len(batch) >= batch_size:
+            yield "\n".join(batch) + "\n"
+            batch = []
+    if batch:
+        yield "\n".join(batch) + "\n"
+
+
+def write_jsonl(pairs: Iterable[Dict[str, Any]], out: IO[str]) -> int:
+    """Stream pairs to an open text file as JSONL. Returns the number of lines written."""
+    count = 0
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    for pair in pairs:
+        out.write(encode(pair))
+        out.write("\n")
+        count += 1
+    return count
+
+
+def read_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    """Lazily read a JSONL file written by write_jsonl."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
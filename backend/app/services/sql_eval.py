@@ -0,0 +1,376 @@
+# backend/app/services/sql_eval.py
+"""
+Evaluation of SQL assistants: custom Ollama models, or a base model plus a
+LoRA adapter (run through lora_variants).
+
+The evaluation set is either given as QA pairs or held out from generated
+ones: sql_data_generator.is_held_out splits by a hash of the question, so
+a model trained with the same schema, seed and holdout_fraction never saw
+these pairs (write_sql_training_jsonl leaves them out).
+
+Candidates are evaluated one after another on the same pairs, each with at
+most `concurrency` generations in flight, so their latencies are
+comparable. The predicted and the expected SQL run against an in-memory
+SQLite database built from the schema and filled with seeded rows; literals
+from the expected queries are mixed into the data, so filters match rows.
+A prediction is correct when both return the same rows (in the same order
+if the expected query has ORDER BY).
+"""
+import asyncio
+import logging
+import os
+import random
+import re
+import sqlite3
+import statistics
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.core.cancellation import run_with_deadline
+from app.services import ollama_service, sql_data_generator
+
+SQL_EVAL_ROWS_PER_TABLE = int(os.getenv("SQL_EVAL_ROWS_PER_TABLE", "200"))
+SQL_EVAL_CONCURRENCY = int(os.getenv("SQL_EVAL_CONCURRENCY", "4"))
+SQL_EVAL_MAX_CONCURRENCY = 16
+SQL_EVAL_MAX_PAIRS = int(os.getenv("SQL_EVAL_MAX_PAIRS", "2000"))
+SQL_EVAL_MAX_CANDIDATES = 4
+# Seconds per generation
+SQL_EVAL_TIMEOUT = float(os.getenv("SQL_EVAL_TIMEOUT", "60"))
+# SQLite VM steps (in thousands) before a query is aborted, e.g. a runaway cross join
+QUERY_STEP_LIMIT = 10_000
+# Rows compared per query
+MAX_RESULT_ROWS = 10_000
+# Share of generated cells that take a literal from the expected queries
+LITERAL_RATE = 0.3
+# Wrong answers kept per candidate in the job result
+MAX_SAMPLES = 20
+
+PROMPT_TEMPLATE = (
+    "Database schema:\n{schema}\n\n"
+    "Write one SQLite query that answers the question. Reply with the SQL only.\n\n"
+    "Question: {question}"
+)
+
+_FENCE = re.compile(r"```(?:sql)?\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+_SQL_START = re.compile(r"\b(SELECT|WITH)\b", re.IGNORECASE)
+_LITERAL = re.compile(r"(\w+)\s*(?:=|>=|<=|>|<)\s*('(?:[^']|'')*'|-?\d+(?:\.\d+)?)")
+_ORDER_BY = re.compile(r"\bORDER\s+BY\b", re.IGNORECASE)
+
+ProgressCallback = Callable[[float, str], None]
+
+
+# --- Evaluation set and database ---
+
+def held_out_pairs(schema: Dict[str, Any], num_examples: int, seed: int,
+                   holdout_fraction: float, max_pairs: int) -> List[Dict[str, str]]:
+    """The pairs a training run with the same arguments left out, at most max_pairs."""
+    pairs = sql_data_generator.iter_sql_training_data(schema, num_examples, seed=seed)
+    held = (p for p in pairs if sql_data_generator.is_held_out(p, holdout_fraction))
+    return [p for _, p in zip(range(max_pairs), held)]
+
+
+def schema_text(schema: Dict[str, Any]) -> str:
+    tables = sql_data_generator.SqlPairGenerator(schema).tables
+    return "\n".join(f"{t.name}({', '.join(t.columns)})" for t in tables)
+
+
+def _literal_pools(pairs: List[Dict[str, str]]) -> Dict[str, List[Any]]:
+    """column name -> literals the expected queries compare it with."""
+    pools: Dict[str, set] = {}
+    for pair in pairs:
+        for column, raw in _LITERAL.findall(pair["answer"]):
+            value = raw[1:-1].replace("''", "'") if raw.startswith("'") else float(raw) if "." in raw else int(raw)
+            pools.setdefault(column, set()).add(value)
+    return {c: sorted(v, key=str) for c, v in pools.items()}
+
+
+def build_database(schema: Dict[str, Any], pairs: List[Dict[str, str]], seed: int = 0,
+                   rows: int = SQL_EVAL_ROWS_PER_TABLE) -> sqlite3.Connection:
+    """In-memory, read-only SQLite database with seeded rows for every table in schema."""
+    generator = sql_data_generator.SqlPairGenerator(schema)
+    keys = {(ref, ref_col) for _, _, ref, ref_col in generator.joins}
+    foreign = {(table, col) for table, col, _, _ in generator.joins}
+    pools = _literal_pools(pairs)
+    rng = random.Random(seed)
+
+    def cell(table: str, col: str, numeric: bool, i: int) -> Any:
+        if (table, col) in keys:
+            return i + 1
+        if (table, col) in foreign:
+            return rng.randint(1, rows)
+        if col in pools and rng.random() < LITERAL_RATE:
+            return rng.choice(pools[col])
+        if numeric:
+            return rng.randint(1, sql_data_generator.MAX_LITERAL)
+        return rng.choice(sql_data_generator.SAMPLE_WORDS)
+
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    for t in generator.tables:
+        numeric = set(t.numeric)
+        columns = ", ".join(f'"{c}" {"NUMERIC" if c in numeric else "TEXT"}' for c in t.columns)
+        conn.execute(f'CREATE TABLE "{t.name}" ({columns})')
+        conn.executemany(
+            f'INSERT INTO "{t.name}" VALUES ({", ".join("?" * len(t.columns))})',
+            ([cell(t.name, c, c in numeric, i) for c in t.columns] for i in range(rows)),
+        )
+    conn.commit()
+    conn.execute("PRAGMA query_only = ON")  # predictions can't change the data
+    _sandbox(conn)
+    return conn
+
+
+# What model-written SQL may do: read tables, call functions, recurse in CTEs
+_ALLOWED_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+
+
+def _sandbox(conn: sqlite3.Connection) -> None:
+    """
+    Lock the connection down for untrusted queries: no ATTACH (which works
+    under query_only and opens any file the process can reach), no PRAGMA,
+    nothing but reads.
+    """
+    conn.setlimit(sqlite3.SQLITE_LIMIT_ATTACHED, 0)
+    conn.set_authorizer(
+        lambda action, *_args: sqlite3.SQLITE_OK if action in _ALLOWED_ACTIONS else sqlite3.SQLITE_DENY
+    )
+
+
+# --- Scoring ---
+
+def extract_sql(text: str) -> str:
+    """The first SELECT/WITH statement in a model reply (code fences allowed)."""
+    fenced = _FENCE.search(text)
+    if fenced:
+        text = fenced.group(1)
+    start = _SQL_START.search(text)
+    if start is None:
+        return ""
+    sql = text[start.start():]
+    end = sql.find(";")
+    return (sql[:end + 1] if end >= 0 else sql).strip()
+
+
+def _normalize_sql(sql: str) -> str:
+    return " ".join(sql.rstrip().rstrip(";").split()).lower()
+
+
+def run_query(conn: sqlite3.Connection, sql: str) -> Tuple[Optional[List[tuple]], Optional[str]]:
+    """(rows, None) or (None, error). Runaway queries are aborted after QUERY_STEP_LIMIT."""
+    steps = 0
+
+    def abort_when_over() -> int:
+        nonlocal steps
+        steps += 1
+        return steps > QUERY_STEP_LIMIT
+
+    conn.set_progress_handler(abort_when_over, 1000)
+    try:
+        rows = conn.execute(sql).fetchmany(MAX_RESULT_ROWS)
+    except (sqlite3.Error, sqlite3.Warning) as e:  # Warning: more than one statement
+        return None, "query took too long" if steps > QUERY_STEP_LIMIT else str(e)
+    finally:
+        conn.set_progress_handler(None, 1000)
+    return [tuple(round(v, 6) if isinstance(v, float) else v for v in row) for row in rows], None
+
+
+def results_match(expected: List[tuple], predicted: List[tuple], ordered: bool) -> bool:
+    return expected == predicted if ordered else Counter(expected) == Counter(predicted)
+
+
+# --- Running candidates ---
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+
+async def _evaluate_candidate(
+    candidate: Dict[str, Any],
+    cases: List[Dict[str, Any]],
+    conn: sqlite3.Connection,
+    schema_description: Optional[str],
+    concurrency: int,
+    max_tokens: int,
+    on_item: Callable[[], None],
+) -> Dict[str, Any]:
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(case: Dict[str, Any]) -> Dict[str, Any]:
+        prompt = case["question"] if schema_description is None else PROMPT_TEMPLATE.format(
+            schema=schema_description, question=case["question"]
+        )
+        stats: Dict[str, Any] = {}
+        async with slots:
+            started = time.perf_counter()
+            try:
+                reply = await run_with_deadline(
+                    ollama_service.arun_ollama_generate(
+                        prompt, candidate["ollama_model"], max_tokens, candidate.get("host"),
+                        {"temperature": 0, "seed": 0}, stats,
+                    ),
+                    SQL_EVAL_TIMEOUT,
+                )
+            except HTTPException as e:
+                return {"case": case, "error": f"generation failed ({e.status_code}): {e.detail}"}
+            seconds = time.perf_counter() - started
+        predicted = extract_sql(reply)
+        rows, error = run_query(conn, predicted) if predicted else (None, "no SQL in the reply")
+        return {
+            "case": case, "predicted": predicted, "seconds": seconds, "stats": stats, "sql_error": error,
+            "correct": rows is not None and results_match(case["rows"], rows, case["ordered"]),
+            "exact": _normalize_sql(predicted) == _normalize_sql(case["answer"]),
+        }
+
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(one(case)) for case in cases]
+    outcomes = []
+    try:
+        for task in asyncio.as_completed(tasks):
+            outcomes.append(await task)
+            on_item()
+    finally:
+        for task in tasks:
+            task.cancel()  # the job was cancelled
+    wall = time.perf_counter() - started
+
+    answered = [o for o in outcomes if "error" not in o]
+    latencies = [o["seconds"] for o in answered]
+    rates = [
+        o["stats"]["eval_count"] / (o["stats"]["eval_duration"] / 1e9)
+        for o in answered if o["stats"].get("eval_count") and o["stats"].get("eval_duration")
+    ]
+    completion_tokens = sum(o["stats"].get("eval_count", 0) for o in answered)
+    mistakes = [o for o in outcomes if not o.get("correct")]
+    total = len(cases)
+    return {
+        "model": candidate["model"],
+        "adapter": candidate.get("adapter"),
+        "ollama_model": candidate["ollama_model"],
+        "pairs": total,
+        "correct": sum(o["correct"] for o in answered),
+        "execution_accuracy": round(sum(o["correct"] for o in answered) / total, 4) if total else None,
+        "exact_match": round(sum(o["exact"] for o in answered) / total, 4) if total else None,
+        "invalid_sql": sum(o["sql_error"] is not None for o in answered),
+        "generation_errors": total - len(answered),
+        "latency_seconds": {
+            "mean": round(statistics.fmean(latencies), 3) if latencies else None,
+            "p50": _percentile(latencies, 0.5),
+            "p95": _percentile(latencies, 0.95),
+        },
+        # decode speed of one generation, and completion tokens per second of the whole run
+        "tokens_per_second": round(statistics.fmean(rates), 1) if rates else None,
+        "throughput_tokens_per_second": round(completion_tokens / wall, 1) if wall > 0 else None,
+        "completion_tokens": completion_tokens,
+        "wall_seconds": round(wall, 2),
+        "samples": [
+            {"question": o["case"]["question"], "expected": o["case"]["answer"],
+             "predicted": o.get("predicted"), "error": o.get("error") or o.get("sql_error")}
+            for o in mistakes[:MAX_SAMPLES]
+        ],
+    }
+
+
+def _resolve_candidate(candidate: Dict[str, Any]) -> Dict[str, Any]:
+    """Ollama model to call: the model itself, or the (created on demand) adapter variant."""
+    if not candidate.get("adapter"):
+        return {**candidate, "ollama_model": candidate["model"]}
+    from app.services import lora_variants
+
+    name, _ = lora_variants.ensure_variant(candidate["model"], candidate["adapter"])
+    return {**candidate, "ollama_model": name, "host": None}  # variants live on the default host
+
+
+async def _evaluate(
+    candidates: List[Dict[str, Any]],
+    cases: List[Dict[str, Any]],
+    conn: sqlite3.Connection,
+    schema_description: Optional[str],
+    concurrency: int,
+    max_tokens: int,
+    progress_cb: Optional[ProgressCallback],
+) -> List[Dict[str, Any]]:
+    total = len(candidates) * len(cases)
+    done = 0
+    reports = []
+    try:
+        for candidate in candidates:
+            label = candidate["model"] + (f" + {candidate['adapter']}" if candidate.get("adapter") else "")
+
+            def on_item() -> None:
+                nonlocal done
+                done += 1
+                if progress_cb:
+                    progress_cb(0.05 + 0.95 * done / total, f"Evaluating {label}")
+
+            resolved = await asyncio.to_thread(_resolve_candidate, candidate)
+            report = await _evaluate_candidate(
+                resolved, cases, conn, schema_description, concurrency, max_tokens, on_item
+            )
+            logging.info(
+                f"📏 [SQL EVAL] {label}: accuracy {report['execution_accuracy']} on {report['pairs']} pairs, "
+                f"p50 {report['latency_seconds']['p50']}s, {report['tokens_per_second']} tok/s"
+            )
+            reports.append(report)
+    finally:
+        await ollama_service.aclose()  # the client belongs to this job's event loop
+    return reports
+
+
+def evaluate_sql_models(
+    schema: Dict[str, Any],
+    candidates: List[Dict[str, Any]],
+    qa_path: Optional[str] = None,
+    num_examples: int = 200,
+    seed: int = 0,
+    holdout_fraction: float = 0.2,
+    max_pairs: int = 200,
+    concurrency: int = SQL_EVAL_CONCURRENCY,
+    max_tokens: int = 128,
+    include_schema: bool = True,
+    progress_cb: Optional[ProgressCallback] = None,
+) -> Dict[str, Any]:
+    """
+    Evaluate each candidate ({"model", "adapter"?, "host"?}) on the pairs in
+    qa_path, or on the held-out split of generated pairs. Blocking: runs in
+    a job worker (see job_service).
+    """
+    if progress_cb:
+        progress_cb(0.0, "Preparing evaluation set")
+    if qa_path:
+        pairs = [p for _, p in zip(range(max_pairs), sql_data_generator.read_jsonl(qa_path))]
+    else:
+        pairs = held_out_pairs(schema, num_examples, seed, holdout_fraction, max_pairs)
+    concurrency = max(1, min(concurrency, SQL_EVAL_MAX_CONCURRENCY))
+    conn = build_database(schema, pairs, seed=seed)
+    try:
+        cases, skipped = [], 0
+        for pair in pairs:
+            rows, error = run_query(conn, pair["answer"])
+            if error is not None:
+                skipped += 1  # the reference itself doesn't run on this schema
+                continue
+            cases.append({**pair, "rows": rows, "ordered": bool(_ORDER_BY.search(pair["answer"]))})
+        if not cases:
+            raise RuntimeError("No evaluation pairs: the held-out split is empty or no expected query runs")
+        if progress_cb:
+            progress_cb(0.05, f"Evaluating {len(candidates)} candidate(s) on {len(cases)} pairs")
+        reports = asyncio.run(_evaluate(
+            candidates, cases, conn, schema_text(schema) if include_schema else None,
+            concurrency, max_tokens, progress_cb,
+        ))
+    finally:
+        conn.close()
+    return {
+        "status": "success",
+        "pairs": len(cases),
+        "skipped_pairs": skipped,
+        "holdout_fraction": None if qa_path else holdout_fraction,
+        "seed": seed,
+        "concurrency": concurrency,
+        "candidates": reports,
+    }
@@ -1,184 +1,296 @@
 # backend/app/services/training_service.py
-import subprocess
-import ollama
+import itertools
+import json
 import logging
-import random
-import tempfile
 import os
-import shutil
-from typing import Dict, List, Any, Optional
-from fastapi import UploadFile
+import re
+from typing import Dict, List, Any, Optional, Callable, Iterable, Iterator
+from fastapi import HTTPException
 
-import requests
+from app.services import ollama_service, sql_data_generator, modelfile_builder, document_parser
+from app.services.job_service import JobCancelled
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
-# --- Check if Ollama CLI exists ---
-if shutil.which("ollama") is None:
-    logging.error("❌ Ollama CLI command 'ollama' not found in PATH. Subprocess calls will fail.")
-    # Consider raising an error here
+LORA_DIR = "/code/loras"
+# Names of models / adapters to create; they become directory names under LORA_DIR
+MODEL_NAME_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]{0,63}$")
 
+# Progress callback used by background jobs: (fraction 0..1, message)
+ProgressCallback = Callable[[float, str], None]
 
-LORA_DIR = "/code/loras"
 
-def generate_sql_training_data(schema: dict, num_examples: int) -> list:
+def _report(progress_cb: Optional[ProgressCallback], progress: float, message: str):
+    if progress_cb:
+        progress_cb(progress, message)
+
+def generate_sql_training_data(schema: dict, num_examples: int, seed: int = 0) -> list:
     """
     Generates synthetic SQL QA pairs from a database schema.
+    Deterministic for a given seed and free of duplicates. For large
+    datasets use sql_data_generator.iter_sql_training_data, which yields lazily.
+    """
+    logging.info(f"Generating {num_examples} SQL pairs for tables: {list(schema.keys())} (seed={seed})")
+    return list(sql_data_generator.iter_sql_training_data(schema, num_examples, seed=seed))
+
+
+def write_sql_training_jsonl(
+    schema: dict, num_examples: int, path: str, seed: int = 0, holdout_fraction: float = 0.0
+) -> int:
+    """
+    Streams generated SQL QA pairs to a JSONL file in constant memory.
+    Writes to a temp name first so readers never see a half-written file.
+    Pairs in the evaluation split (sql_data_generator.is_held_out) are left
+    out. Returns the number of pairs written.
     """
-    qa_pairs = []
-    logging.info(f"Received training file: {list(schema.keys())}")
-    tables = list(schema.keys())
-    logging.info(f"Received training file: {tables}")
-
-    if not tables:
-        return []
-
-    for _ in range(num_examples):
-        table = random.choice(tables)
-        columns = schema[table]
-        
-        # Simple SELECT
-        question = f"Show me all data from the {table} table."
-        answer = f"SELECT * FROM {table};"
-        qa_pairs.append({"question": question, "answer": answer})
-
-        # SELECT with a filter
-        if columns:
-            col = random.choice(columns)
-            question = f"Find all records in {table} where {col} is 'some_value'."
-            answer = f"SELECT * FROM {table} WHERE {col} = 'some_value';"
-            qa_pairs.append({"question": question, "answer": answer})
-
-        # AGGREGATE function
-        numeric_cols = [c for c in columns if "id" in c or "amount" in c or "count" in c]
-        if numeric_cols:
-            agg_col = random.choice(numeric_cols)
-            agg_func = random.choice(["SUM", "AVG", "COUNT"])
-            question = f"What is the {agg_func.lower()} of {agg_col} in the {table} table?"
-            answer = f"SELECT {agg_func}({agg_col}) FROM {table};"
-            qa_pairs.append({"question": question, "answer": answer})
-            
-    return qa_pairs
-
-
-# --- THIS IS THE MISSING FUNCTION ---
-
-def _simulate_lora_training(base_model: str, custom_adapter_name: str, source_info: str) -> str:
-    """Simulates LoRA training by creating a placeholder file."""
-    # Ensure name has a standard LoRA extension
-    if not any(custom_adapter_name.endswith(ext) for ext in [".safetensors", ".bin", ".pt"]):
-        custom_adapter_name += ".safetensors" # Default extension
-
-    adapter_path = os.path.join(LORA_DIR, custom_adapter_name)
-
-    # Create a small placeholder file
+    pairs = sql_data_generator.iter_sql_training_data(schema, num_examples, seed=seed)
+    if holdout_fraction > 0:
+        pairs = (p for p in pairs if not sql_data_generator.is_held_out(p, holdout_fraction))
+    tmp_path = f"{path}.part"
+    with open(tmp_path, "w", encoding="utf-8") as out:
+        count = sql_data_generator.write_jsonl(pairs, out)
+    os.replace(tmp_path, path)
+    logging.info(f"✅ Wrote {count} SQL pairs to {path}")
+    return count
+
+
+# --- LoRA adapter training ---
+
+def _adapter_name(custom_model_name: str) -> str:
+    """Adapter directory name: the model name without a weight-file extension."""
+    if not MODEL_NAME_PATTERN.match(custom_model_name):
+        raise ValueError(f"Invalid model name '{custom_model_name}'")
+    root, ext = os.path.splitext(custom_model_name)
+    return root if ext in (".safetensors", ".bin", ".pt") and root else custom_model_name
+
+
+def _scaled(progress_cb: Optional[ProgressCallback], lo: float, hi: float) -> Optional[ProgressCallback]:
+    """Map a sub-step's 0..1 progress into [lo, hi] of the job's progress."""
+    if progress_cb is None:
+        return None
+    return lambda p, m: progress_cb(lo + (hi - lo) * p, m)
+
+
+def prepare_training_file(path: str, progress_cb: Optional[ProgressCallback] = None) -> str:
+    """
+    Path of a records file for an upload: .json/.jsonl are used as-is,
+    documents are parsed into cached JSONL chunks (see document_parser).
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".json", ".jsonl"):
+        return path
     try:
-        with open(adapter_path, "w") as f:
-            f.write(f"Placeholder LoRA trained from {base_model} using {source_info}.\n")
-            f.write("This is not a real adapter file.\n")
-        logging.info(f"✅ Simulated LoRA training. Placeholder created: {custom_adapter_name}")
-        return custom_adapter_name # Return the filename
-    except Exception as e:
-        logging.error(f"❌ Failed to create placeholder LoRA file: {e}", exc_info=True)
-        raise RuntimeError(f"Failed to simulate LoRA training for {custom_adapter_name}") from e
+        parsed = document_parser.parse_to_jsonl(path, progress_cb)
+    except ValueError as e:
+        raise RuntimeError(str(e)) from e
+    if not parsed["chunks"]:
+        raise RuntimeError(f"No text could be extracted from {os.path.basename(path)}")
+    return parsed["path"]
+
+
+def _iter_file_texts(path: str) -> Iterator[Any]:
+    """Training records from a prepared file: QA dicts or {"text": ...} chunks."""
+    if path.lower().endswith(".jsonl"):
+        yield from sql_data_generator.read_jsonl(path)
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        yield from (data if isinstance(data, list) else [data])
+
+
+def _render_records(records: Iterable[Any], tokenizer) -> Iterator[str]:
+    """QA dicts go through the model's chat template, {"text": ...} and strings pass through."""
+    from app.services import lora_trainer
+
+    for rec in records:
+        if isinstance(rec, str):
+            yield rec
+        elif "question" in rec and "answer" in rec:
+            yield lora_trainer.format_qa_pair(tokenizer, rec["question"], rec["answer"])
+        elif rec.get("text"):
+            yield rec["text"]
+
+
+def _train_adapter(
+    base_model: str,
+    custom_model_name: str,
+    records: Callable[[], Iterable[Any]],
+    progress_cb: Optional[ProgressCallback],
+    config: Optional[Dict[str, Any]],
+) -> Dict[str, Any]:
+    from app.services import dataset_dedup, lora_trainer
+
+    cfg = lora_trainer.LoraTrainingConfig(**(config or {}))
+    deduper = dataset_dedup.MinHashDeduper(threshold=cfg.dedup_threshold) if cfg.dedup else None
+
+    def texts(tokenizer):
+        source = records()
+        if deduper is not None:
+            # exact + near duplicates are dropped while the data streams into the tokenizer
+            source = deduper.filter(source)
+        return _render_records(source, tokenizer)
+
+    result = lora_trainer.train_lora(
+        base_model,
+        _adapter_name(custom_model_name),
+        LORA_DIR,
+        texts,
+        cfg=cfg,
+        progress_cb=progress_cb,
+    )
+    if deduper is not None:
+        dedup = deduper.stats.as_dict()
+        if result.get("tokens_per_sec"):
+            dedup["estimated_seconds_saved"] = round(dedup["estimated_tokens_saved"] / result["tokens_per_sec"], 1)
+        logging.info(f"[DEDUP] {custom_model_name}: {dedup}")
+        result["dedup"] = dedup
+    return {"status": "success", **result}
 
 
 def train_sql_lora_adapter( # Renamed function
     base_model: str,
     custom_model_name: str, # We'll use this for the adapter name
-    qa_data: List[Dict[str, str]]
+    qa_data: Optional[List[Dict[str, str]]] = None,
+    progress_cb: Optional[ProgressCallback] = None,
+    qa_path: Optional[str] = None,
+    config: Optional[Dict[str, Any]] = None,
 ):
-    """Simulates training a SQL LoRA adapter."""
-    # Use _simulate_lora_training
-    adapter_filename = _simulate_lora_training(base_model, custom_model_name, "generated SQL QA data")
-    return {"status": "success", "adapter_filename": adapter_filename}
+    """Trains a real LoRA adapter (CPU) on SQL QA pairs from qa_data or a JSONL file."""
+    if qa_path:
+        records = lambda: sql_data_generator.read_jsonl(qa_path)
+    else:
+        records = lambda: qa_data or []
+    return _train_adapter(base_model, custom_model_name, records, progress_cb, config)
 
 
 def train_lora_adapter_from_file( # Renamed function
     base_model: str,
     custom_model_name: str, # We'll use this for the adapter name
-    training_file: UploadFile
+    training_file_path: str,
+    progress_cb: Optional[ProgressCallback] = None,
+    config: Optional[Dict[str, Any]] = None,
 ):
-    """Simulates training a LoRA adapter from an uploaded file."""
-    # Use _simulate_lora_training
-    adapter_filename = _simulate_lora_training(base_model, custom_model_name, f"file {training_file.filename}")
-    return {"status": "success", "adapter_filename": adapter_filename}
+    """Trains a real LoRA adapter (CPU) on an uploaded file saved on disk."""
+    logging.info(f"Training adapter {custom_model_name} on {os.path.basename(training_file_path)}")
+    records_path = prepare_training_file(training_file_path, _scaled(progress_cb, 0.0, 0.01))
+    return _train_adapter(
+        base_model, custom_model_name, lambda: _iter_file_texts(records_path), progress_cb, config
+    )
 
 def create_custom_model_from_data(
     base_model: str,
     custom_model_name: str,
-    training_file: Optional[UploadFile] = None,
-    qa_data: Optional[List[Dict[str, str]]] = None
+    training_file_path: Optional[str] = None,
+    qa_data: Optional[Iterable[Dict[str, str]]] = None,
+    progress_cb: Optional[ProgressCallback] = None,
+    ollama_host: Optional[str] = None,
+    qa_path: Optional[str] = None,
+    max_examples: Optional[int] = None,
+    token_budget: Optional[int] = None,
+    sample_examples: bool = False,
 ):
     """
-    Creates a custom model using the Ollama CLI via subprocess.
-    Uses best practices for temporary files and error handling.
+    Creates a custom model through Ollama's HTTP /api/create endpoint.
+    Meant to run inside a background job (see job_service); progress_cb
+    receives the layer/progress events Ollama streams back.
+    ollama_host picks one of the configured OLLAMA_HOSTS (default: first).
+    QA pairs come from qa_data or a JSONL file at qa_path; max_examples,
+    token_budget and sample_examples bound the few-shot context
+    (see modelfile_builder.iter_messages). A training_file_path upload is
+    parsed first: QA records become examples, document text goes into the
+    system prompt as reference material.
     """
-    # --- Step 1: Build Modelfile Content ---
-    # (Your existing logic for building modelfile_content remains the same)
-    if qa_data:
-        modelfile_content = f"""FROM {base_model}
-SYSTEM \"\"\"You are a specialized SQL assistant. Answer the user's question by generating a valid SQL query based on the examples provided.\"\"\"
-"""
-        for pair in qa_data:
-            question = pair.get("question", "").replace('"""', '\\"""')
-            answer = pair.get("answer", "").replace('"""', '\\"""')
-            modelfile_content += f'\nMESSAGE user """{question}"""'
-            modelfile_content += f'\nMESSAGE assistant """{answer}"""'
-    elif training_file:
-        # Placeholder: Implement actual file parsing here
-        logging.info(f"Received training file: {training_file.filename} (Parsing not implemented)")
-        modelfile_content = f"""FROM {base_model}
-SYSTEM "You are a specialized assistant trained on the content of {training_file.filename}."
-"""
+    # --- Step 1: Build the few-shot messages lazily ---
+    # They are generated while the request body is being sent, so even very
+    # large QA sets are never concatenated in memory.
+    stats = modelfile_builder.ModelfileStats()
+    system_prompt = modelfile_builder.SQL_SYSTEM_PROMPT
+    if qa_path:
+        qa_data = sql_data_generator.read_jsonl(qa_path)
+    elif qa_data is None and training_file_path:
+        training_filename = os.path.basename(training_file_path)
+        records_path = prepare_training_file(training_file_path, _scaled(progress_cb, 0.0, 0.05))
+        records = _iter_file_texts(records_path)
+        first = next(records, None)
+        if isinstance(first, dict) and "question" in first and "answer" in first:
+            # QA uploads become few-shot examples like generated SQL pairs
+            qa_data = itertools.chain([first], records)
+            system_prompt = f"You are a specialized assistant trained on the content of {training_filename}."
+        else:
+            # Documents: as many reference chunks as the token budget allows
+            texts = (r if isinstance(r, str) else r.get("text", "") for r in itertools.chain([first], records) if r)
+            system_prompt = modelfile_builder.reference_system_prompt(
+                f"You are a specialized assistant trained on the content of {training_filename}. "
+                "Answer using the reference material below.",
+                texts,
+                token_budget=token_budget,
+                stats=stats,
+            )
+            qa_data = []
+    _report(progress_cb, 0.05, "Building few-shot examples")
+    deduper = None
+    if qa_data is not None:
+        # duplicate examples would only spend the few-shot token budget twice
+        from app.services import dataset_dedup
+
+        deduper = dataset_dedup.MinHashDeduper()
+        qa_data = deduper.filter(qa_data)
+        messages = modelfile_builder.iter_messages(
+            base_model,
+            system_prompt,
+            qa_data,
+            max_examples=max_examples,
+            token_budget=token_budget,
+            sample=sample_examples,
+            stats=stats,
+        )
     else:
-        modelfile_content = f"""FROM {base_model}
-SYSTEM "You are a helpful assistant."
-"""
+        system_prompt = "You are a helpful assistant."
+        messages = modelfile_builder.iter_messages(base_model, system_prompt, stats=stats)
 
-    # --- Step 2: Use a temporary file safely ---
-    # `tempfile.NamedTemporaryFile` ensures the file is automatically cleaned up
+    # --- Step 2: Send it to Ollama's /api/create and relay its progress ---
+    target_host = ollama_service.resolve_ollama_host(ollama_host)
+    _report(progress_cb, 0.1, f"Creating {custom_model_name} on {target_host}")
+    progress = 0.1
     try:
-        with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".Modelfile") as temp_modelfile:
-            temp_modelfile.write(modelfile_content)
-            temp_file_path = temp_modelfile.name # Get the path
-
-        logging.info(f"Temporary Modelfile created at: {temp_file_path}")
-
-        # --- Step 3: Run Ollama CLI command ---
-        # Best practice: Capture stderr for better error messages
-        process = subprocess.run(
-            ["ollama", "create", custom_model_name, "-f", temp_file_path],
-            check=True, # Raises CalledProcessError on failure
-            capture_output=True, # Capture stdout and stderr
-            text=True # Decode stdout/stderr as text
+        events = ollama_service.create_model(
+            custom_model_name, base_model, system=system_prompt, messages=messages, host=target_host
         )
-        logging.info(f"Ollama CLI stdout: {process.stdout}") # Log success output
-
-        # --- Step 4: Success ---
-        logging.info(f"✅ Successfully created custom model: {custom_model_name}")
-        return {"status": "success", "model_name": custom_model_name}
-
-    except subprocess.CalledProcessError as e:
-        # Best practice: Log the specific error output from the CLI command
-        logging.error(f"❌ Failed to create model via Ollama CLI.")
-        logging.error(f"Command: {' '.join(e.cmd)}")
-        logging.error(f"Return code: {e.returncode}")
-        logging.error(f"Stderr: {e.stderr}")
-        # Raise a more informative error
-        raise RuntimeError(f"Model creation via Ollama CLI failed: {e.stderr or 'No error output'}") from e
+        for event in events:
+            status_text = event.get("status", "")
+            total, completed = event.get("total"), event.get("completed")
+            if total and completed is not None:
+                # Layer transfer (e.g. pulling the base model): real byte progress
+                progress = max(progress, 0.1 + 0.85 * min(completed / total, 1.0))
+            else:
+                # Step events carry no size info; creep forward per step
+                progress = min(0.95, progress + 0.05)
+            _report(progress_cb, progress, status_text)
+
+        # --- Step 3: Success ---
+        logging.info(
+            f"✅ Successfully created custom model: {custom_model_name} on {target_host} "
+            f"({stats.examples_written} examples, ~{stats.estimated_tokens} tokens)"
+        )
+        _report(progress_cb, 1.0, f"Created {custom_model_name}")
+        return {
+            "status": "success",
+            "model_name": custom_model_name,
+            "host": target_host,
+            "modelfile": stats.as_dict(),
+            "dedup": deduper.stats.as_dict() if deduper else None,
+        }
+
+    except JobCancelled:
+        raise # Let job cancellation propagate untouched
+    except HTTPException as e:
+        logging.error(f"❌ Ollama rejected model creation ({e.status_code}): {e.detail}")
+        raise RuntimeError(f"Model creation via Ollama API failed: {e.detail}") from e
+    except RuntimeError as e:
+        logging.error(f"❌ {e}")
+        raise
     except Exception as e:
         # Catch any other unexpected errors
         logging.error(f"❌ An unexpected error occurred during model creation: {e}", exc_info=True)
         raise RuntimeError("An unexpected error occurred during model creation") from e
-
-    finally:
-        # --- Step 5: Ensure temporary file cleanup ---
-        # The 'with' statement handles this, but an extra check can be added
-        if 'temp_file_path' in locals() and os.path.exists(temp_file_path):
-            try:
-                os.remove(temp_file_path)
-                logging.info(f"Cleaned up temporary Modelfile: {temp_file_path}")
-            except OSError as e:
-                logging.error(f"Error removing temporary Modelfile {temp_file_path}: {e}")
\ No newline at end of file
@@ -2,15 +2,15 @@
 
 from sqlalchemy.orm import Session
 from app.models import user as user_model
-from app.core.security import get_password_hash, verify_password
+from app.core.security import get_password_hash_async, verify_and_update_password_async
 
 def get_user_by_email(db: Session, email: str):
     """Fetches a single user by their email address."""
     return db.query(user_model.UserDB).filter(user_model.UserDB.email == email).first()
 
-def create_user(db: Session, user: user_model.UserCreate):
-    """Creates a new user in the database."""
-    hashed_password = get_password_hash(user.password)
+async def create_user(db: Session, user: user_model.UserCreate):
+    """Creates a new user in the database. Hashing runs off the event loop."""
+    hashed_password = await get_password_hash_async(user.password)
     db_user = user_model.UserDB(email=user.email, hashed_password=hashed_password)
     db.add(db_user)
     db.commit()
@@ -18,17 +18,23 @@ def create_user(db: Session, user: user_model.UserCreate):
     return db_user
 
 # --- THIS IS THE MISSING FUNCTION ---
-def authenticate_user(db: Session, email: str, password: str):
+async def authenticate_user(db: Session, email: str, password: str):
     """
     Authenticates a user. Returns the user object if successful, otherwise None.
+    Verification runs off the event loop; hashes made with old argon2
+    parameters are upgraded on a successful login.
     """
     user = get_user_by_email(db, email)
     if not user:
         # User not found
         return None
-    if not verify_password(password, user.hashed_password):
+    valid, new_hash = await verify_and_update_password_async(password, user.hashed_password)
+    if not valid:
         # Incorrect password
         return None
-    
+    if new_hash:
+        user.hashed_password = new_hash
+        db.commit()
+
     # Authentication successful
-    return user
\ No newline at end of file
+    return user
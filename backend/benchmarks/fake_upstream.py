@@ -0,0 +1,317 @@
+# backend/benchmarks/fake_upstream.py
+"""
+Local stand-in for Ollama, MiniMax and the Auth0 key endpoint, for load tests.
+
+Emulates the calls the backend makes:
+  GET  /api/tags, /api/ps
+  POST /api/generate          (stream and non-stream, Ollama timing fields)
+  POST /api/create            (structured body only, progress events), DELETE /api/delete
+  HEAD/POST /api/blobs/{digest}
+  POST /api/embed             (hashed bag-of-words vectors: paraphrases score close)
+  POST /v1/text/chatcompletion, /v1/chat/completions   (MiniMax / OpenAI style)
+  GET  /.well-known/jwks.json  + POST /bench/token      (RS256 test tokens)
+
+Latency is modelled like a real model server: time to first token is
+log-normal around --ttft-ms, tokens then arrive at --tokens-per-second, and
+only --parallel requests are decoded at once (the rest queue, like
+OLLAMA_NUM_PARALLEL). The RNG is seeded so runs are reproducible.
+
+    python -m benchmarks.fake_upstream --port 11434 --ttft-ms 120 --tokens-per-second 40
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import math
+import random
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+BENCH_ISSUER_DOMAIN = "bench.invalid"
+BENCH_AUDIENCE = "bench"
+BENCH_KID = "bench-key"
+
+_WORDS = (
+    "the model answers with a short and plausible sentence about data tables charts "
+    "queries training adapters images and users so the frontend has text to render"
+).split()
+
+
+@dataclass
+class UpstreamConfig:
+    ttft_ms: float = 120.0          # median time to first token
+    ttft_sigma: float = 0.35        # log-normal spread of the above
+    tokens_per_second: float = 40.0
+    response_tokens: int = 48       # mean completion length (capped by num_predict / max_tokens)
+    parallel: int = 4               # requests decoded at once
+    error_rate: float = 0.0         # fraction of requests answered with HTTP 500
+    seed: int = 0
+
+
+class FakeModelServer:
+    def __init__(self, config: UpstreamConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.requests = 0
+        self.aborted = 0  # streams the client closed before the last token
+        self.models = {"granite4:tiny-h", "granite3.2-vision"}  # /api/tags; created ones are added
+        self.blobs = set()  # digests pushed to /api/blobs
+        self._key = None
+
+    # --- Latency model ---
+
+    def slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.config.parallel)
+        return self._slots
+
+    def ttft(self) -> float:
+        c = self.config
+        return c.ttft_ms / 1000 * math.exp(self.rng.gauss(0, c.ttft_sigma))
+
+    def completion_tokens(self, limit: Optional[int]) -> int:
+        n = max(1, int(self.rng.gauss(self.config.response_tokens, self.config.response_tokens * 0.2)))
+        return min(n, limit) if limit else n
+
+    def maybe_fail(self) -> None:
+        self.requests += 1
+        if self.config.error_rate and self.rng.random() < self.config.error_rate:
+            raise HTTPException(status_code=500, detail="injected upstream failure")
+
+    async def tokens(self, count: int, prompt_delay: float) -> AsyncIterator[str]:
+        """Yield `count` words at the configured rate while holding a decode slot."""
+        async with self.slots():
+            sent = 0
+            try:
+                await asyncio.sleep(prompt_delay)
+                interval = 1.0 / self.config.tokens_per_second
+                for i in range(count):
+                    if i:
+                        await asyncio.sleep(interval)
+                    yield self.rng.choice(_WORDS)
+                    sent += 1
+            finally:
+                if sent < count:  # client went away: stop decoding, free the slot
+                    self.aborted += 1
+
+    # --- Test tokens (RS256, verified by the backend through AUTH0_JWKS_URL) ---
+
+    def key(self):
+        if self._key is None:
+            from cryptography.hazmat.primitives.asymmetric import rsa
+
+            self._key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        return self._key
+
+    def jwks(self) -> Dict[str, Any]:
+        numbers = self.key().public_key().public_numbers()
+
+        def b64(n: int) -> str:
+            raw = n.to_bytes((n.bit_length() + 7) // 8, "big")
+            return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+        return {"keys": [{"kty": "RSA", "use": "sig", "alg": "RS256", "kid": BENCH_KID,
+                          "n": b64(numbers.n), "e": b64(numbers.e)}]}
+
+    def token(self, sub: str, ttl: int = 3600) -> str:
+        import jwt
+
+        now = int(time.time())
+        claims = {"sub": sub, "name": sub, "iss": f"https://{BENCH_ISSUER_DOMAIN}/",
+                  "aud": BENCH_AUDIENCE, "iat": now, "exp": now + ttl}
+        return jwt.encode(claims, self.key(), algorithm="RS256", headers={"kid": BENCH_KID})
+
+
+def _prompt_tokens(text: str) -> int:
+    return max(1, len(text.split()))
+
+
+EMBED_DIM = 256
+
+
+def _embedding(text: str) -> List[float]:
+    """Unit vector of hashed word counts; texts sharing most words are similar."""
+    vec = [0.0] * EMBED_DIM
+    for word in text.lower().split():
+        h = int.from_bytes(hashlib.blake2b(word.strip(".,!?").encode("utf-8"), digest_size=4).digest(), "little")
+        vec[h % EMBED_DIM] += 1.0 if h & 1 << 31 else -1.0
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+def create_app(config: UpstreamConfig) -> FastAPI:
+    server = FakeModelServer(config)
+    app = FastAPI(title="Fake model upstream")
+    app.state.server = server
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [{"name": name, "size": 1} for name in sorted(server.models)]}
+
+    @app.get("/api/ps")
+    async def ps():
+        return {"models": [{"name": "granite4:tiny-h", "size_vram": 0}]}
+
+    @app.get("/bench/stats")
+    async def stats():
+        return {"requests": server.requests, "aborted": server.aborted, "config": asdict(server.config)}
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        server.maybe_fail()
+        model = body.get("model", "granite4:tiny-h")
+        if model not in server.models and f"{model}:latest" not in server.models:
+            return JSONResponse({"error": f"model '{model}' not found"}, status_code=404)
+        limit = (body.get("options") or {}).get("num_predict")
+        count = server.completion_tokens(limit)
+        prompt_count = _prompt_tokens(body.get("prompt", ""))
+        delay = server.ttft()
+        started = time.perf_counter()
+
+        def final(words: List[str], first_at: float) -> Dict[str, Any]:
+            total = time.perf_counter() - started
+            return {
+                "model": model, "done": True, "done_reason": "stop",
+                "total_duration": int(total * 1e9),
+                "prompt_eval_count": prompt_count, "prompt_eval_duration": int(delay * 1e9),
+                "eval_count": len(words), "eval_duration": int(max(total - first_at, 1e-6) * 1e9),
+            }
+
+        if body.get("stream", True):
+            async def stream():
+                words: List[str] = []
+                first_at = 0.0
+                async for word in server.tokens(count, delay):
+                    if not words:
+                        first_at = time.perf_counter() - started
+                    words.append(word)
+                    yield json.dumps({"model": model, "response": word + " ", "done": False}) + "\n"
+                yield json.dumps({**final(words, first_at), "response": ""}) + "\n"
+
+            return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+        words = []
+        first_at = 0.0
+        async for word in server.tokens(count, delay):
+            if not words:
+                first_at = time.perf_counter() - started
+            words.append(word)
+        return {**final(words, first_at), "response": " ".join(words)}
+
+    @app.head("/api/blobs/{digest}")
+    async def blob_exists(digest: str):
+        return Response(status_code=200 if digest in server.blobs else 404)
+
+    @app.post("/api/blobs/{digest}")
+    async def push_blob(digest: str, request: Request):
+        sha = hashlib.sha256()
+        async for chunk in request.stream():
+            sha.update(chunk)
+        if f"sha256:{sha.hexdigest()}" != digest:
+            return JSONResponse({"error": "digest mismatch"}, status_code=400)
+        server.blobs.add(digest)
+        return Response(status_code=201)
+
+    @app.post("/api/create")
+    async def create(request: Request):
+        body = json.loads(await request.body())
+        server.maybe_fail()
+        name = body.get("model") or body.get("name")
+        # Like Ollama >= 0.5.5: Modelfile text is no longer parsed server-side
+        if not body.get("from") and not body.get("files"):
+            return JSONResponse({"error": "neither 'from' or 'files' was specified"}, status_code=400)
+        missing = [d for d in (body.get("adapters") or {}).values() if d not in server.blobs]
+        if missing:
+            return JSONResponse({"error": f"blob {missing[0]} not found"}, status_code=400)
+
+        async def progress():
+            for status in ("reading model metadata", "creating system layer", "writing manifest"):
+                await asyncio.sleep(0.05)
+                yield json.dumps({"status": status}) + "\n"
+            server.models.add(name if ":" in name else f"{name}:latest")
+            yield json.dumps({"status": "success"}) + "\n"
+
+        return StreamingResponse(progress(), media_type="application/x-ndjson")
+
+    @app.delete("/api/delete")
+    async def delete(request: Request):
+        body = await request.json()
+        name = body.get("model") or body.get("name")
+        if name not in server.models:
+            return JSONResponse({"error": f"model '{name}' not found"}, status_code=404)
+        server.models.discard(name)
+        return {}
+
+    @app.post("/api/embed")
+    async def embed(request: Request):
+        body = await request.json()
+        server.maybe_fail()
+        texts = body.get("input", "")
+        texts = [texts] if isinstance(texts, str) else texts
+        await asyncio.sleep(0.002 * len(texts))
+        return {"model": body.get("model", "nomic-embed-text"), "embeddings": [_embedding(t) for t in texts]}
+
+    @app.post("/v1/text/chatcompletion")
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        server.maybe_fail()
+        prompt = " ".join(m.get("content", "") for m in body.get("messages", []))
+        count = server.completion_tokens(body.get("max_tokens"))
+        delay = server.ttft()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = body.get("model", "minimax-m2")
+
+        if body.get("stream"):
+            async def stream():
+                async for word in server.tokens(count, delay):
+                    chunk = {"id": completion_id, "model": model,
+                             "choices": [{"index": 0, "delta": {"content": word + " "}}]}
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(stream(), media_type="text/event-stream")
+
+        words = [word async for word in server.tokens(count, delay)]
+        return {
+            "id": completion_id, "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": " ".join(words)}}],
+            "usage": {"prompt_tokens": _prompt_tokens(prompt), "completion_tokens": len(words)},
+        }
+
+    @app.get("/.well-known/jwks.json")
+    async def jwks():
+        return server.jwks()
+
+    @app.post("/bench/token")
+    async def token(sub: str = "bench-user"):
+        return {"access_token": server.token(sub), "token_type": "Bearer"}
+
+    return app
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import uvicorn
+
+    defaults = UpstreamConfig()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    for field, value in asdict(defaults).items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args(argv)
+    config = UpstreamConfig(**{field: getattr(args, field) for field in asdict(defaults)})
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
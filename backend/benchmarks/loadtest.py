@@ -0,0 +1,410 @@
+# backend/benchmarks/loadtest.py
+"""
+Load driver for the API, with baseline comparison.
+
+Runs each scenario at each concurrency level (closed loop: N workers send
+requests back to back) and reports throughput, p50/p95/p99 latency and
+time to first byte ("ttft": the first body chunk; for streamed routes the
+first token). Results can be saved as a baseline and later runs compared
+against it; the exit code is 1 when a scenario regressed.
+
+With --spawn it starts the whole stack locally: the fake model upstream
+(benchmarks.fake_upstream) and the API under uvicorn, pointed at the fake
+with a throwaway database. Against a running deployment use --base-url and
+--token (protected scenarios are skipped without one).
+
+    cd backend
+    python -m benchmarks.loadtest --spawn --concurrency 1,8,32 --requests 200
+    python -m benchmarks.loadtest --spawn --save-baseline   # after a known-good run
+    python -m benchmarks.loadtest --spawn --baseline benchmarks/baseline.json
+
+Needs httpx (requirements-dev.txt).
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(BACKEND_DIR, "benchmarks", "baseline.json")
+
+# Fast fake model by default so a full run takes minutes; use e.g.
+# "--ttft-ms 300 --tokens-per-second 30" for production-like latencies
+DEFAULT_UPSTREAM_ARGS = "--ttft-ms 40 --tokens-per-second 400"
+
+# A regression is a relative change beyond --tolerance that is also larger
+# than this absolute slack (so 2ms -> 3ms on a fast route isn't flagged)
+LATENCY_SLACK_SECONDS = 0.010
+
+RequestSpec = Tuple[str, str, Dict[str, Any]]  # method, path, httpx kwargs
+
+
+# --- Scenarios ---
+
+@dataclass
+class Scenario:
+    name: str
+    build: Callable[[int], RequestSpec]
+    needs_auth: bool = False
+    setup: Optional[Callable[[httpx.AsyncClient], Awaitable[None]]] = None
+
+
+def _prompt(i: int) -> str:
+    return f"Summarise quarterly revenue for region {i % 17} in two sentences."
+
+
+def _chat_conversation(i: int) -> Dict[str, Any]:
+    turns = 2 + i % 6
+    return {
+        "id": f"bench-{i % 50}",
+        "title": f"Benchmark chat {i % 50}",
+        "messages": [
+            {"sender": "user" if t % 2 == 0 else "model", "text": _prompt(i + t)} for t in range(turns)
+        ],
+    }
+
+
+def _workbook() -> bytes:
+    import pandas as pd
+
+    df = pd.DataFrame({
+        "month": [f"2024-{m:02d}" for m in range(1, 13)] * 20,
+        "revenue": [1000 + 37 * i for i in range(240)],
+        "units": [i % 50 for i in range(240)],
+    })
+    buffer = io.BytesIO()
+    df.to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+_workbook_bytes: Optional[bytes] = None
+
+
+def _upload_spec() -> RequestSpec:
+    global _workbook_bytes
+    if _workbook_bytes is None:
+        _workbook_bytes = _workbook()
+    return "POST", "/api/analysis/upload-excel", {"files": {"file": ("bench.xlsx", _workbook_bytes, _XLSX)}}
+
+
+async def _upload_workbook(client: httpx.AsyncClient) -> None:
+    method, path, kwargs = _upload_spec()
+    (await client.request(method, path, **kwargs)).raise_for_status()
+
+
+def _analysis(i: int) -> RequestSpec:
+    if i % 10 == 0:
+        return _upload_spec()
+    return "POST", "/api/analysis/generate-chart", {"data": {"x_axis_col": "month", "y_axis_col": "revenue"}}
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    s.name: s
+    for s in (
+        Scenario("prompt_anon", lambda i: ("POST", "/api/models/prompt",
+                                           {"json": {"prompt_text": _prompt(i), "max_tokens": 64}})),
+        Scenario("prompt_auth", lambda i: ("POST", "/api/models/prompt",
+                                           {"json": {"prompt_text": _prompt(i), "max_tokens": 64}}),
+                 needs_auth=True),
+        Scenario("chatbot", lambda i: ("POST", "/api/chatbot/message",
+                                       {"json": {"message": _prompt(i), "max_tokens": 64}}),
+                 needs_auth=True),
+        Scenario("chat_history", lambda i: ("POST", "/api/chat-history/", {"json": _chat_conversation(i)})
+                 if i % 4 else ("GET", "/api/chat-history/", {}),
+                 needs_auth=True),
+        Scenario("analysis", _analysis, setup=_upload_workbook),
+    )
+}
+
+
+# --- Measurement ---
+
+@dataclass
+class LevelResult:
+    latencies: List[float] = field(default_factory=list)
+    ttfts: List[float] = field(default_factory=list)
+    errors: int = 0
+    wall: float = 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        total = len(self.latencies) + self.errors
+        return {
+            "requests": total,
+            "errors": self.errors,
+            "error_rate": round(self.errors / total, 4) if total else 0.0,
+            "throughput_rps": round(len(self.latencies) / self.wall, 2) if self.wall else 0.0,
+            "p50": percentile(self.latencies, 50),
+            "p95": percentile(self.latencies, 95),
+            "p99": percentile(self.latencies, 99),
+            "ttft_p50": percentile(self.ttfts, 50),
+            "ttft_p95": percentile(self.ttfts, 95),
+        }
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile, rounded to 0.1 ms."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return round(ordered[rank], 4)
+
+
+async def _timed_request(client: httpx.AsyncClient, spec: RequestSpec) -> Tuple[bool, float, Optional[float]]:
+    method, path, kwargs = spec
+    started = time.perf_counter()
+    ttft = None
+    try:
+        async with client.stream(method, path, **kwargs) as response:
+            async for chunk in response.aiter_raw():
+                if ttft is None and chunk:
+                    ttft = time.perf_counter() - started
+            ok = response.is_success
+    except httpx.HTTPError:
+        ok = False
+    return ok, time.perf_counter() - started, ttft
+
+
+async def run_level(client: httpx.AsyncClient, scenario: Scenario, concurrency: int,
+                    requests: int, warmup: int) -> LevelResult:
+    for i in range(warmup):
+        await _timed_request(client, scenario.build(i))
+
+    result = LevelResult()
+    counter = iter(range(requests))
+
+    async def worker():
+        for i in counter:
+            ok, latency, ttft = await _timed_request(client, scenario.build(warmup + i))
+            if ok:
+                result.latencies.append(latency)
+                if ttft is not None:
+                    result.ttfts.append(ttft)
+            else:
+                result.errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result.wall = time.perf_counter() - started
+    return result
+
+
+async def run_suite(base_url: str, token: Optional[str], scenarios: List[str], levels: List[int],
+                    requests: int, warmup: int, timeout: float) -> Dict[str, Dict[str, Any]]:
+    results: Dict[str, Dict[str, Any]] = {}
+    limits = httpx.Limits(max_connections=max(levels) * 2, max_keepalive_connections=max(levels))
+    for name in scenarios:
+        scenario = SCENARIOS[name]
+        headers = {}
+        if scenario.needs_auth:
+            if not token:
+                print(f"  skip {name}: needs --token")
+                continue
+            headers["Authorization"] = f"Bearer {token}"
+        async with httpx.AsyncClient(base_url=base_url, headers=headers, timeout=timeout, limits=limits) as client:
+            if scenario.setup:
+                await scenario.setup(client)
+            for level in levels:
+                summary = (await run_level(client, scenario, level, requests, warmup)).summary()
+                results[f"{name}@{level}"] = summary
+                print(_format_row(f"{name}@{level}", summary))
+    return results
+
+
+def _ms(value: Optional[float]) -> str:
+    return f"{value * 1000:8.1f}" if value is not None else "       -"
+
+
+def _format_row(key: str, s: Dict[str, Any]) -> str:
+    return (f"  {key:<20} {s['throughput_rps']:8.1f} rps  p50 {_ms(s['p50'])}  p95 {_ms(s['p95'])}  "
+            f"p99 {_ms(s['p99'])}  ttft p50 {_ms(s['ttft_p50'])} ms  errors {s['errors']}")
+
+
+# --- Baseline comparison ---
+
+def compare(current: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            tolerance: float) -> List[str]:
+    """Human-readable regressions of current vs baseline (empty list: none)."""
+    problems = []
+    for key, base in baseline.items():
+        now = current.get(key)
+        if now is None:
+            continue
+        for metric in ("p50", "p95", "p99", "ttft_p50"):
+            old, new = base.get(metric), now.get(metric)
+            if old is None or new is None:
+                continue
+            if new > old * (1 + tolerance) and new - old > LATENCY_SLACK_SECONDS:
+                problems.append(f"{key}: {metric} {old * 1000:.1f} -> {new * 1000:.1f} ms")
+        if base["throughput_rps"] and now["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            problems.append(f"{key}: throughput {base['throughput_rps']} -> {now['throughput_rps']} rps")
+        if now["error_rate"] > base["error_rate"] + 0.01:
+            problems.append(f"{key}: error rate {base['error_rate']} -> {now['error_rate']}")
+    return problems
+
+
+# --- Local stack ---
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(url: str, proc: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{proc.args} exited with {proc.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+
+@contextmanager
+def local_stack(upstream_args: List[str], workers: int) -> Iterator[Tuple[str, str]]:
+    """Start fake upstream + API; yields (api base url, bearer token)."""
+    from benchmarks.fake_upstream import BENCH_AUDIENCE, BENCH_ISSUER_DOMAIN
+
+    upstream_port, api_port = _free_port(), _free_port()
+    upstream_url = f"http://127.0.0.1:{upstream_port}"
+    api_url = f"http://127.0.0.1:{api_port}"
+    procs: List[subprocess.Popen] = []
+    with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+        env = {
+            **os.environ,
+            "OLLAMA_HOST": upstream_url,
+            "OLLAMA_HOSTS": upstream_url,
+            "MINIMAX_API_KEY": "bench",
+            "MINIMAX_ENDPOINT": f"{upstream_url}/v1/text/chatcompletion",
+            "AUTH0_DOMAIN": BENCH_ISSUER_DOMAIN,
+            "AUTH0_AUDIENCE": BENCH_AUDIENCE,
+            "AUTH0_JWKS_URL": f"{upstream_url}/.well-known/jwks.json",
+            "DATABASE_URL": f"sqlite:///{tmp}/app.db",
+            "PROFILE_DIR": f"{tmp}/profiles",
+            "OCR_CACHE_DIR": f"{tmp}/ocr_cache",
+            "PARSE_CACHE_DIR": f"{tmp}/parse_cache",
+            "SEMANTIC_CACHE_DIR": f"{tmp}/semantic_cache",
+            # Off unless asked for: the scenarios repeat prompts, which would
+            # measure the cache instead of the model path
+            "SEMANTIC_CACHE": os.getenv("SEMANTIC_CACHE", "0"),
+        }
+        env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+        try:
+            procs.append(subprocess.Popen(
+                [sys.executable, "-m", "benchmarks.fake_upstream", "--port", str(upstream_port), *upstream_args],
+                cwd=BACKEND_DIR, env=env,
+            ))
+            _wait_for(f"{upstream_url}/api/tags", procs[-1])
+            procs.append(subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(api_port),
+                 "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+                cwd=BACKEND_DIR, env=env,
+            ))
+            _wait_for(f"{api_url}/api/health", procs[-1])
+            token = httpx.post(f"{upstream_url}/bench/token", params={"sub": "bench-user"}).json()["access_token"]
+            yield api_url, token
+        finally:
+            for proc in reversed(procs):
+                proc.terminate()
+                try:
+                    proc.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+
+
+# --- CLI ---
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--spawn", action="store_true", help="start fake upstream + API locally")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--token", default=os.getenv("BENCH_TOKEN"), help="bearer token for protected routes")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--requests", type=int, default=100, help="measured requests per scenario and level")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--workers", type=int, default=1, help="API worker processes with --spawn")
+    parser.add_argument("--upstream-args", default=DEFAULT_UPSTREAM_ARGS,
+                        help="fake_upstream args with --spawn (latency model of the fake model server)")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", help="compare against this results file")
+    parser.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE, help="store results as baseline")
+    parser.add_argument("--tolerance", type=float, default=0.20, help="allowed relative regression")
+    args = parser.parse_args(argv)
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)} (known: {', '.join(SCENARIOS)})")
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    def run(base_url: str, token: Optional[str]) -> Dict[str, Dict[str, Any]]:
+        print(f"Load test against {base_url}: {args.requests} requests per level, concurrency {levels}")
+        return asyncio.run(run_suite(base_url, token, scenarios, levels, args.requests, args.warmup, args.timeout))
+
+    if args.spawn:
+        with local_stack(args.upstream_args.split(), args.workers) as (base_url, token):
+            results = run(base_url, token)
+    else:
+        results = run(args.base_url, args.token)
+
+    report = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "spawned": args.spawn,
+            "upstream_args": args.upstream_args,
+            "workers": args.workers,
+            "requests": args.requests,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        for key in ("spawned", "upstream_args", "workers", "requests", "cpus"):
+            if baseline["meta"].get(key) != report["meta"][key]:
+                print(f"warning: baseline was recorded with {key}={baseline['meta'].get(key)!r}, "
+                      f"this run used {report['meta'][key]!r}")
+        problems = compare(results, baseline["results"], args.tolerance)
+        if problems:
+            print(f"REGRESSIONS vs {args.baseline} (tolerance {args.tolerance:.0%}):")
+            for problem in problems:
+                print(f"  {problem}")
+            return 1
+        print(f"No regressions vs {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
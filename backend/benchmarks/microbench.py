@@ -0,0 +1,449 @@
+# backend/benchmarks/microbench.py
+"""
+Microbenchmarks for the CPU-heavy internals of the analysis and training paths.
+
+Each (case, size) runs in a fresh spawned process so memory numbers are not
+polluted by earlier cases. Inside it the input is generated first (not
+timed); then the case is timed over --repeats runs. Memory is measured two ways:
+  - peak_rss_mb: resident-set high-water above the level before the run
+    (sampled from /proc every few ms; ru_maxrss elsewhere)
+  - traced_peak_mb: peak Python + NumPy allocations (tracemalloc) of one
+    extra, untimed run
+
+Results are JSON lines (one per case and size, tagged with git revision and
+library versions) so hot paths can be tracked across releases; --baseline
+compares against an earlier results file and exits 1 on regressions.
+
+    cd backend
+    python -m benchmarks.microbench                           # 10k and 100k rows
+    python -m benchmarks.microbench --sizes 10k,100k,1m,10m --output bench.jsonl
+    python -m benchmarks.microbench --cases csv_parse,chart_bar --baseline bench.jsonl
+
+Sizes are rows (SQL pairs / QA pairs for the training cases). Cases cap the
+sizes that don't make sense for them (xlsx holds at most 1,048,576 rows, a
+bar chart with a million bars is not a use case); capped runs are reported
+as skipped.
+"""
+import argparse
+import asyncio
+import gc
+import io
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SUITE_VERSION = 1
+DEFAULT_SIZES = "10k,100k"
+# Wide sheets: this many columns, rows = size // WIDE_ROW_DIVISOR
+WIDE_COLUMNS = 200
+WIDE_ROW_DIVISOR = 20
+# Regressions must also exceed this absolute slack (timer noise on tiny cases)
+TIME_SLACK_SECONDS = 0.005
+MEMORY_SLACK_MB = 5.0
+
+
+# --- Synthetic data ---
+
+def parse_size(text: str) -> int:
+    text = text.strip().lower().replace("_", "")
+    factor = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * factor)
+
+
+def synthetic_frame(rows: int, cols: int = 6, nan_fraction: float = 0.05, seed: int = 0):
+    """
+    DataFrame shaped like typical uploads: cycling int / float (with NaN) /
+    category / date / free-text columns.
+    """
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    data = {}
+    categories = np.array(["north", "south", "east", "west", "central"])
+    for c in range(cols):
+        kind = c % 5
+        if kind == 0:
+            data[f"id_{c}"] = np.arange(rows, dtype=np.int64)
+        elif kind == 1:
+            values = rng.normal(1000, 250, rows)
+            values[rng.random(rows) < nan_fraction] = np.nan
+            data[f"amount_{c}"] = values
+        elif kind == 2:
+            data[f"region_{c}"] = categories[rng.integers(0, len(categories), rows)]
+        elif kind == 3:
+            data[f"date_{c}"] = pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 1500, rows), unit="D")
+        else:
+            data[f"note_{c}"] = np.char.add("note ", rng.integers(0, 50_000, rows).astype(str))
+    return pd.DataFrame(data)
+
+
+def synthetic_schema(tables: int = 6, columns: int = 8) -> Dict[str, Any]:
+    schema = {}
+    for t in range(tables):
+        cols = {"id": "int", "name": "text", "amount": "float", "created_at": "date"}
+        for c in range(columns - len(cols)):
+            cols[f"attr_{c}"] = "int" if c % 2 else "text"
+        if t:
+            cols[f"table_{t - 1}_id"] = "int"
+        schema[f"table_{t}"] = cols
+    return schema
+
+
+def synthetic_qa_pairs(n: int, seed: int = 0) -> List[Dict[str, str]]:
+    import random
+
+    rng = random.Random(seed)
+    words = "revenue region quarter customer order product total average growth margin".split()
+    return [
+        {"question": f"What is the {rng.choice(words)} for {rng.choice(words)} {i}?",
+         "answer": " ".join(rng.choice(words) for _ in range(12 + i % 20))}
+        for i in range(n)
+    ]
+
+
+# --- Cases ---
+
+@dataclass
+class Case:
+    name: str
+    setup: Callable[[int], Callable[[], Any]]  # size -> zero-arg function to time
+    max_size: Optional[int] = None
+    description: str = ""
+
+
+def _csv_bytes(df) -> bytes:
+    return df.to_csv(index=False).encode("utf-8")
+
+
+def _xlsx_bytes(df) -> bytes:
+    buffer = io.BytesIO()
+    df.to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def setup_csv_parse(rows: int, cols: int = 6):
+    import pandas as pd
+
+    data = _csv_bytes(synthetic_frame(rows, cols))
+    return lambda: pd.read_csv(io.BytesIO(data))
+
+
+def setup_excel_parse(rows: int, cols: int = 6):
+    from app.services import analysis_service
+
+    data = _xlsx_bytes(synthetic_frame(rows, cols))
+    return lambda: analysis_service.read_excel_to_dataframe(io.BytesIO(data))
+
+
+def setup_clean_floats(rows: int):
+    from app.api.analysis import clean_non_json_floats
+
+    df = synthetic_frame(rows)
+
+    def run():
+        return clean_non_json_floats(df.to_dict(orient="records"))
+
+    return run
+
+
+def _chart(rows: int, chart_type: str):
+    from app.services import analysis_service
+
+    df = synthetic_frame(rows)
+    x, y = ("region_2", "amount_1") if chart_type == "bar" else ("id_0", "amount_1")
+    return lambda: analysis_service.create_chart_from_dataframe(df, x, y, chart_type=chart_type)
+
+
+def _chart_spec(rows: int, chart_type: str):
+    from app.services import analysis_service
+
+    df = synthetic_frame(rows)
+    x, y = ("region_2", "amount_1") if chart_type == "bar" else ("id_0", "amount_1")
+    return lambda: json.dumps(analysis_service.build_chart_spec(df, x, y, chart_type=chart_type))
+
+
+def setup_sql_pairs(n: int):
+    from app.services import training_service
+
+    schema = synthetic_schema()
+    return lambda: training_service.generate_sql_training_data(schema, n, seed=0)
+
+
+def setup_modelfile(n: int):
+    from app.services import modelfile_builder, ollama_service
+
+    pairs = synthetic_qa_pairs(n)
+
+    def run():
+        messages = modelfile_builder.iter_messages(
+            "granite4:tiny-h", "You are a helpful assistant.", pairs, token_budget=0
+        )
+        fields = {"model": "bench", "from": "granite4:tiny-h", "stream": True}
+        return sum(len(chunk) for chunk in ollama_service._iter_create_body(fields, messages))
+
+    return run
+
+
+def setup_upload_validation(rows: int):
+    from starlette.datastructures import Headers, UploadFile
+    from app.core.file_validation import ALLOWED_EXCEL_TYPES, MAX_FILE_SIZE_BYTES, validate_upload_file
+
+    # ~64 bytes per row of an average upload, kept under the size limit
+    payload = os.urandom(min(rows * 64, MAX_FILE_SIZE_BYTES - 1))
+    content_type = next(iter(ALLOWED_EXCEL_TYPES))
+
+    def run():
+        upload = UploadFile(
+            file=io.BytesIO(payload), filename="upload.xlsx",
+            headers=Headers({"content-type": content_type}),
+        )
+        return asyncio.run(validate_upload_file(upload, allowed_types=ALLOWED_EXCEL_TYPES))
+
+    return run
+
+
+CASES: Dict[str, Case] = {
+    c.name: c
+    for c in (
+        Case("csv_parse", setup_csv_parse, description="pd.read_csv of a mixed-type CSV"),
+        Case("csv_parse_wide", lambda n: setup_csv_parse(max(n // WIDE_ROW_DIVISOR, 10), WIDE_COLUMNS),
+             description=f"{WIDE_COLUMNS} columns, size/{WIDE_ROW_DIVISOR} rows"),
+        Case("excel_parse", setup_excel_parse, max_size=1_000_000,
+             description="read_excel_to_dataframe of an .xlsx"),
+        Case("excel_parse_wide", lambda n: setup_excel_parse(max(n // WIDE_ROW_DIVISOR, 10), WIDE_COLUMNS),
+             max_size=1_000_000, description=f"{WIDE_COLUMNS} columns, size/{WIDE_ROW_DIVISOR} rows"),
+        Case("clean_floats", setup_clean_floats, description="to_dict(records) + clean_non_json_floats"),
+        Case("chart_bar", lambda n: _chart(n, "bar"), max_size=100_000,
+             description="create_chart_from_dataframe, bar (as /generate-chart)"),
+        Case("chart_line", lambda n: _chart(n, "line"), max_size=10_000_000,
+             description="create_chart_from_dataframe, line"),
+        Case("chart_spec_bar", lambda n: _chart_spec(n, "bar"), max_size=10_000_000,
+             description="build_chart_spec + json, bar (as /generate-chart format=vega)"),
+        Case("chart_spec_line", lambda n: _chart_spec(n, "line"), max_size=10_000_000,
+             description="build_chart_spec + json, line"),
+        Case("chart_spec_scatter", lambda n: _chart_spec(n, "scatter"), max_size=10_000_000,
+             description="build_chart_spec + json, scatter"),
+        Case("sql_pairs", setup_sql_pairs, max_size=1_000_000,
+             description="generate_sql_training_data, size = pairs"),
+        Case("modelfile_build", setup_modelfile, max_size=1_000_000,
+             description="iter_messages + /api/create body, size = QA pairs, no token budget"),
+        Case("upload_validation", setup_upload_validation, description="validate_upload_file, 64 bytes per row"),
+    )
+}
+
+
+# --- Measurement (child process) ---
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class _RssSampler(threading.Thread):
+    """Highest RSS seen while running (Linux); falls back to ru_maxrss."""
+
+    def __init__(self, interval: float = 0.002):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.start_rss = _rss_bytes()
+        self.peak = self.start_rss or 0
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.is_set():
+            self.peak = max(self.peak, _rss_bytes() or 0)
+            self._done.wait(self.interval)
+
+    def stop(self) -> Optional[float]:
+        self._done.set()
+        self.join()
+        if self.start_rss is None:
+            import resource
+
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+        self.peak = max(self.peak, _rss_bytes() or 0)
+        return (self.peak - self.start_rss) / (1024 * 1024)
+
+
+def _run_case(name: str, size: int, repeats: int, queue) -> None:
+    sys.path.insert(0, BACKEND_DIR)
+    import logging
+
+    logging.disable(logging.INFO)
+    try:
+        fn = CASES[name].setup(size)
+        gc.collect()
+
+        sampler = _RssSampler()
+        sampler.start()
+        times = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - started)
+            gc.collect()
+        peak_rss_mb = sampler.stop()
+
+        tracemalloc.start()
+        fn()
+        _current, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        times.sort()
+        queue.put({
+            "status": "ok",
+            "wall_min_s": round(times[0], 6),
+            "wall_median_s": round(times[len(times) // 2], 6),
+            "wall_max_s": round(times[-1], 6),
+            "peak_rss_mb": round(peak_rss_mb, 2) if peak_rss_mb is not None else None,
+            "traced_peak_mb": round(traced_peak / (1024 * 1024), 2),
+        })
+    except Exception as e:
+        queue.put({"status": "error", "error": f"{type(e).__name__}: {e}"})
+
+
+def run_case(name: str, size: int, repeats: int, timeout: float) -> Dict[str, Any]:
+    case = CASES[name]
+    if case.max_size is not None and size > case.max_size:
+        return {"status": "skipped", "error": f"size capped at {case.max_size}"}
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_run_case, args=(name, size, repeats, queue))
+    proc.start()
+    try:
+        return queue.get(timeout=timeout)
+    except Exception:
+        return {"status": "error", "error": f"timed out after {timeout}s" if proc.is_alive()
+                else f"child exited with {proc.exitcode}"}
+    finally:
+        proc.join(timeout=5)
+        if proc.is_alive():
+            proc.kill()
+
+
+# --- Reporting ---
+
+def _environment() -> Dict[str, Any]:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                             capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        rev = None
+    versions = {}
+    for module in ("numpy", "pandas", "matplotlib", "openpyxl"):
+        try:
+            versions[module] = __import__(module).__version__
+        except ImportError:
+            versions[module] = None
+    return {
+        "suite_version": SUITE_VERSION,
+        "git_rev": rev,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        **versions,
+    }
+
+
+def _latest(records: List[Dict[str, Any]]) -> Dict[tuple, Dict[str, Any]]:
+    latest = {}
+    for record in records:
+        if record.get("status") == "ok":
+            latest[(record["case"], record["size"])] = record
+    return latest
+
+
+def compare(current: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    problems = []
+    base = _latest(baseline)
+    for key, now in _latest(current).items():
+        old = base.get(key)
+        if old is None:
+            continue
+        label = f"{key[0]}@{key[1]}"
+        if (now["wall_median_s"] > old["wall_median_s"] * (1 + tolerance)
+                and now["wall_median_s"] - old["wall_median_s"] > TIME_SLACK_SECONDS):
+            problems.append(f"{label}: median {old['wall_median_s']:.4f}s -> {now['wall_median_s']:.4f}s")
+        if (now["traced_peak_mb"] > old["traced_peak_mb"] * (1 + tolerance)
+                and now["traced_peak_mb"] - old["traced_peak_mb"] > MEMORY_SLACK_MB):
+            problems.append(f"{label}: traced peak {old['traced_peak_mb']} -> {now['traced_peak_mb']} MB")
+    return problems
+
+
+def _format_row(record: Dict[str, Any]) -> str:
+    label = f"{record['case']}@{record['size']}"
+    if record["status"] != "ok":
+        return f"  {label:<28} {record['status']}: {record.get('error', '')}"
+    rss = record["peak_rss_mb"]
+    return (f"  {label:<28} median {record['wall_median_s'] * 1000:10.1f} ms  min {record['wall_min_s'] * 1000:10.1f} ms"
+            f"  rss +{rss if rss is not None else '-':>8} MB  traced {record['traced_peak_mb']:>8} MB")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", default=",".join(CASES), help=f"any of: {', '.join(CASES)}")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="rows, e.g. 10k,100k,1m,10m")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=1800.0, help="seconds per case and size")
+    parser.add_argument("--output", help="append JSON lines to this file")
+    parser.add_argument("--baseline", help="JSON lines from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--list", action="store_true", help="list cases and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for case in CASES.values():
+            cap = f" (max {case.max_size:,})" if case.max_size else ""
+            print(f"  {case.name:<20} {case.description}{cap}")
+        return 0
+
+    names = [n.strip() for n in args.cases.split(",") if n.strip()]
+    unknown = [n for n in names if n not in CASES]
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(unknown)}")
+    sizes = [parse_size(s) for s in args.sizes.split(",") if s.strip()]
+
+    env = _environment()
+    run_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+    records = []
+    print(f"Microbenchmarks at {env['git_rev']}: {len(names)} cases x sizes {sizes}, {args.repeats} repeats")
+    for name in names:
+        for size in sizes:
+            result = run_case(name, size, args.repeats, args.timeout)
+            record = {"case": name, "size": size, "repeats": args.repeats, "run_at": run_at, **env, **result}
+            records.append(record)
+            print(_format_row(record), flush=True)
+            if args.output:
+                with open(args.output, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = [json.loads(line) for line in f if line.strip()]
+        # Don't compare a run against itself when --output and --baseline are the same file
+        baseline = [r for r in baseline if r.get("run_at") != run_at]
+        problems = compare(records, baseline, args.tolerance)
+        if problems:
+            print(f"REGRESSIONS vs {args.baseline} (tolerance {args.tolerance:.0%}):")
+            for problem in problems:
+                print(f"  {problem}")
+            return 1
+        print(f"No regressions vs {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
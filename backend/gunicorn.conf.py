@@ -0,0 +1,20 @@
+# backend/gunicorn.conf.py
+# Loaded automatically by gunicorn from the working directory.
+import os
+import shutil
+
+_multiproc_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+
+def on_starting(server):
+    # Metric files from a previous run would be summed into the new one
+    if _multiproc_dir:
+        shutil.rmtree(_multiproc_dir, ignore_errors=True)
+        os.makedirs(_multiproc_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if _multiproc_dir:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
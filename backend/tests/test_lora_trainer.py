@@ -0,0 +1,48 @@
+# backend/tests/test_lora_trainer.py
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from app.services.lora_config import LoraTrainingConfig  # noqa: E402
+from app.services.lora_trainer import checkpoint_param_count, lr_multiplier, resolve_base_model  # noqa: E402
+
+
+def multipliers(warmup: int, total: int):
+    return [round(lr_multiplier(s, warmup, total), 4) for s in range(total)]
+
+
+def test_warmup_then_linear_decay():
+    assert multipliers(4, 8) == [0.25, 0.5, 0.75, 1.0, 1.0, 0.75, 0.5, 0.25]
+
+
+def test_run_no_longer_than_warmup_skips_it():
+    # Previously peaked at 3x the configured rate for total == warmup == 10
+    assert multipliers(10, 10) == [1.0, 0.9, 0.8, 0.7, 0.6, 0.5, 0.4, 0.3, 0.2, 0.1]
+    assert multipliers(10, 3) == [1.0, 0.6667, 0.3333]
+
+
+def test_never_above_configured_rate():
+    for warmup in range(0, 15):
+        for total in range(1, 30):
+            assert all(0 < m <= 1.0 for m in multipliers(warmup, total)), (warmup, total)
+
+
+def test_unknown_config_keys_are_rejected():
+    with pytest.raises(ValueError):
+        LoraTrainingConfig(learning_rte=1e-3)
+
+
+def test_base_models_are_limited_to_the_map():
+    assert resolve_base_model("smollm2:135m") == "HuggingFaceTB/SmolLM2-135M-Instruct"
+    assert resolve_base_model("HuggingFaceTB/SmolLM2-135M-Instruct") == "HuggingFaceTB/SmolLM2-135M-Instruct"
+    for other in ("meta-llama/Llama-3.1-70B", "/", "."):
+        with pytest.raises(ValueError):
+            resolve_base_model(other)
+
+
+def test_checkpoint_size_is_read_from_safetensors_headers(tmp_path):
+    from safetensors.torch import save_file
+
+    save_file({"a": torch.zeros(3, 4), "b": torch.zeros(5)}, str(tmp_path / "model.safetensors"))
+    save_file({"c": torch.zeros(2, 2, 2)}, str(tmp_path / "model-2.safetensors"))
+    assert checkpoint_param_count(str(tmp_path)) == 12 + 5 + 8
@@ -0,0 +1,78 @@
+# backend/tests/test_sql_eval.py
+import sqlite3
+
+import pytest
+
+from app.services import sql_data_generator, sql_eval
+
+
+@pytest.fixture
+def conn():
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE t (id INTEGER, name TEXT, amount REAL)")
+    db.executemany("INSERT INTO t VALUES (?, ?, ?)", [(1, "a", 1.5), (2, "b", 2.25), (3, "a", 0.1 + 0.2)])
+    db.execute("PRAGMA query_only = ON")
+    yield db
+    db.close()
+
+
+def test_extract_sql_from_fenced_reply():
+    reply = "Here you go:\n```sql\nSELECT *\nFROM t;\n```\nAnything else?"
+    assert sql_eval.extract_sql(reply) == "SELECT *\nFROM t;"
+
+
+def test_extract_sql_stops_at_first_statement():
+    assert sql_eval.extract_sql("The query is SELECT id FROM t; then SELECT 2;") == "SELECT id FROM t;"
+    assert sql_eval.extract_sql("with x as (select 1) select * from x") == "with x as (select 1) select * from x"
+    assert sql_eval.extract_sql("I don't know.") == ""
+
+
+def test_run_query_returns_rounded_rows(conn):
+    rows, error = sql_eval.run_query(conn, "SELECT amount FROM t WHERE id = 3")
+    assert error is None and rows == [(0.3,)]
+
+
+def test_run_query_reports_errors(conn):
+    assert sql_eval.run_query(conn, "SELECT nope FROM t")[0] is None
+    assert sql_eval.run_query(conn, "SELECT 1; SELECT 2;")[0] is None
+    rows, error = sql_eval.run_query(conn, "DELETE FROM t")
+    assert rows is None and "readonly" in error
+
+
+def test_run_query_aborts_runaway_queries(conn):
+    query = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT count(*) FROM n"
+    assert sql_eval.run_query(conn, query) == (None, "query took too long")
+
+
+def test_results_match_ordering():
+    assert sql_eval.results_match([(1,), (2,)], [(2,), (1,)], ordered=False)
+    assert not sql_eval.results_match([(1,), (2,)], [(2,), (1,)], ordered=True)
+    assert not sql_eval.results_match([(1,), (1,)], [(1,)], ordered=False)  # multisets, not sets
+
+
+def test_is_held_out_is_deterministic_and_proportional():
+    pairs = [{"question": f"question {i}", "answer": "SELECT 1;"} for i in range(5000)]
+    held = [p for p in pairs if sql_data_generator.is_held_out(p, 0.2)]
+    assert held == [p for p in pairs if sql_data_generator.is_held_out(dict(p), 0.2)]
+    assert 0.17 < len(held) / len(pairs) < 0.23
+    assert not any(sql_data_generator.is_held_out(p, 0.0) for p in pairs)
+    assert all(sql_data_generator.is_held_out(p, 1.0) for p in pairs)
+
+
+def test_held_out_pairs_never_overlap_training_data():
+    schema = {"employees": ["id", "name", "salary"], "departments": ["id", "department_name"]}
+    fraction = sql_data_generator.DEFAULT_HOLDOUT_FRACTION
+    held = sql_eval.held_out_pairs(schema, 300, 0, fraction, 1000)
+    trained = [p for p in sql_data_generator.iter_sql_training_data(schema, 300, seed=0)
+               if not sql_data_generator.is_held_out(p, fraction)]
+    assert held and not {p["question"] for p in held} & {p["question"] for p in trained}
+
+
+def test_model_sql_cannot_attach_or_change_pragmas(tmp_path):
+    schema = {"employees": ["id", "name", "salary"]}
+    conn = sql_eval.build_database(schema, [], seed=0)
+    target = tmp_path / "other.db"
+    rows, error = sql_eval.run_query(conn, f"ATTACH DATABASE '{target}' AS other")
+    assert rows is None and error and not target.exists()
+    assert sql_eval.run_query(conn, "PRAGMA query_only = OFF")[0] is None
+    assert sql_eval.run_query(conn, "SELECT count(*) FROM employees")[1] is None
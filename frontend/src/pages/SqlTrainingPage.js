@@ -1,6 +1,9 @@
 // frontend/src/pages/SqlTrainingPage.js
-import React, { useState, useEffect } from 'react';
-import { generateSqlData, getModels, trainSqlModel } from '../services/api';
+import React, { useState, useEffect, useRef } from 'react';
+import { generateSqlData, getModels, getTrainingJob, trainSqlModel } from '../services/api';
+
+const JOB_POLL_MS = 2000;
+const FINISHED_JOB_STATES = ['succeeded', 'failed', 'cancelled'];
 
 const placeholderSchema = `{
   "employees": ["employee_id", "first_name", "last_name", "department_id", "salary"],
@@ -18,7 +21,11 @@ function SqlTrainingPage() {
   const [newModelName, setNewModelName] = useState('');
   const [isTraining, setIsTraining] = useState(false);
   const [trainingStatus, setTrainingStatus] = useState({ message: '', type: '' });
-  
+  const pollTimer = useRef(null);
+
+  // Stop polling when leaving the page
+  useEffect(() => () => clearTimeout(pollTimer.current), []);
+
   useEffect(() => {
     getModels()
       .then(res => {
@@ -64,14 +71,43 @@ function SqlTrainingPage() {
     setIsTraining(true);
     setTrainingStatus({ message: '', type: '' });
 
+    clearTimeout(pollTimer.current);
+
     trainSqlModel(selectedBaseModel, newModelName, qaPairs)
       .then(res => {
-        setTrainingStatus({ message: `Successfully simulated training. SQL Adapter file: '${res.data.adapter_filename}'`, type: 'success' });
+        setTrainingStatus({ message: `${res.data.message} (job ${res.data.job_id})`, type: 'success' });
+        pollJob(res.data.job_id);
       })
       .catch(err => {
         setTrainingStatus({ message: `Error: ${err.response?.data?.detail || 'Failed to start training.'}`, type: 'error' });
+        setIsTraining(false);
+      });
+  };
+
+  // Follow the queued job until it finishes
+  const pollJob = (jobId) => {
+    getTrainingJob(jobId)
+      .then(res => {
+        const job = res.data;
+        if (!FINISHED_JOB_STATES.includes(job.status)) {
+          const percent = Math.round(job.progress * 100);
+          setTrainingStatus({ message: `${job.status} (${percent}%) ${job.message}`, type: 'success' });
+          pollTimer.current = setTimeout(() => pollJob(jobId), JOB_POLL_MS);
+          return;
+        }
+        if (job.status === 'succeeded') {
+          const result = job.result || {};
+          const created = result.adapter_filename
+            ? `SQL adapter file: '${result.adapter_filename}'`
+            : `model '${result.model_name}'`;
+          setTrainingStatus({ message: `Training finished. Created ${created}`, type: 'success' });
+        } else {
+          setTrainingStatus({ message: `Training ${job.status}: ${job.error || job.message}`, type: 'error' });
+        }
+        setIsTraining(false);
       })
-      .finally(() => {
+      .catch(err => {
+        setTrainingStatus({ message: `Error: ${err.response?.data?.detail || 'Lost track of the training job.'}`, type: 'error' });
         setIsTraining(false);
       });
   };
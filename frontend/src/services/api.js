@@ -182,6 +182,11 @@ export const trainSqlModel = (baseModel, customModelName, qaData) => {
   );
 };
 
+// Background jobs (training / model builds) queued by the endpoints above
+export const getTrainingJob = (jobId) => {
+  return apiClient.get(`/training/jobs/${jobId}`);
+};
+
 // -------------------- 📊 EXCEL ANALYSIS --------------------
 export const uploadExcel = (formData) => {
   return apiClient.post("/analysis/upload-excel", formData, {
@@ -198,3 +203,15 @@ export const generateChart = (x_axis_col, y_axis_col) => {
     responseType: "blob",
   });
 };
+
+// Vega-Lite spec with the data already aggregated/downsampled, for rendering in the browser
+export const generateChartSpec = (x_axis_col, y_axis_col, chart_type = "bar", aggregate = "sum") => {
+  const formData = new FormData();
+  formData.append("x_axis_col", x_axis_col);
+  formData.append("y_axis_col", y_axis_col);
+  formData.append("chart_type", chart_type);
+  formData.append("aggregate", aggregate);
+  formData.append("format", "vega");
+
+  return apiClient.post("/analysis/generate-chart", formData);
+};
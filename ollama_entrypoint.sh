@@ -17,6 +17,7 @@ done
 
 echo "Pulling models..."
 ollama pull granite4:tiny-h || true
+ollama pull nomic-embed-text || true
 ollama pull qwen2.5vl:7b || true
 ollama pull llava:latest || true
 #ollama pull dolphin-llama3:8b || true